@@ -0,0 +1,206 @@
+"""Администрирование пользователей: поиск по индексу и массовые операции.
+
+Список в админке не загружает таблицу ``users`` целиком: поиск по
+префиксу логина — диапазон уникального индекса по ``username``
+(``username >= 'ab' AND username < 'ab\\U0010ffff'``), фильтры по роли и
+статусу опираются на индексы из ``SCHEMA``, а страницы листаются по ключу
+(``username > последний``), без OFFSET.
+
+Массовые блокировка, заморозка, разблокировка и смена роли выполняются
+одной транзакцией: выбор затронутых строк, UPDATE через executemany и
+запись журнала действий одной пачкой в ``action_logs``. Кэш сессионных
+пользователей ``user_cache`` сбрасывается один раз на операцию.
+Администраторов массовые операции не трогают.
+"""
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+from app import metrics
+from app.models import AdminUserRow, columns, fetch_all
+
+ROLES = ("user", "ip")
+STATUSES = ("active", "blocked", "frozen")
+ACTIONS = ("block", "unblock", "freeze", "role")
+DURATION_UNITS = {"hours": 1, "days": 24, "weeks": 24 * 7}
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+ID_BATCH = 500
+
+SCHEMA = [
+    "CREATE INDEX IF NOT EXISTS idx_users_role_username ON users(role, username)",
+    "CREATE INDEX IF NOT EXISTS idx_users_blocked_username ON users(username) WHERE is_blocked = 1",
+]
+
+# Тип записи в action_logs и описание для каждой операции
+AUDIT = {
+    "block": ("user_block", "Заблокирован пользователь {username}"),
+    "unblock": ("user_unblock", "Разблокирован пользователь {username}"),
+    "freeze": ("user_freeze", "Пользователь {username} заморожен до {until}"),
+    "role": ("user_role_change", "Роль пользователя {username} изменена на {role}"),
+}
+
+
+async def init_schema(db):
+    for statement in SCHEMA:
+        await db.execute(statement)
+
+
+@dataclass(slots=True)
+class UserFilter:
+    prefix: str = ""
+    role: Optional[str] = None
+    status: Optional[str] = None
+
+    def validate(self):
+        if self.role and self.role not in ROLES + ("admin",):
+            raise ValueError(f"Неизвестная роль: {self.role}")
+        if self.status and self.status not in STATUSES:
+            raise ValueError(f"Неизвестный статус: {self.status}")
+
+    def where(self, now: str):
+        """(условия, параметры) для WHERE; все условия покрываются индексами."""
+        clauses, params = [], []
+        if self.prefix:
+            clauses.append("username >= ? AND username < ?")
+            params += [self.prefix, self.prefix + "\U0010ffff"]
+        if self.role:
+            clauses.append("role = ?")
+            params.append(self.role)
+        if self.status == "blocked":
+            clauses.append("is_blocked = 1")
+        elif self.status == "frozen":
+            clauses.append("is_blocked = 0 AND frozen_until IS NOT NULL AND frozen_until > ?")
+            params.append(now)
+        elif self.status == "active":
+            clauses.append("is_blocked = 0 AND (frozen_until IS NULL OR frozen_until <= ?)")
+            params.append(now)
+        return clauses, params
+
+
+async def search(db, flt: UserFilter, after: Optional[str] = None, limit: int = PAGE_SIZE) -> list:
+    """Страница пользователей по логину; следующая — с after = последний логин."""
+    clauses, params = flt.where(datetime.now().isoformat())
+    if after:
+        clauses.append("username > ?")
+        params.append(after)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    return await fetch_all(
+        db, AdminUserRow,
+        f"SELECT {columns(AdminUserRow)} FROM users {where} ORDER BY username LIMIT {limit}",
+        params
+    )
+
+
+def freeze_until(duration: int, unit: str) -> datetime:
+    if unit not in DURATION_UNITS:
+        raise ValueError(f"Неизвестная единица времени: {unit}")
+    if duration < 1:
+        raise ValueError("Продолжительность должна быть положительной")
+    return datetime.now() + timedelta(hours=duration * DURATION_UNITS[unit])
+
+
+async def _targets(db, user_ids: Optional[list], flt: Optional[UserFilter]) -> list:
+    if user_ids is not None:
+        targets = []
+        for start in range(0, len(user_ids), ID_BATCH):
+            batch = user_ids[start:start + ID_BATCH]
+            cursor = await db.execute(
+                f"SELECT id, username FROM users WHERE role != 'admin' "
+                f"AND id IN ({','.join('?' * len(batch))})", batch
+            )
+            targets.extend(await cursor.fetchall())
+        return targets
+    clauses, params = flt.where(datetime.now().isoformat())
+    clauses.append("role != 'admin'")
+    cursor = await db.execute(f"SELECT id, username FROM users WHERE {' AND '.join(clauses)}", params)
+    return await cursor.fetchall()
+
+
+async def bulk_update(db, action: str, admin_id: int, ip_address: Optional[str], *,
+                      user_ids: Optional[list] = None, flt: Optional[UserFilter] = None,
+                      role: Optional[str] = None, until: Optional[datetime] = None) -> int:
+    """Применяет операцию к пользователям по списку id или по фильтру; число затронутых."""
+    if action not in ACTIONS:
+        raise ValueError(f"Неизвестная операция: {action}")
+    if action == "role" and role not in ROLES:
+        raise ValueError("Роль должна быть user или ip")
+    if action == "freeze" and until is None:
+        raise ValueError("Для заморозки нужен срок")
+    if (user_ids is None) == (flt is None):
+        raise ValueError("Нужен либо список id, либо фильтр")
+
+    until_text = until.isoformat() if until else None
+    if action == "block":
+        statement = "UPDATE users SET is_blocked = 1, block_count = COALESCE(block_count, 0) + 1 WHERE id = ?"
+        values = ()
+    elif action == "freeze":
+        statement = "UPDATE users SET frozen_until = ?, block_count = COALESCE(block_count, 0) + 1 WHERE id = ?"
+        values = (until_text,)
+    elif action == "unblock":
+        statement = "UPDATE users SET is_blocked = 0, frozen_until = NULL WHERE id = ?"
+        values = ()
+    else:
+        statement = "UPDATE users SET role = ? WHERE id = ?"
+        values = (role,)
+    action_type, template = AUDIT[action]
+    until_label = until.strftime("%d.%m.%Y %H:%M") if until else None
+
+    # IMMEDIATE: выбор строк и изменения видят одну и ту же версию таблицы
+    await db.execute("BEGIN IMMEDIATE")
+    try:
+        targets = await _targets(db, user_ids, flt)
+        await db.executemany(statement, [values + (user_id,) for user_id, _ in targets])
+        now = datetime.now().isoformat()
+        await db.executemany(
+            "INSERT INTO action_logs (user_id, action_type, description, ip_address, created_at) VALUES (?, ?, ?, ?, ?)",
+            [(admin_id, action_type, template.format(username=username, until=until_label, role=role),
+              ip_address, now) for _, username in targets]
+        )
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        raise
+    if targets:
+        user_cache.clear()
+    return len(targets)
+
+
+class UserCache:
+    """LRU сессионных пользователей по id с коротким TTL.
+
+    В своем процессе изменения сбрасывают кэш сразу, другие воркеры
+    увидят их не позже чем через ttl секунд.
+    """
+
+    def __init__(self, max_entries: int = 10_000, ttl: float = 5.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    def get(self, user_id: int):
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(user_id)
+            metrics.cache_hit("user")
+            return entry[1]
+        metrics.cache_miss("user")
+        return None
+
+    def put(self, user):
+        self._entries[user.id] = (time.monotonic() + self.ttl, user)
+        self._entries.move_to_end(user.id)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        self._entries.pop(user_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+user_cache = UserCache()
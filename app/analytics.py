@@ -0,0 +1,133 @@
+"""Чтение для тяжелых административных страниц: отдельные соединения только на чтение.
+
+Списки всех QR-кодов, поиск пользователей и очередь жалоб читают ту же
+``qr_data.db``, что обслуживает сканирования и входы. Чтобы долгий
+запрос не мешал им, такие страницы берут сессию ``Reader.session()``:
+
+- соединение открывается по URI ``file:...?mode=ro`` с ``PRAGMA
+  query_only``, так что писать через него нельзя даже по ошибке;
+- запросы сессии идут в одной читающей транзакции (``BEGIN``): страница
+  видит один снимок базы, а не смесь состояний между запросами;
+- у сессии бюджет времени ``timeout``: обработчик прогресса SQLite
+  прерывает запрос, вышедший за срок, и сессия завершается
+  ``QueryTimeout``. Читатель WAL держит снимок, пока открыта
+  транзакция, и контрольная точка не может перенести кадры новее его;
+  бюджет ограничивает это время сверху;
+- одновременно открыто не больше ``concurrency`` сессий; остальные ждут
+  слот до ``wait`` секунд, затем получают ``AnalyticsBusy``;
+- если журнал WAL вырос больше ``wal_limit``, а начать его заново не
+  дают читатели, новые сессии не открываются (``AnalyticsBusy``) до
+  следующей удачной контрольной точки: отчеты, идущие друг за другом,
+  иначе не оставили бы ``scheduler.checkpoint_wal`` момента без читателей.
+  Контрольную точку выполняет ``Reader.checkpoint`` — задача планировщика
+  в каждом воркере.
+
+Соединение закрывается в конце каждой сессии: незакрытый курсор на
+долгоживущем соединении держал бы старый снимок WAL бесконечно.
+"""
+import asyncio
+import logging
+import sqlite3
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import aiosqlite
+
+from app import metrics, scheduler
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 5.0
+DEFAULT_CONCURRENCY = 2
+DEFAULT_WAIT = 2.0
+# Проверка срока раз в столько инструкций VM SQLite (доли миллисекунды)
+PROGRESS_STEPS = 10_000
+
+SESSIONS = metrics.REGISTRY.register(metrics.Counter(
+    "idqr_analytics_sessions_total", "Сессии чтения аналитики по результату", ("result",)))
+SESSION_SECONDS = metrics.REGISTRY.register(metrics.Histogram(
+    "idqr_analytics_session_seconds", "Длительность сессий чтения аналитики"))
+
+
+class AnalyticsUnavailable(Exception):
+    """Запрос аналитики не выполнен; текст — для показа администратору."""
+
+
+class QueryTimeout(AnalyticsUnavailable):
+    pass
+
+
+class AnalyticsBusy(AnalyticsUnavailable):
+    pass
+
+
+def read_only_uri(db_path: str) -> str:
+    return f"{Path(db_path).resolve().as_uri()}?mode=ro"
+
+
+class Reader:
+    def __init__(self, db_path: str, timeout: float = DEFAULT_TIMEOUT,
+                 concurrency: int = DEFAULT_CONCURRENCY, wait: float = DEFAULT_WAIT,
+                 wal_limit: int = scheduler.WAL_SIZE_LIMIT):
+        self.db_path = db_path
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.wait = wait
+        self.wal_limit = wal_limit
+        self.paused = False
+        self.in_use = 0
+        self.slots = asyncio.Semaphore(concurrency)
+
+    @classmethod
+    def from_env(cls, db_path: str, environ) -> "Reader":
+        """ANALYTICS_TIMEOUT (с), ANALYTICS_CONCURRENCY, ANALYTICS_WAIT (с)."""
+        return cls(
+            db_path,
+            timeout=float(environ.get("ANALYTICS_TIMEOUT", DEFAULT_TIMEOUT)),
+            concurrency=int(environ.get("ANALYTICS_CONCURRENCY", DEFAULT_CONCURRENCY)),
+            wait=float(environ.get("ANALYTICS_WAIT", DEFAULT_WAIT)),
+        )
+
+    async def checkpoint(self, db):
+        """Задача планировщика: контрольная точка WAL и пауза новых сессий, пока ее держат читатели."""
+        paused = not await scheduler.checkpoint_wal(db, self.wal_limit)
+        if paused and not self.paused:
+            logger.warning("WAL больше порога и занят читателями: новые сессии аналитики приостановлены")
+        self.paused = paused
+
+    @asynccontextmanager
+    async def session(self):
+        """Соединение только на чтение с одним снимком базы на всю сессию."""
+        if self.paused:
+            SESSIONS.inc("paused")
+            raise AnalyticsBusy("База переносит накопленные изменения, повторите через несколько секунд")
+        try:
+            await asyncio.wait_for(self.slots.acquire(), self.wait)
+        except asyncio.TimeoutError:
+            SESSIONS.inc("busy")
+            raise AnalyticsBusy("Сервер занят другими отчетами, повторите через несколько секунд")
+        self.in_use += 1
+        started = time.monotonic()
+        deadline = started + self.timeout
+        result = "error"
+        try:
+            async with aiosqlite.connect(read_only_uri(self.db_path), uri=True) as db:
+                await db.execute("PRAGMA query_only = ON")
+                await db.set_progress_handler(lambda: time.monotonic() > deadline, PROGRESS_STEPS)
+                await db.execute("BEGIN")
+                try:
+                    yield db
+                except sqlite3.OperationalError as e:
+                    if str(e) != "interrupted" or time.monotonic() <= deadline:
+                        raise
+                    result = "timeout"
+                    raise QueryTimeout(
+                        f"Запрос выполнялся дольше {self.timeout:g} с и был прерван, сузьте фильтр"
+                    ) from e
+                result = "ok"
+        finally:
+            self.in_use -= 1
+            self.slots.release()
+            SESSIONS.inc(result)
+            SESSION_SECONDS.observe(time.monotonic() - started)
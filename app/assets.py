@@ -0,0 +1,233 @@
+"""Статические ассеты: минификация, отпечатки содержимого и предсжатие.
+
+Стили и скрипты страниц лежат в ``static/css`` и ``static/js`` (общие —
+``css/base.css`` и ``js/particles.js``, остальные — в ``pages/`` по
+имени шаблона). При старте ``build`` минифицирует каждый файл и пишет
+в ``static/dist`` копию с хэшем содержимого в имени
+(``css/pages/users.3f9c0a1b2e.css``), а рядом — ``.gz`` и, если
+установлен пакет ``brotli``, ``.br``. Файлы с тем же хэшем не
+пересобираются, так что повторный старт только читает исходники.
+
+Шаблоны получают URL через ``asset_url('css/pages/users.css')``.
+``AssetFiles`` отдает ``/static/dist`` с ``Cache-Control: immutable``:
+имя меняется вместе с содержимым, и браузер не перезапрашивает файл
+до изменения. Сжатый вариант выбирается по ``Accept-Encoding``.
+
+Сборка вручную (например, при сборке образа):
+
+    python -m app.assets [--static static]
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import secrets
+import stat
+import time
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles
+
+try:
+    import brotli
+except ImportError:                  # необязательная зависимость: без нее только gzip
+    brotli = None
+
+
+SOURCE_DIRS = ("css", "js")
+DIST_DIR = "dist"
+MANIFEST = "manifest.json"
+URL_PREFIX = "/static/"
+HASH_LENGTH = 10
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+STALE_GRACE = 24 * 3600              # старые версии нужны воркерам, которые еще не перезапущены
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Порядок предпочтения при выборе сжатого варианта
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+_manifest = {}
+
+
+# --- Минификация ---
+_STRING = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'')
+_CSS_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+_CSS_SPACE = re.compile(r"\s+")
+_CSS_PUNCT = re.compile(r"\s*([{};,>])\s*")
+
+
+def minify_css(text: str) -> str:
+    """Комментарии, пробелы вокруг {};,> и после двоеточия; строки не трогаются."""
+    text = _CSS_COMMENT.sub("", text)
+    parts, last = [], 0
+    for match in _STRING.finditer(text):
+        parts.append(_minify_css_code(text[last:match.start()]))
+        parts.append(match.group())
+        last = match.end()
+    parts.append(_minify_css_code(text[last:]))
+    return "".join(parts).strip()
+
+
+def _minify_css_code(code: str) -> str:
+    code = _CSS_SPACE.sub(" ", code)
+    code = _CSS_PUNCT.sub(r"\1", code)
+    return code.replace(": ", ":").replace(";}", "}")
+
+
+def minify_js(text: str) -> str:
+    """Отступы, пустые строки и строки-комментарии.
+
+    Переводы строк остаются (на них опирается автоподстановка ``;``),
+    строки внутри многострочных шаблонных литералов не меняются.
+    """
+    lines, in_template = [], False
+    for line in text.splitlines():
+        if in_template:
+            lines.append(line)
+        else:
+            stripped = line.strip()
+            if stripped and not stripped.startswith("//"):
+                lines.append(stripped)
+        if line.count("`") - line.count("\\`") & 1:
+            in_template = not in_template
+    return "\n".join(lines) + "\n"
+
+
+MINIFIERS = {".css": minify_css, ".js": minify_js}
+
+
+# --- Сборка ---
+def fingerprint(name: str, content: bytes) -> str:
+    base, ext = os.path.splitext(name)
+    return f"{base}.{hashlib.sha256(content).hexdigest()[:HASH_LENGTH]}{ext}"
+
+
+def _write(path: str, data: bytes):
+    """Атомарно: воркеры, стартующие одновременно, не видят недописанный файл."""
+    tmp_path = f"{path}.{secrets.token_hex(4)}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _variants(content: bytes) -> dict:
+    variants = {"": lambda: content,
+                ".gz": lambda: gzip.compress(content, compresslevel=GZIP_LEVEL, mtime=0)}
+    if brotli is not None:
+        variants[".br"] = lambda: brotli.compress(content, quality=BROTLI_QUALITY)
+    return variants
+
+
+def build(static_dir: str = "static") -> dict:
+    """Собирает ассеты в static/dist; возвращает манифест {исходник: файл в dist}.
+
+    Синхронная: вызывать через asyncio.to_thread.
+    """
+    dist_dir = os.path.join(static_dir, DIST_DIR)
+    manifest = {}
+    for source_dir in SOURCE_DIRS:
+        for dirpath, _, files in os.walk(os.path.join(static_dir, source_dir)):
+            for file in sorted(files):
+                minify = MINIFIERS.get(os.path.splitext(file)[1])
+                if minify is None:
+                    continue
+                source = os.path.join(dirpath, file)
+                name = os.path.relpath(source, static_dir).replace(os.sep, "/")
+                with open(source, encoding="utf-8") as f:
+                    content = minify(f.read()).encode("utf-8")
+                target = fingerprint(name, content)
+                path = os.path.join(dist_dir, *target.split("/"))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                for suffix, compress in _variants(content).items():
+                    if not os.path.exists(path + suffix):
+                        _write(path + suffix, compress())
+                manifest[name] = target
+    _write(os.path.join(dist_dir, MANIFEST),
+           json.dumps(manifest, ensure_ascii=False, indent=2, sort_keys=True).encode("utf-8"))
+    prune(dist_dir, manifest)
+    return manifest
+
+
+def prune(dist_dir: str, manifest: dict, grace: float = STALE_GRACE):
+    """Удаляет прежние версии старше grace."""
+    keep = {MANIFEST}
+    for target in manifest.values():
+        keep.update(target + suffix for suffix in ("", ".gz", ".br"))
+    cutoff = time.time() - grace
+    for dirpath, _, files in os.walk(dist_dir):
+        for file in files:
+            path = os.path.join(dirpath, file)
+            if os.path.relpath(path, dist_dir).replace(os.sep, "/") in keep:
+                continue
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+def activate(manifest: dict):
+    global _manifest
+    _manifest = manifest
+
+
+def url(name: str) -> str:
+    """URL ассета для шаблонов; до сборки — исходный файл без отпечатка."""
+    target = _manifest.get(name)
+    if target is None:
+        return URL_PREFIX + name
+    return f"{URL_PREFIX}{DIST_DIR}/{target}"
+
+
+# --- Раздача ---
+def accepted_encodings(header: str) -> set:
+    encodings = set()
+    for item in header.split(","):
+        token, _, params = item.strip().partition(";")
+        if token and params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            encodings.add(token.strip().lower())
+    return encodings
+
+
+class AssetFiles(StaticFiles):
+    """static/dist: предсжатые варианты по Accept-Encoding и вечный кэш."""
+
+    async def get_response(self, path: str, scope) -> Response:
+        response = None
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        if scope["method"] in ("GET", "HEAD"):
+            for encoding, suffix in ENCODINGS:
+                if encoding not in accepted:
+                    continue
+                full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path + suffix)
+                if stat_result and stat.S_ISREG(stat_result.st_mode):
+                    response = FileResponse(
+                        full_path, stat_result=stat_result,
+                        media_type=mimetypes.guess_type(path)[0] or "application/octet-stream",
+                        headers={"Content-Encoding": encoding},
+                    )
+                    break
+        if response is None:
+            response = await super().get_response(path, scope)
+        if response.status_code in (200, 304):
+            response.headers["Cache-Control"] = IMMUTABLE
+            response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сборка статических ассетов")
+    parser.add_argument("--static", default="static")
+    args = parser.parse_args()
+    manifest = build(args.static)
+    print(f"Собрано ассетов: {len(manifest)} в {os.path.join(args.static, DIST_DIR)}"
+          f"{'' if brotli else ' (без brotli: пакет не установлен)'}")
+
+
+if __name__ == "__main__":
+    main()
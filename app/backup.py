@@ -0,0 +1,263 @@
+"""Онлайн-резервные копии и восстановление qr_data.db.
+
+Копировать файл базы, пока работает сервер, нельзя: можно получить
+разорванную страницу или потерять содержимое WAL. Копия снимается
+онлайн-API SQLite (``sqlite3.Connection.backup``). В режиме WAL копия
+идет одним шагом: это одна читающая транзакция, писателей она не
+блокирует, а шаги под постоянной записью только перезапускались бы
+(см. benchmarks/bench_backup.py). В режиме журнала отката копия идет
+шагами по ``PAGES_PER_STEP`` страниц с паузой между ними, так что
+блокировка источника держится только на время одного шага; если другое
+соединение изменило базу посреди копирования, SQLite начинает копию
+заново, и после ``MAX_RESTARTS`` перезапусков она снимается одним шагом.
+
+Готовая копия проверяется ``PRAGMA integrity_check`` и потоково
+сжимается gzip в ``qr_data-<время>.db.gz`` рядом с другими копиями
+(файл появляется атомарно через переименование). Восстановление
+распаковывает архив, проверяет его и тем же API записывает в базу.
+
+Из командной строки (из корня репозитория):
+
+    python -m app.backup snapshot [--db qr_data.db] [--dir backups]
+    python -m app.backup verify backups/qr_data-20250101-000000.db.gz
+    python -m app.backup restore backups/qr_data-20250101-000000.db.gz [--db qr_data.db]
+"""
+import argparse
+import gzip
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Optional
+
+PAGES_PER_STEP = 1024
+STEP_SLEEP = 0.005
+MAX_RESTARTS = 3
+COPY_CHUNK = 1024 * 1024
+COMPRESS_LEVEL = 1                   # страницы SQLite почти не сжимаются сильнее на уровне 6
+ARCHIVE_PREFIX = "qr_data-"
+ARCHIVE_SUFFIX = ".db.gz"
+
+
+class BackupError(RuntimeError):
+    """Копия не снята или не прошла проверку."""
+
+
+@dataclass(slots=True)
+class BackupResult:
+    path: str
+    created_at: str
+    db_bytes: int
+    archive_bytes: int
+    pages: int
+    restarts: int
+    duration_ms: float
+    integrity: str
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+class _Restarted(Exception):
+    pass
+
+
+def copy_database(src_path: str, dest_path: str, pages: Optional[int] = None,
+                  sleep: float = STEP_SLEEP, max_restarts: int = MAX_RESTARTS):
+    """Копирует базу онлайн-API; возвращает (число страниц, число перезапусков).
+
+    pages=None — одним шагом для WAL, иначе по PAGES_PER_STEP; -1 — всегда одним шагом.
+    """
+    restarts = 0
+    last_remaining = None
+    total = 0
+
+    def progress(status, remaining, page_count):
+        nonlocal restarts, last_remaining, total
+        total = page_count
+        # remaining вырос — источник изменился, SQLite начал копию заново
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > max_restarts:
+                raise _Restarted()
+        last_remaining = remaining
+
+    src = sqlite3.connect(src_path)
+    try:
+        if pages is None:
+            wal = src.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+            pages = -1 if wal else PAGES_PER_STEP
+        dest = sqlite3.connect(dest_path)
+        try:
+            try:
+                src.backup(dest, pages=pages, progress=progress, sleep=sleep)
+            except _Restarted:
+                src.backup(dest, pages=-1)
+            if not total:
+                total = dest.execute("PRAGMA page_count").fetchone()[0]
+        finally:
+            dest.close()
+    finally:
+        src.close()
+    return total, restarts
+
+
+def integrity_check(path: str) -> str:
+    db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = db.execute("PRAGMA integrity_check").fetchall()
+    finally:
+        db.close()
+    return "; ".join(row[0] for row in rows)
+
+
+def _compress(src_path: str, dest_path: str):
+    tmp_path = dest_path + ".part"
+    try:
+        with open(src_path, "rb") as src, open(tmp_path, "wb") as raw:
+            with gzip.GzipFile(filename=os.path.basename(dest_path)[:-3], mode="wb",
+                               fileobj=raw, compresslevel=COMPRESS_LEVEL) as out:
+                shutil.copyfileobj(src, out, COPY_CHUNK)
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp_path, dest_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _decompress(src_path: str, dest_path: str):
+    with gzip.open(src_path, "rb") as src, open(dest_path, "wb") as out:
+        shutil.copyfileobj(src, out, COPY_CHUNK)
+
+
+def snapshot(db_path: str, folder: str, pages: Optional[int] = None,
+             sleep: float = STEP_SLEEP) -> BackupResult:
+    """Снимает, проверяет и сжимает копию. Синхронная: вызывать через asyncio.to_thread."""
+    os.makedirs(folder, exist_ok=True)
+    created_at = datetime.now()
+    stem = os.path.join(folder, f"{ARCHIVE_PREFIX}{created_at:%Y%m%d-%H%M%S}")
+    path, n = stem + ARCHIVE_SUFFIX, 1
+    while os.path.exists(path):
+        path, n = f"{stem}-{n}{ARCHIVE_SUFFIX}", n + 1
+    started = time.perf_counter()
+    fd, copy_path = tempfile.mkstemp(suffix=".db", dir=folder)
+    os.close(fd)
+    try:
+        page_count, restarts = copy_database(db_path, copy_path, pages, sleep)
+        # Копия наследует WAL источника; архиву нужен самодостаточный файл без -wal/-shm
+        copy = sqlite3.connect(copy_path)
+        copy.execute("PRAGMA journal_mode=DELETE")
+        copy.close()
+        integrity = integrity_check(copy_path)
+        if integrity != "ok":
+            raise BackupError(f"копия не прошла integrity_check: {integrity}")
+        db_bytes = os.path.getsize(copy_path)
+        _compress(copy_path, path)
+    finally:
+        os.remove(copy_path)
+    return BackupResult(
+        path=path, created_at=created_at.isoformat(timespec="seconds"), db_bytes=db_bytes,
+        archive_bytes=os.path.getsize(path), pages=page_count, restarts=restarts,
+        duration_ms=round((time.perf_counter() - started) * 1000, 3), integrity=integrity,
+    )
+
+
+def verify(archive_path: str) -> str:
+    """integrity_check распакованного архива."""
+    with tempfile.TemporaryDirectory() as tmp:
+        copy_path = os.path.join(tmp, "verify.db")
+        _decompress(archive_path, copy_path)
+        return integrity_check(copy_path)
+
+
+def restore(archive_path: str, db_path: str):
+    """Записывает архив в базу db_path онлайн-API.
+
+    Проверка идет до записи: испорченный архив базу не трогает. Запись
+    идет одним шагом: блокировка записи базы все равно держится до конца
+    копии, а так она короче. Открытые соединения приложения увидят
+    восстановленные данные в следующей транзакции, но кэши процесса
+    (scan_cache и т.п.) — только после истечения TTL, поэтому
+    восстанавливать лучше на остановленном сервере.
+    """
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(db_path))) as tmp:
+        copy_path = os.path.join(tmp, "restore.db")
+        _decompress(archive_path, copy_path)
+        integrity = integrity_check(copy_path)
+        if integrity != "ok":
+            raise BackupError(f"архив не прошел integrity_check: {integrity}")
+        copy_database(copy_path, db_path, pages=-1)
+
+
+def list_archives(folder: str) -> list:
+    """Архивы в папке, новые первыми."""
+    if not os.path.isdir(folder):
+        return []
+    archives = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.name.startswith(ARCHIVE_PREFIX) and entry.name.endswith(ARCHIVE_SUFFIX):
+                stat = entry.stat()
+                archives.append({
+                    "name": entry.name, "bytes": stat.st_size,
+                    "modified_at": datetime.fromtimestamp(stat.st_mtime).isoformat(timespec="seconds"),
+                })
+    return sorted(archives, key=lambda a: a["name"], reverse=True)
+
+
+def archive_path(folder: str, name: str) -> Optional[str]:
+    """Путь к архиву по имени из list_archives (без выхода за пределы папки)."""
+    if os.path.basename(name) != name or not name.startswith(ARCHIVE_PREFIX) \
+            or not name.endswith(ARCHIVE_SUFFIX):
+        return None
+    path = os.path.join(folder, name)
+    return path if os.path.isfile(path) else None
+
+
+def prune(folder: str, keep: int):
+    """Оставляет keep последних архивов."""
+    for archive in list_archives(folder)[keep:]:
+        try:
+            os.remove(os.path.join(folder, archive["name"]))
+        except OSError:
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Резервные копии qr_data.db")
+    commands = parser.add_subparsers(dest="command", required=True)
+    snap = commands.add_parser("snapshot", help="снять сжатую проверенную копию")
+    snap.add_argument("--db", default=os.environ.get("DB_PATH", "qr_data.db"))
+    snap.add_argument("--dir", default=os.environ.get("BACKUP_DIR", "backups"))
+    snap.add_argument("--pages", type=int, default=None,
+                      help="страниц за шаг (-1 — одним шагом; по умолчанию по режиму журнала)")
+    snap.add_argument("--keep", type=int, default=0, help="сколько архивов оставить (0 — все)")
+    check = commands.add_parser("verify", help="проверить архив integrity_check")
+    check.add_argument("archive")
+    back = commands.add_parser("restore", help="восстановить базу из архива")
+    back.add_argument("archive")
+    back.add_argument("--db", default=os.environ.get("DB_PATH", "qr_data.db"))
+    args = parser.parse_args()
+
+    if args.command == "snapshot":
+        result = snapshot(args.db, args.dir, args.pages)
+        if args.keep:
+            prune(args.dir, args.keep)
+        print(f"{result.path}: {result.db_bytes} -> {result.archive_bytes} байт, "
+              f"{result.pages} страниц, перезапусков {result.restarts}, {result.duration_ms:.0f} мс")
+    elif args.command == "verify":
+        integrity = verify(args.archive)
+        print(integrity)
+        if integrity != "ok":
+            raise SystemExit(1)
+    else:
+        restore(args.archive, args.db)
+        print(f"{args.db} восстановлена из {args.archive}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""Очередь жалоб: индексы, счетчики по статусам и keyset-пагинация.
+
+Очередь администратора упорядочена по приоритету (high → medium → low), а
+внутри приоритета — по времени подачи (старые первыми). Каждый приоритет
+читается отдельным диапазоном индекса (status, priority, created_at), поэтому
+страница очереди не сортирует и не сканирует исторические жалобы.
+Счетчики по статусам ведут триггеры, так что статистика — это чтение
+нескольких строк, а не COUNT(*) по всей таблице.
+"""
+from dataclasses import dataclass
+from typing import Optional
+
+from app.db import ensure_column
+from app.models import columns, fetch_one, fetch_all
+
+STATUSES = ("new", "in_progress", "resolved", "rejected", "closed")
+PRIORITIES = ("high", "medium", "low")
+CATEGORIES = ("technical", "billing", "content", "energy", "other")
+CLOSED_STATUSES = ("resolved", "rejected", "closed")
+
+SCHEMA = [
+    "CREATE INDEX IF NOT EXISTS idx_complaints_queue ON complaints(status, priority, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_complaints_assignee ON complaints(assigned_to, status)",
+    "CREATE INDEX IF NOT EXISTS idx_complaints_user ON complaints(user_id, created_at)",
+    """
+    CREATE TABLE IF NOT EXISTS complaint_counters (
+        status TEXT PRIMARY KEY,
+        total INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_complaints_count_insert
+    AFTER INSERT ON complaints
+    BEGIN
+        INSERT INTO complaint_counters (status, total) VALUES (NEW.status, 1)
+        ON CONFLICT(status) DO UPDATE SET total = total + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_complaints_count_update
+    AFTER UPDATE OF status ON complaints
+    WHEN OLD.status IS NOT NEW.status
+    BEGIN
+        UPDATE complaint_counters SET total = total - 1 WHERE status = OLD.status;
+        INSERT INTO complaint_counters (status, total) VALUES (NEW.status, 1)
+        ON CONFLICT(status) DO UPDATE SET total = total + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_complaints_count_delete
+    AFTER DELETE ON complaints
+    BEGIN
+        UPDATE complaint_counters SET total = total - 1 WHERE status = OLD.status;
+    END
+    """,
+]
+
+
+@dataclass(slots=True)
+class ComplaintQueueItem:
+    """Строка очереди администратора."""
+    id: int
+    title: str
+    category: str
+    status: str
+    priority: str
+    created_at: str
+    user_id: Optional[int]
+    assigned_to: Optional[int]
+
+
+@dataclass(slots=True)
+class ComplaintStatus:
+    """Жалоба глазами автора: статус и ответ администратора."""
+    id: int
+    title: str
+    description: str
+    status: str
+    priority: str
+    created_at: str
+    updated_at: str
+    resolved_at: Optional[str]
+    response: Optional[str]
+
+
+async def init_schema(db):
+    """Индексы, таблица счетчиков и триггеры; счетчики заполняются один раз."""
+    await ensure_column(db, "complaints", "response", "TEXT")
+    for statement in SCHEMA:
+        await db.execute(statement)
+    cursor = await db.execute("SELECT 1 FROM complaint_counters LIMIT 1")
+    if await cursor.fetchone() is None:
+        await db.execute(
+            "INSERT INTO complaint_counters (status, total) "
+            "SELECT status, COUNT(*) FROM complaints GROUP BY status"
+        )
+
+
+def encode_cursor(item: ComplaintQueueItem) -> str:
+    return f"{item.priority}|{item.created_at}|{item.id}"
+
+
+def decode_cursor(cursor: Optional[str]):
+    if not cursor:
+        return None
+    try:
+        priority, created_at, complaint_id = cursor.split("|")
+        if priority not in PRIORITIES:
+            return None
+        return priority, created_at, int(complaint_id)
+    except ValueError:
+        return None
+
+
+async def fetch_queue(db, status: str = "new", priority: Optional[str] = None,
+                      after: Optional[str] = None, limit: int = 50):
+    """Страница очереди и курсор следующей страницы (или None)."""
+    position = decode_cursor(after)
+    priorities = [priority] if priority else list(PRIORITIES)
+    if position and position[0] in priorities:
+        priorities = priorities[priorities.index(position[0]):]
+
+    items = []
+    for current in priorities:
+        remaining = limit - len(items)
+        if remaining <= 0:
+            break
+        if position and position[0] == current:
+            rows = await fetch_all(
+                db, ComplaintQueueItem,
+                f"SELECT {columns(ComplaintQueueItem)} FROM complaints "
+                "WHERE status = ? AND priority = ? AND (created_at, id) > (?, ?) "
+                "ORDER BY created_at, id LIMIT ?",
+                (status, current, position[1], position[2], remaining)
+            )
+        else:
+            rows = await fetch_all(
+                db, ComplaintQueueItem,
+                f"SELECT {columns(ComplaintQueueItem)} FROM complaints "
+                "WHERE status = ? AND priority = ? "
+                "ORDER BY created_at, id LIMIT ?",
+                (status, current, remaining)
+            )
+        items.extend(rows)
+
+    next_cursor = encode_cursor(items[-1]) if len(items) == limit else None
+    return items, next_cursor
+
+
+async def fetch_assigned(db, assigned_to: int, status: str,
+                         after_id: int = 0, limit: int = 50):
+    """Жалобы исполнителя в статусе — диапазон индекса (assigned_to, status)."""
+    return await fetch_all(
+        db, ComplaintQueueItem,
+        f"SELECT {columns(ComplaintQueueItem)} FROM complaints "
+        "WHERE assigned_to = ? AND status = ? AND id > ? ORDER BY id LIMIT ?",
+        (assigned_to, status, after_id, limit)
+    )
+
+
+async def fetch_counters(db) -> dict:
+    cursor = await db.execute("SELECT status, total FROM complaint_counters")
+    counters = {status: 0 for status in STATUSES}
+    counters.update({status: total for status, total in await cursor.fetchall()})
+    return counters
+
+
+async def fetch_status(db, complaint_id: int, user_id: Optional[int] = None):
+    """Статус одной жалобы — один поиск по первичному ключу."""
+    if user_id is None:
+        return await fetch_one(
+            db, ComplaintStatus,
+            f"SELECT {columns(ComplaintStatus)} FROM complaints WHERE id = ?",
+            (complaint_id,)
+        )
+    return await fetch_one(
+        db, ComplaintStatus,
+        f"SELECT {columns(ComplaintStatus)} FROM complaints WHERE id = ? AND user_id = ?",
+        (complaint_id, user_id)
+    )
+
+
+async def fetch_user_complaints(db, user_id: int, limit: int = 50):
+    return await fetch_all(
+        db, ComplaintStatus,
+        f"SELECT {columns(ComplaintStatus)} FROM complaints "
+        "WHERE user_id = ? ORDER BY created_at DESC LIMIT ?",
+        (user_id, limit)
+    )
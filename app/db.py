@@ -0,0 +1,18 @@
+"""Общие помощники для схемы SQLite."""
+
+
+async def ensure_column(db, table: str, column: str, definition: str):
+    """Добавляет колонку в существующую таблицу, если ее еще нет."""
+    cursor = await db.execute(f"PRAGMA table_info({table})")
+    if column not in {row[1] for row in await cursor.fetchall()}:
+        await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+async def schema_version(db) -> int:
+    cursor = await db.execute("PRAGMA user_version")
+    return (await cursor.fetchone())[0]
+
+
+async def set_schema_version(db, version: int):
+    # PRAGMA не принимает параметры запроса
+    await db.execute(f"PRAGMA user_version = {int(version)}")
@@ -0,0 +1,446 @@
+"""Прием показаний счетчиков энергетического модуля.
+
+Сырые показания лежат в помесячных таблицах ``energy_readings_YYYYMM``
+(WITHOUT ROWID, ключ (meter_id, ts)): запись идет в «хвост» текущего
+месяца, а месяцы старше настройки ``energy_retention_months`` задача
+планировщика ``drop_expired_partitions`` удаляет целиком через DROP TABLE.
+Суточные и месячные агрегаты за эти месяцы остаются. Показания старше
+срока хранения не принимаются: сверять их с удаленной таблицей не с чем,
+и агрегаты удвоились бы.
+
+Запись выполняет единственный фоновый ``ReadingWriter``: запросы на прием
+складывают разобранные строки в его буфер и ждут, пока очередной пакет
+будет зафиксирован. Пакеты от параллельных загрузок объединяются в одну
+транзакцию. Внутри транзакции строки проходят через временную таблицу:
+уже сохраненные показания отбрасываются (повторная выгрузка ничего не
+удваивает), а суточные и месячные агрегаты по счетчику увеличиваются ровно
+на новые строки. Аналитика читает только агрегаты.
+
+Новый счетчик закрепляется за первым загрузившим его пользователем в той же
+транзакции записи (``INSERT ... ON CONFLICT DO NOTHING``), и там же строки
+чужих счетчиков отбрасываются: проверка до постановки в буфер не защищала
+от двух параллельных загрузок одного нового счетчика.
+"""
+import asyncio
+import codecs
+import csv
+import json
+import logging
+import time
+from datetime import datetime
+from typing import Optional
+
+import aiosqlite
+
+from app.medical import parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+RESOURCES = ("electricity", "heat", "gas", "water")
+MAX_METER_ID = 64
+DEFAULT_RETENTION_MONTHS = 36
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS energy_meters (
+        meter_id TEXT PRIMARY KEY,
+        user_id INTEGER,
+        resource TEXT NOT NULL DEFAULT 'electricity',
+        created_at TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_energy_meters_user ON energy_meters(user_id, resource)",
+    """
+    CREATE TABLE IF NOT EXISTS energy_daily (
+        meter_id TEXT NOT NULL,
+        day TEXT NOT NULL,
+        total REAL NOT NULL,
+        min_value REAL NOT NULL,
+        max_value REAL NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (meter_id, day)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS energy_monthly (
+        meter_id TEXT NOT NULL,
+        month TEXT NOT NULL,
+        total REAL NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (meter_id, month)
+    ) WITHOUT ROWID
+    """,
+]
+
+STAGING_DDL = """
+    CREATE TEMP TABLE IF NOT EXISTS energy_staging (
+        meter_id TEXT NOT NULL,
+        ts INTEGER NOT NULL,
+        value REAL NOT NULL,
+        resource TEXT NOT NULL,
+        user_id INTEGER,
+        part TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        checked INTEGER NOT NULL,
+        PRIMARY KEY (meter_id, ts, seq)
+    )
+"""
+
+
+async def init_schema(db):
+    for statement in SCHEMA:
+        await db.execute(statement)
+
+
+def partition_of(ts: int) -> str:
+    return time.strftime("%Y%m", time.gmtime(ts))
+
+
+def partition_table(part: str) -> str:
+    if len(part) != 6 or not part.isdigit():
+        raise ValueError(f"некорректная партиция: {part!r}")
+    return f"energy_readings_{part}"
+
+
+def oldest_partition(months: int, now: Optional[float] = None) -> str:
+    """Самый старый месяц, который хранится при сроке ``months`` (включая текущий)."""
+    current = time.gmtime(now)
+    index = current.tm_year * 12 + current.tm_mon - 1 - (months - 1)
+    return f"{index // 12:04d}{index % 12 + 1:02d}"
+
+
+async def retention_horizon(db) -> Optional[str]:
+    """Партиция, с которой начинаются хранимые месяцы; None — хранить все."""
+    cursor = await db.execute(
+        "SELECT setting_value FROM system_settings WHERE setting_key = 'energy_retention_months'"
+    )
+    row = await cursor.fetchone()
+    await cursor.close()
+    try:
+        months = int(row[0]) if row else DEFAULT_RETENTION_MONTHS
+    except ValueError:
+        months = DEFAULT_RETENTION_MONTHS
+    return oldest_partition(months) if months > 0 else None
+
+
+async def drop_expired_partitions(db):
+    """Задача планировщика: удаляет месячные таблицы показаний старше срока хранения."""
+    horizon = await retention_horizon(db)
+    if horizon is None:
+        return
+    cursor = await db.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB 'energy_readings_[0-9]*' "
+        "AND name < ? ORDER BY name",
+        (partition_table(horizon),)
+    )
+    tables = [row[0] for row in await cursor.fetchall()]
+    for table in tables:
+        # По таблице за транзакцию: DROP держит блокировку записи, пока освобождает страницы
+        await db.execute(f"DROP TABLE IF EXISTS {table}")
+        await db.commit()
+        logger.info(f"Удалена партиция показаний {table}")
+
+
+def parse_reading(record: dict, default_resource: str):
+    """Словарь показания → (meter_id, ts, value, resource)."""
+    if isinstance(record, ValueError):
+        raise record
+    if not isinstance(record, dict):
+        raise ValueError("запись должна быть объектом")
+    meter_id = str(record.get("meter_id") or "").strip()
+    if not meter_id or len(meter_id) > MAX_METER_ID:
+        raise ValueError("некорректный meter_id")
+    resource = record.get("resource") or default_resource
+    if resource not in RESOURCES:
+        raise ValueError(f"неизвестный ресурс: {resource!r}")
+    value = float(record.get("value"))
+    if value != value or value in (float("inf"), float("-inf")):
+        raise ValueError("значение должно быть конечным числом")
+    return meter_id, parse_timestamp(record.get("ts")), value, resource
+
+
+async def iter_lines(upload, chunk_size: int = 64 * 1024):
+    """Построчное чтение UploadFile без загрузки файла в память целиком."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    tail = ""
+    while True:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            break
+        text = tail + decoder.decode(chunk)
+        lines = text.split("\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r")
+    tail += decoder.decode(b"", final=True)
+    if tail.strip():
+        yield tail.rstrip("\r")
+
+
+async def iter_records(upload, fmt: str):
+    """Записи из JSON Lines или CSV (первая строка CSV — заголовок).
+
+    Нечитаемая строка JSON отдается как ValueError, чтобы отклонить только ее.
+    """
+    if fmt == "csv":
+        header = None
+        async for line in iter_lines(upload):
+            if not line.strip():
+                continue
+            values = next(csv.reader([line]))
+            if header is None:
+                header = [name.strip() for name in values]
+                continue
+            yield dict(zip(header, values))
+    else:
+        async for line in iter_lines(upload):
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    yield ValueError(f"некорректный JSON: {e}")
+
+
+class ReadingWriter:
+    """Фоновый писатель: копит показания и сбрасывает их пакетами."""
+
+    def __init__(self, db_path: str, max_batch: int = 5000, flush_interval: float = 0.5):
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._waiters = []
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._stopping = False
+        self._seq = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    def start(self):
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+
+    async def write(self, rows: list, user_id: Optional[int], check_owner: bool = True) -> dict:
+        """Ставит строки в буфер и ждет фиксации пакета, в который они попали.
+
+        Возвращает отброшенное при записи: ``foreign`` — счетчики, закрепленные
+        за другими пользователями (если ``check_owner``), ``expired`` — показания
+        старше срока хранения, ``rejected`` — всего отброшенных строк.
+        """
+        if not self._task or self._task.done():
+            raise RuntimeError("писатель показаний не запущен")
+        waiter = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        self._pending.extend(
+            (meter_id, ts, value, resource, user_id, partition_of(ts), self._seq, int(check_owner))
+            for meter_id, ts, value, resource in rows
+        )
+        self._waiters.append((self._seq, waiter))
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+        return await waiter
+
+    async def _run(self):
+        async with aiosqlite.connect(self.db_path) as db:
+            # В WAL-режиме NORMAL не теряет согласованность, но не ждет fsync на каждом пакете
+            await db.execute("PRAGMA synchronous=NORMAL")
+            await db.execute(STAGING_DDL)
+            while True:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                if self._pending:
+                    await self._flush(db)
+                if self._stopping and not self._pending:
+                    break
+
+    async def _flush(self, db):
+        batch, self._pending = self._pending, []
+        waiters, self._waiters = self._waiters, []
+        try:
+            outcomes = await self._write_batch(db, batch)
+        except Exception as e:
+            logger.error(f"Ошибка записи пакета показаний: {e}")
+            await db.rollback()
+            await db.execute("DELETE FROM temp.energy_staging")
+            for _, waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+            return
+        for seq, waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(outcomes.get(seq) or {"foreign": set(), "expired": 0, "rejected": 0})
+
+    async def _write_batch(self, db, batch: list) -> dict:
+        outcomes = {}
+
+        def outcome(seq):
+            return outcomes.setdefault(seq, {"foreign": set(), "expired": 0, "rejected": 0})
+
+        # Срок хранения, закрепление счетчиков и проверка владельца — в одной
+        # транзакции записи, чтобы параллельный воркер не вклинился между ними
+        await db.execute("BEGIN IMMEDIATE")
+        horizon = await retention_horizon(db)
+        if horizon is not None:
+            kept = []
+            for row in batch:
+                if row[5] < horizon:
+                    outcome(row[6])["expired"] += 1
+                    outcome(row[6])["rejected"] += 1
+                else:
+                    kept.append(row)
+            batch = kept
+        parts = sorted({row[5] for row in batch})
+        for part in parts:
+            # Без кэша в памяти: партицию мог удалить другой воркер, а
+            # IF NOT EXISTS для существующей таблицы ничего не пишет
+            await db.execute(f"""
+                CREATE TABLE IF NOT EXISTS {partition_table(part)} (
+                    meter_id TEXT NOT NULL,
+                    ts INTEGER NOT NULL,
+                    value REAL NOT NULL,
+                    PRIMARY KEY (meter_id, ts)
+                ) WITHOUT ROWID
+            """)
+
+        await db.executemany(
+            "INSERT OR REPLACE INTO temp.energy_staging "
+            "(meter_id, ts, value, resource, user_id, part, seq, checked) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            batch
+        )
+        # Новый счетчик достается первой загрузке пакета, занятые не меняются
+        await db.execute(
+            """INSERT INTO energy_meters (meter_id, user_id, resource, created_at)
+            SELECT meter_id, user_id, resource, ? FROM temp.energy_staging WHERE true ORDER BY seq
+            ON CONFLICT(meter_id) DO NOTHING""",
+            (datetime.now().isoformat(),)
+        )
+        cursor = await db.execute(
+            """SELECT DISTINCT s.seq, s.meter_id FROM temp.energy_staging s
+            JOIN energy_meters m ON m.meter_id = s.meter_id
+            WHERE s.checked AND m.user_id IS NOT s.user_id"""
+        )
+        foreign = await cursor.fetchall()
+        await cursor.close()
+        if foreign:
+            foreign = set(foreign)
+            for seq, meter_id in foreign:
+                outcome(seq)["foreign"].add(meter_id)
+            for row in batch:
+                if (row[6], row[0]) in foreign:
+                    outcome(row[6])["rejected"] += 1
+            await db.execute(
+                """DELETE FROM temp.energy_staging WHERE checked AND user_id IS NOT (
+                    SELECT m.user_id FROM energy_meters m WHERE m.meter_id = energy_staging.meter_id
+                )"""
+            )
+        # Одно показание из нескольких загрузок пакета: остается последнее
+        await db.execute(
+            """DELETE FROM temp.energy_staging WHERE EXISTS (
+                SELECT 1 FROM temp.energy_staging later
+                WHERE later.meter_id = energy_staging.meter_id AND later.ts = energy_staging.ts
+                AND later.seq > energy_staging.seq
+            )"""
+        )
+        for part in parts:
+            await db.execute(
+                f"""DELETE FROM temp.energy_staging WHERE part = ? AND EXISTS (
+                    SELECT 1 FROM {partition_table(part)} r
+                    WHERE r.meter_id = energy_staging.meter_id AND r.ts = energy_staging.ts
+                )""",
+                (part,)
+            )
+        await db.execute(
+            """INSERT INTO energy_daily (meter_id, day, total, min_value, max_value, count)
+            SELECT meter_id, date(ts, 'unixepoch'), SUM(value), MIN(value), MAX(value), COUNT(*)
+            FROM temp.energy_staging WHERE true GROUP BY meter_id, date(ts, 'unixepoch')
+            ON CONFLICT(meter_id, day) DO UPDATE SET
+                total = total + excluded.total,
+                min_value = MIN(min_value, excluded.min_value),
+                max_value = MAX(max_value, excluded.max_value),
+                count = count + excluded.count"""
+        )
+        await db.execute(
+            """INSERT INTO energy_monthly (meter_id, month, total, count)
+            SELECT meter_id, strftime('%Y-%m', ts, 'unixepoch'), SUM(value), COUNT(*)
+            FROM temp.energy_staging WHERE true GROUP BY meter_id, strftime('%Y-%m', ts, 'unixepoch')
+            ON CONFLICT(meter_id, month) DO UPDATE SET
+                total = total + excluded.total,
+                count = count + excluded.count"""
+        )
+        for part in parts:
+            await db.execute(
+                f"""INSERT INTO {partition_table(part)} (meter_id, ts, value)
+                SELECT meter_id, ts, value FROM temp.energy_staging WHERE part = ?""",
+                (part,)
+            )
+        await db.execute("DELETE FROM temp.energy_staging")
+        await db.commit()
+        return outcomes
+
+
+async def fetch_meters(db, user_id: Optional[int]):
+    if user_id is None:
+        cursor = await db.execute(
+            "SELECT meter_id, user_id, resource, created_at FROM energy_meters ORDER BY meter_id"
+        )
+    else:
+        cursor = await db.execute(
+            "SELECT meter_id, user_id, resource, created_at FROM energy_meters "
+            "WHERE user_id = ? ORDER BY meter_id",
+            (user_id,)
+        )
+    return await cursor.fetchall()
+
+
+async def fetch_daily(db, meter_id: str, start: str, end: str):
+    cursor = await db.execute(
+        """SELECT day, total, min_value, max_value, count FROM energy_daily
+        WHERE meter_id = ? AND day >= ? AND day < ? ORDER BY day""",
+        (meter_id, start, end)
+    )
+    return await cursor.fetchall()
+
+
+async def fetch_monthly(db, meter_ids: list, start: str, end: str):
+    """Помесячные итоги по набору счетчиков (суммой)."""
+    if not meter_ids:
+        return []
+    cursor = await db.execute(
+        f"""SELECT month, SUM(total), SUM(count) FROM energy_monthly
+        WHERE meter_id IN ({','.join('?' * len(meter_ids))}) AND month >= ? AND month < ?
+        GROUP BY month ORDER BY month""",
+        (*meter_ids, start, end)
+    )
+    return await cursor.fetchall()
+
+
+async def fetch_raw(db, meter_id: str, start: int, end: int, limit: int = 10000):
+    """Сырые показания за период — обходит только нужные месячные таблицы."""
+    cursor = await db.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB 'energy_readings_[0-9]*' "
+        "AND name >= ? AND name <= ? ORDER BY name",
+        (partition_table(partition_of(start)), partition_table(partition_of(max(start, end - 1))))
+    )
+    rows = []
+    for (table,) in await cursor.fetchall():
+        cursor = await db.execute(
+            f"SELECT ts, value FROM {table} WHERE meter_id = ? AND ts >= ? AND ts < ? ORDER BY ts LIMIT ?",
+            (meter_id, start, end, limit - len(rows))
+        )
+        rows.extend(await cursor.fetchall())
+        if len(rows) >= limit:
+            break
+    return rows
@@ -0,0 +1,150 @@
+"""Потоковая выгрузка таблиц в CSV / JSON Lines (опционально gzip).
+
+Выгрузка читает таблицу короткими keyset-запросами по (created_at, id):
+каждый запрос — диапазон индекса, завершающийся сразу после чтения порции,
+поэтому даже выгрузка десятков миллионов строк не держит долгую читающую
+транзакцию и не мешает остальным запросам. В памяти одновременно находится
+только одна порция строк. Число параллельных выгрузок ограничено.
+"""
+import asyncio
+import csv
+import io
+import json
+import zlib
+from typing import Optional
+
+import aiosqlite
+
+CHUNK_SIZE = 5000
+MAX_CONCURRENT_EXPORTS = 2
+
+# Набор колонок задается явно: хэши паролей наружу не уходят никогда
+DATASETS = {
+    "qr_codes": {
+        "columns": ("id", "title", "data", "filename", "created_at", "scan_count",
+                    "last_scan", "colors", "user_id", "qr_type"),
+        "user_column": "user_id",
+    },
+    "action_logs": {
+        "columns": ("id", "user_id", "action_type", "description", "ip_address", "created_at"),
+        "user_column": "user_id",
+    },
+    "users": {
+        "columns": ("id", "username", "role", "is_active", "created_at", "last_login",
+                    "is_blocked", "frozen_until", "block_count", "theme", "logo_url",
+                    "ip_address", "is_medical_worker"),
+        "user_column": "id",
+    },
+}
+
+SCHEMA = [
+    "CREATE INDEX IF NOT EXISTS idx_qr_codes_created ON qr_codes(created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_qr_codes_user ON qr_codes(user_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_action_logs_created ON action_logs(created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_action_logs_user ON action_logs(user_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_users_created ON users(created_at)",
+]
+
+
+class ExportSlots:
+    """Семафор выгрузок со счетчиком занятых слотов (для 429 и метрики)."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.in_use = 0
+        self._semaphore = asyncio.Semaphore(size)
+
+    def locked(self) -> bool:
+        return self.in_use >= self.size
+
+    async def __aenter__(self):
+        await self._semaphore.acquire()
+        self.in_use += 1
+
+    async def __aexit__(self, *exc_info):
+        self.in_use -= 1
+        self._semaphore.release()
+
+
+export_slots = ExportSlots(MAX_CONCURRENT_EXPORTS)
+
+
+def slots_in_use() -> int:
+    return export_slots.in_use
+
+
+async def init_schema(db):
+    for statement in SCHEMA:
+        await db.execute(statement)
+
+
+def build_query(dataset: str, start: Optional[str], end: Optional[str],
+                user_id: Optional[int]):
+    """SELECT порции с фильтрами; последние два параметра — позиция keyset."""
+    spec = DATASETS[dataset]
+    where, params = [], []
+    if user_id is not None:
+        where.append(f"{spec['user_column']} = ?")
+        params.append(user_id)
+    if start:
+        where.append("created_at >= ?")
+        params.append(start)
+    if end:
+        where.append("created_at < ?")
+        params.append(end)
+    where.append("(created_at, id) > (?, ?)")
+    sql = (f"SELECT {', '.join(spec['columns'])} FROM {dataset} "
+           f"WHERE {' AND '.join(where)} ORDER BY created_at, id LIMIT {CHUNK_SIZE}")
+    return sql, params
+
+
+def encode_rows(rows, columns, fmt: str, header: bool) -> str:
+    if fmt == "jsonl":
+        return "".join(
+            json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in rows
+        )
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(columns)
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+async def stream_export(db_path: str, dataset: str, fmt: str = "csv", compress: bool = False,
+                        start: Optional[str] = None, end: Optional[str] = None,
+                        user_id: Optional[int] = None):
+    """Асинхронный генератор байтов выгрузки; занимает слот до завершения.
+
+    Слот берется внутри генератора: если клиент отключился до первой порции
+    и генератор так и не запустился, освобождать нечего. Проверка
+    ``export_slots.locked()`` в обработчике — только быстрый отказ 429;
+    выгрузка, проигравшая гонку за последний слот, дождется его здесь.
+    """
+    columns = DATASETS[dataset]["columns"]
+    sql, params = build_query(dataset, start, end, user_id)
+    # created_at во всех выгружаемых таблицах NOT NULL, '' меньше любой даты
+    position = ("", 0)
+    gzip = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    async with export_slots:
+        async with aiosqlite.connect(db_path) as db:
+            await db.execute("PRAGMA query_only = ON")
+            header = True
+            while True:
+                cursor = await db.execute(sql, (*params, *position))
+                rows = await cursor.fetchall()
+                await cursor.close()
+                if not rows and not header:
+                    break
+                data = encode_rows(rows, columns, fmt, header).encode("utf-8")
+                header = False
+                if gzip:
+                    data = gzip.compress(data)
+                if data:
+                    yield data
+                if len(rows) < CHUNK_SIZE:
+                    break
+                last = rows[-1]
+                position = (last[columns.index("created_at")] or "", last[0])
+        if gzip:
+            yield gzip.flush()
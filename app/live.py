@@ -0,0 +1,148 @@
+"""Живые счетчики сканирований для страницы QR-кодов (Server-Sent Events).
+
+``ScanFastPath`` после каждого сканирования вызывает ``ScanHub.publish``
+с id QR-кода и его владельцем. Хаб раздает событие подпискам этого
+владельца и администраторов, открытых через ``GET /dashboard/qr/live``.
+
+Подписка не хранит очередь событий: у нее словарь ``qr_id -> прирост``,
+который копится ``WINDOW`` секунд и уходит клиенту одним событием
+``scans`` (``{"<qr_id>": прирост, ...}``). Память на подписку ограничена
+числом разных QR-кодов за окно (не больше ``MAX_PENDING``) и не зависит
+от числа сканирований. Если за окно изменилось больше ``MAX_PENDING``
+кодов, клиенту уходит ``reset`` и страница перезагружается целиком.
+
+Хаб свой в каждом процессе: при нескольких воркерах подписка видит
+сканирования только своего воркера, остальные — после перезагрузки
+страницы.
+"""
+import asyncio
+import json
+from typing import Optional
+
+from app import metrics
+
+WINDOW = 1.0                         # секунд на накопление прироста
+KEEPALIVE = 20.0                     # комментарий в пустом потоке, чтобы прокси не рвали соединение
+MAX_PENDING = 1000
+MAX_SUBSCRIBERS = 10_000
+RETRY_MS = 5000
+
+EVENTS = metrics.REGISTRY.register(metrics.Counter(
+    "idqr_live_events_total", "События, отправленные подписчикам живых счетчиков", ("event",)))
+
+
+class Subscription:
+    __slots__ = ("owner", "pending", "overflow", "event")
+
+    def __init__(self, owner: Optional[int]):
+        self.owner = owner               # None — администратор, все QR-коды
+        self.pending = {}
+        self.overflow = False
+        self.event = asyncio.Event()
+
+    def add(self, qr_id: int):
+        if qr_id in self.pending:
+            self.pending[qr_id] += 1
+        elif len(self.pending) < MAX_PENDING:
+            self.pending[qr_id] = 1
+        else:
+            self.overflow = True
+        self.event.set()
+
+    def take(self) -> dict:
+        pending, self.pending = self.pending, {}
+        self.event.clear()
+        return pending
+
+
+class ScanHub:
+    def __init__(self, window: float = WINDOW, max_subscribers: int = MAX_SUBSCRIBERS):
+        self.window = window
+        self.max_subscribers = max_subscribers
+        self._by_owner = {}          # user_id -> множество подписок
+        self._admins = set()
+        self._count = 0
+        self._closed = False
+
+    @property
+    def subscribers(self) -> int:
+        return self._count
+
+    @property
+    def accepting(self) -> bool:
+        return not self._closed and self._count < self.max_subscribers
+
+    def subscribe(self, owner: Optional[int]) -> Optional[Subscription]:
+        """Новая подписка; None, если хаб закрыт или подписок слишком много."""
+        if not self.accepting:
+            return None
+        subscription = Subscription(owner)
+        if owner is None:
+            self._admins.add(subscription)
+        else:
+            self._by_owner.setdefault(owner, set()).add(subscription)
+        self._count += 1
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        if subscription.owner is None:
+            subscribers = self._admins
+        else:
+            subscribers = self._by_owner.get(subscription.owner, set())
+        if subscription in subscribers:
+            subscribers.remove(subscription)
+            self._count -= 1
+        if subscription.owner is not None and not subscribers:
+            self._by_owner.pop(subscription.owner, None)
+
+    def publish(self, owner: Optional[int], qr_id: int):
+        """Сканирование QR-кода; вызывается на пути сканирования, без await."""
+        subscribers = self._by_owner.get(owner)
+        if subscribers:
+            for subscription in subscribers:
+                subscription.add(qr_id)
+        for subscription in self._admins:
+            subscription.add(qr_id)
+
+    def close(self):
+        """Завершает все потоки (при остановке приложения)."""
+        self._closed = True
+        for subscribers in (self._admins, *self._by_owner.values()):
+            for subscription in subscribers:
+                subscription.event.set()
+
+    async def stream(self, owner: Optional[int]):
+        """Тело ответа text/event-stream; подписка снимается при отключении клиента.
+
+        Подписка создается внутри генератора: если клиент отключился до
+        первой итерации и генератор не запускался, снимать нечего. Проверка
+        ``accepting`` в обработчике — быстрый ответ 503; поток, проигравший
+        гонку за последнее место, завершается сразу, и браузер переподключится
+        через ``retry``.
+        """
+        subscription = self.subscribe(owner)
+        if subscription is None:
+            yield f"retry: {RETRY_MS}\n\n"
+            return
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            while not self._closed:
+                try:
+                    await asyncio.wait_for(subscription.event.wait(), KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if self._closed:
+                    break
+                # Сканирования, пришедшие за окно, уйдут тем же событием
+                await asyncio.sleep(self.window)
+                overflow, subscription.overflow = subscription.overflow, False
+                deltas = subscription.take()
+                if overflow:
+                    EVENTS.inc("reset")
+                    yield "event: reset\ndata: {}\n\n"
+                elif deltas:
+                    EVENTS.inc("scans")
+                    yield f"event: scans\ndata: {json.dumps(deltas, separators=(',', ':'))}\n\n"
+        finally:
+            self.unsubscribe(subscription)
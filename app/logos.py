@@ -0,0 +1,155 @@
+"""Логотипы пользователей: загрузка, нормализация и встраивание в QR.
+
+Загруженный файл проверяется и уменьшается в пуле потоков (``process_upload``
+вызывается через ``asyncio.to_thread``), после чего на диске лежат два
+варианта, имя которых содержит хэш содержимого и поэтому никогда не
+меняется: ``<user>-<hash>.png`` для профиля и ``<user>-<hash>-qr.png`` —
+квадрат на белой подложке для центра QR-кода. При отрисовке QR вариант
+масштабируется под размер кода один раз: готовые битмапы лежат в
+LRU-кэше по (файл, размер), так что сотни брендированных QR одного
+пользователя не декодируют и не масштабируют логотип заново.
+
+Pillow импортируется внутри функций: модуль загружается вместе с
+app.main, а картинки нужны только при загрузке логотипа и отрисовке QR.
+"""
+import hashlib
+import io
+import os
+from collections import OrderedDict
+from threading import Lock
+from typing import TYPE_CHECKING, Optional
+
+from app import metrics
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+MAX_UPLOAD_BYTES = 5 * 1024 * 1024
+MAX_SOURCE_PIXELS = 40_000_000       # защита от «бомб» распаковки
+ALLOWED_FORMATS = {"PNG", "JPEG", "WEBP", "GIF", "BMP"}
+PROFILE_SIZE = 256
+QR_VARIANT_SIZE = 256
+QR_VARIANT_PADDING = 0.12            # белое поле вокруг логотипа внутри квадрата
+# Доля стороны кода (без поля) под логотип: ~6% модулей, коррекция H
+# восстанавливает до 30% поврежденных кодовых слов
+LOGO_FRACTION = 0.25
+URL_PREFIX = "/static/logos/"
+
+
+class LogoError(ValueError):
+    """Файл не подходит в качестве логотипа."""
+
+
+def process_upload(data: bytes, user_id: int, folder: str) -> str:
+    """Проверяет, нормализует и сохраняет логотип; возвращает URL профиля.
+
+    Синхронная и тяжелая: вызывать через asyncio.to_thread.
+    """
+    from PIL import Image, ImageOps
+
+    if not data:
+        raise LogoError("Пустой файл")
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise LogoError("Файл больше 5 МБ")
+    try:
+        with Image.open(io.BytesIO(data)) as probe:
+            if probe.format not in ALLOWED_FORMATS:
+                raise LogoError("Поддерживаются PNG, JPEG, WEBP, GIF и BMP")
+            if probe.width * probe.height > MAX_SOURCE_PIXELS:
+                raise LogoError("Слишком большое изображение")
+            probe.verify()
+        image = Image.open(io.BytesIO(data))
+        # draft ускоряет JPEG: декодер сразу отдает уменьшенную копию
+        image.draft("RGB", (PROFILE_SIZE * 2, PROFILE_SIZE * 2))
+        image = ImageOps.exif_transpose(image).convert("RGBA")
+    except LogoError:
+        raise
+    except Exception:
+        raise LogoError("Файл не является изображением")
+
+    image.thumbnail((PROFILE_SIZE, PROFILE_SIZE), Image.LANCZOS)
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    name = f"{user_id}-{digest}"
+
+    profile_path = os.path.join(folder, f"{name}.png")
+    if not os.path.exists(profile_path):
+        image.save(profile_path, optimize=True)
+
+    qr_path = os.path.join(folder, f"{name}-qr.png")
+    if not os.path.exists(qr_path):
+        square = Image.new("RGB", (QR_VARIANT_SIZE, QR_VARIANT_SIZE), "white")
+        inner = round(QR_VARIANT_SIZE * (1 - 2 * QR_VARIANT_PADDING))
+        fitted = image.copy()
+        fitted.thumbnail((inner, inner), Image.LANCZOS)
+        offset = ((QR_VARIANT_SIZE - fitted.width) // 2, (QR_VARIANT_SIZE - fitted.height) // 2)
+        square.paste(fitted, offset, fitted)
+        square.save(qr_path, optimize=True)
+
+    remove_stale(folder, user_id, keep=name)
+    return URL_PREFIX + f"{name}.png"
+
+
+def remove_stale(folder: str, user_id: int, keep: str):
+    """Удаляет варианты прежних логотипов пользователя."""
+    prefix = f"{user_id}-"
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.name.startswith(prefix) and not entry.name.startswith(keep):
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
+
+def qr_variant_path(logo_url: Optional[str], folder: str) -> Optional[str]:
+    """Путь к квадратному варианту для QR по users.logo_url."""
+    if not logo_url or not logo_url.startswith(URL_PREFIX):
+        return None
+    name = os.path.basename(logo_url)
+    if not name.endswith(".png"):
+        return None
+    path = os.path.join(folder, name[:-4] + "-qr.png")
+    return path if os.path.exists(path) else None
+
+
+class ScaledLogoCache:
+    """LRU готовых к вставке битмапов по (путь варианта, сторона в пикселях)."""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._images = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, path: str, size: int) -> "Image.Image":
+        key = (path, size)
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+                metrics.cache_hit("logo")
+                return image
+        metrics.cache_miss("logo")
+        from PIL import Image
+
+        with Image.open(path) as source:
+            image = source.convert("RGB").resize((size, size), Image.LANCZOS)
+        with self._lock:
+            self._images[key] = image
+            if len(self._images) > self.max_entries:
+                self._images.popitem(last=False)
+        return image
+
+
+scaled_logos = ScaledLogoCache()
+
+
+def embed(qr_img: "Image.Image", logo_path: str, code_width: int) -> "Image.Image":
+    """Вставляет логотип в центр QR (на месте, возвращает тот же объект).
+
+    code_width — сторона самого кода в пикселях, без белого поля.
+    """
+    size = int(code_width * LOGO_FRACTION)
+    logo = scaled_logos.get(logo_path, size)
+    offset = ((qr_img.width - size) // 2, (qr_img.height - size) // 2)
+    qr_img.paste(logo, offset)
+    return qr_img
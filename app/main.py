@@ -1,49 +1,139 @@
 from fastapi import FastAPI, Form, Request, HTTPException, Depends, UploadFile, File
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse, PlainTextResponse, Response, FileResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from fastapi.middleware import Middleware
 from starlette.middleware.sessions import SessionMiddleware
-import qrcode
+import asyncio
+import functools
 import os
-import uuid
 from datetime import datetime, timedelta
 import aiosqlite
-from PIL import Image, ImageDraw, ImageFont, ImageColor
 import logging
 import textwrap
 import json
 import secrets
-from passlib.context import CryptContext
 import ipaddress
 from typing import Optional
 
+from app import accounts, analytics, assets, backup, complaints, energy, exports, logos, medical, live, metrics, profiling, qrfiles, ratelimit, scan, scheduler, templating, webhooks
+from app import db as db_schema
+from app.models import (
+    SessionUser, LoginUser, UserSettingsView, QRListItem, QRCodeView, QROwnerRef,
+    columns, fetch_one, fetch_all,
+)
+
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+# Ошибки, которые перехватываются и уходят в лог, считаются в /metrics
+logging.getLogger().addHandler(metrics.ErrorCountingHandler())
 
 # Секретный ключ для сессий
 SECRET_KEY = os.environ.get("SECRET_KEY", "your-secret-key-change-in-production")
+# /metrics отдается по заголовку Authorization: Bearer <METRICS_TOKEN> или
+# администратору в сессии; METRICS_PUBLIC=1 открывает его всем (только за
+# закрытым периметром)
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+METRICS_PUBLIC = os.environ.get("METRICS_PUBLIC") == "1"
 
 # Создаем middleware для сессий
 middleware = [
+    Middleware(metrics.MetricsMiddleware),
+    # Профилирование включается переменными PROFILE_* (см. app/profiling.py)
+    *profiling.middleware_from_env(),
     Middleware(SessionMiddleware, secret_key=SECRET_KEY)
 ]
 
 app = FastAPI(middleware=middleware)
+# Собранные ассеты с отпечатками (см. app/assets.py) — раньше общего /static
+app.mount("/static/dist", assets.AssetFiles(directory="static/dist", check_dir=False), name="assets")
 app.mount("/static", StaticFiles(directory="static"), name="static")
-templates = Jinja2Templates(directory="templates")
+# Кэш байткода шаблонов и прогрев (см. app/templating.py)
+TEMPLATE_CACHE_DIR = os.environ.get("TEMPLATE_CACHE_DIR", ".jinja_cache")
+templates = Jinja2Templates(env=templating.create_environment(
+    "templates", TEMPLATE_CACHE_DIR, auto_reload=os.environ.get("TEMPLATES_AUTO_RELOAD") == "1"
+))
+templates.env.globals["asset_url"] = assets.url
 
 # --- Константы ---
 QR_FOLDER = "static/qr"
 LOGOS_FOLDER = "static/logos"
-DB_PATH = "qr_data.db"
+DB_PATH = os.environ.get("DB_PATH", "qr_data.db")
+BACKUP_DIR = os.environ.get("BACKUP_DIR", "backups")
+BACKUP_KEEP = int(os.environ.get("BACKUP_KEEP", "7"))
 ADMIN_CODE = "admin1990"
+# Версия схемы в PRAGMA user_version: увеличивать при любом изменении таблиц,
+# индексов или начальных данных (в том числе в SCHEMA модулей app/*)
+SCHEMA_VERSION = 4
 BASE_URL = "https://idqr-platform.onrender.com"
 
-# Настройка безопасности
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+# Фоновый писатель показаний счетчиков энергетики
+reading_writer = energy.ReadingWriter(DB_PATH)
+
+# Кэш ответов сканирования; /scan/<id> обслуживается до сессий и роутинга
+scan_cache = scan.ScanCache(DB_PATH, templates.env)
+# Живые счетчики сканирований на /dashboard/qr (см. app/live.py)
+scan_hub = live.ScanHub()
+app.add_middleware(scan.ScanFastPath, cache=scan_cache, hub=scan_hub)
+
+# Лимит частоты на публичных маршрутах; добавлен последним — самый внешний (см. app/ratelimit.py)
+rate_limiter = ratelimit.RateLimiter.from_env(os.environ)
+app.add_middleware(ratelimit.RateLimitMiddleware, limiter=rate_limiter)
+
+# Фоновые обслуживающие задачи (см. app/scheduler.py)
+jobs = scheduler.Scheduler(DB_PATH)
+jobs.add("flush_scan_counters", 1, lambda db: scan_cache.flush(), leader_only=False)
+jobs.add("expire_blocks", 60, scheduler.expire_blocks)
+jobs.add("rollup_stats", 300, scheduler.rollup_stats, delay=30)
+jobs.add("prune_logs", 3600, scheduler.prune_logs, delay=60)
+jobs.add("reconcile_qr_files", 3600,
+         lambda db: qrfiles.reconcile(db, QR_FOLDER, repair=restore_qr_files), delay=120)
+jobs.add("optimize_db", 6 * 3600, scheduler.optimize, delay=600)
+jobs.add("migrate_medical_data", 600, medical.migrate_legacy, delay=20)
+jobs.add("drop_energy_partitions", 24 * 3600, energy.drop_expired_partitions, delay=120)
+
+# Тяжелые административные списки читают через соединения только на чтение
+# с бюджетом времени и ограничением параллельности (см. app/analytics.py)
+analytics_reader = analytics.Reader.from_env(DB_PATH, os.environ)
+# Контрольная точка WAL в каждом воркере: ее результат приостанавливает сессии аналитики воркера
+jobs.add("checkpoint_wal", 10, analytics_reader.checkpoint, leader_only=False, delay=10)
+
+# Доставка вебхуков о сканированиях; только у лидера планировщика (см. app/webhooks.py)
+webhook_dispatcher = webhooks.Dispatcher(DB_PATH, is_active=jobs.leads)
+
+# --- Метрики ---
+metrics.instrument_aiosqlite()
+metrics.REGISTRY.gauge("idqr_energy_writer_queue_depth",
+                       "Показания в очереди фонового писателя", lambda: reading_writer.queue_depth)
+metrics.REGISTRY.gauge("idqr_export_slots_in_use",
+                       "Занятые слоты параллельных выгрузок", exports.slots_in_use)
+metrics.REGISTRY.gauge("idqr_scheduler_is_leader",
+                       "1, если этот воркер выполняет задачи планировщика", lambda: int(jobs.is_leader))
+metrics.REGISTRY.gauge("idqr_ratelimit_tracked_keys",
+                       "Ведра в LRU лимитера запросов", lambda: len(rate_limiter.buckets))
+metrics.REGISTRY.gauge("idqr_live_subscribers",
+                       "Открытые потоки живых счетчиков сканирований", lambda: scan_hub.subscribers)
+metrics.REGISTRY.gauge("idqr_webhook_deliveries_in_flight",
+                       "Доставки вебхуков, ожидающие ответа получателя", lambda: webhook_dispatcher.in_flight)
+metrics.REGISTRY.gauge("idqr_analytics_sessions_in_use",
+                       "Открытые сессии чтения аналитики", lambda: analytics_reader.in_use)
+metrics.REGISTRY.gauge("idqr_db_wal_bytes",
+                       "Размер файла WAL базы", lambda: scheduler.wal_size(DB_PATH))
+
+# Одна резервная копия за раз: параллельные копии только делят диск
+backup_lock = asyncio.Lock()
+
+# Настройка безопасности: passlib и argon2 загружаются при первой проверке пароля, а не при старте
+_pwd_context = None
+
+def password_context():
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+    return _pwd_context
 
 # Создаем папки если они не существуют
 os.makedirs(QR_FOLDER, exist_ok=True)
@@ -51,147 +141,209 @@ os.makedirs(LOGOS_FOLDER, exist_ok=True)
 os.makedirs("static/fonts", exist_ok=True)
 
 # --- ИНИЦИАЛИЗАЦИЯ БД ---
+async def create_schema(db):
+    """Таблицы, индексы и начальные настройки; идемпотентно, выполняется при смене SCHEMA_VERSION"""
+    # Действует только на новой (пустой) БД: свободные страницы возвращает optimize_db
+    await db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    # WAL: читатели не блокируют писателей (режим сохраняется в файле БД)
+    await db.execute("PRAGMA journal_mode=WAL")
+    
+    # Таблица QR-кодов
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS qr_codes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            data TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            scan_count INTEGER DEFAULT 0,
+            last_scan TEXT,
+            colors TEXT DEFAULT '{"qr_color": "#000000", "bg_color": "#FFFFFF", "text_color": "#000000"}',
+            user_id INTEGER,
+            qr_type TEXT DEFAULT 'url'
+        )
+    """)
+    
+    # Таблица пользователей с расширенными полями
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            role TEXT NOT NULL DEFAULT 'user',
+            is_active BOOLEAN NOT NULL DEFAULT 1,
+            created_at TEXT NOT NULL,
+            last_login TEXT,
+            is_blocked BOOLEAN NOT NULL DEFAULT 0,
+            frozen_until TEXT,
+            block_count INTEGER DEFAULT 0,
+            theme TEXT NOT NULL DEFAULT 'light',
+            logo_url TEXT,
+            ip_address TEXT,
+            is_medical_worker BOOLEAN NOT NULL DEFAULT 0
+        )
+    """)
+    
+    # Таблица заблокированных IP
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS blocked_ips (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ip_address TEXT UNIQUE NOT NULL,
+            reason TEXT,
+            blocked_until TEXT,
+            created_at TEXT NOT NULL
+        )
+    """)
+    
+    # Таблица системных настроек
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS system_settings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            setting_key TEXT UNIQUE NOT NULL,
+            setting_value TEXT NOT NULL,
+            description TEXT,
+            updated_at TEXT NOT NULL
+        )
+    """)
+    
+    # Таблица логов действий
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS action_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            action_type TEXT NOT NULL,
+            description TEXT NOT NULL,
+            ip_address TEXT,
+            created_at TEXT NOT NULL
+        )
+    """)
+    
+    # Таблица жалоб
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS complaints (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            title TEXT NOT NULL,
+            category TEXT NOT NULL,
+            description TEXT NOT NULL,
+            status TEXT DEFAULT 'new',
+            priority TEXT DEFAULT 'medium',
+            assigned_to INTEGER,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            resolved_at TEXT,
+            response TEXT
+        )
+    """)
+    await complaints.init_schema(db)
+    
+    # Таблица медицинских данных
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS medical_data (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            category TEXT NOT NULL,
+            data_type TEXT NOT NULL,
+            value TEXT NOT NULL,
+            date_recorded TEXT NOT NULL,
+            notes TEXT,
+            created_at TEXT NOT NULL
+        )
+    """)
+    await medical.init_schema(db)
+    await energy.init_schema(db)
+    await exports.init_schema(db)
+    await scan.init_schema(db)
+    await scheduler.init_schema(db)
+    await qrfiles.init_schema(db)
+    await accounts.init_schema(db)
+    await webhooks.init_schema(db)
+    
+    # Создаем базовые системные настройки
+    await db.execute("""
+        INSERT OR IGNORE INTO system_settings (setting_key, setting_value, description, updated_at) 
+        VALUES (?, ?, ?, ?)
+    """, ("site_name", "IDQR Platform", "Название сайта", datetime.now().isoformat()))
+    
+    await db.execute("""
+        INSERT OR IGNORE INTO system_settings (setting_key, setting_value, description, updated_at) 
+        VALUES (?, ?, ?, ?)
+    """, ("max_qr_per_user", "50", "Максимум QR-кодов на пользователя", datetime.now().isoformat()))
+    
+    await db.execute("""
+        INSERT OR IGNORE INTO system_settings (setting_key, setting_value, description, updated_at) 
+        VALUES (?, ?, ?, ?)
+    """, ("registration_enabled", "true", "Разрешена ли регистрация новых пользователей", datetime.now().isoformat()))
+    
+    await db.execute("""
+        INSERT OR IGNORE INTO system_settings (setting_key, setting_value, description, updated_at) 
+        VALUES (?, ?, ?, ?)
+    """, ("log_retention_days", str(scheduler.DEFAULT_LOG_RETENTION_DAYS), "Срок хранения логов действий, дней (0 — без удаления)", datetime.now().isoformat()))
+    
+    await db.execute("""
+        INSERT OR IGNORE INTO system_settings (setting_key, setting_value, description, updated_at) 
+        VALUES (?, ?, ?, ?)
+    """, ("energy_retention_months", str(energy.DEFAULT_RETENTION_MONTHS), "Срок хранения сырых показаний счетчиков, месяцев (0 — без удаления)", datetime.now().isoformat()))
+    await db_schema.set_schema_version(db, SCHEMA_VERSION)
+
+async def ensure_admin(db):
+    """Администратор по умолчанию; пароль хэшируется, только если строки нет"""
+    cursor = await db.execute("SELECT 1 FROM users WHERE username = 'admin'")
+    if await cursor.fetchone() is not None:
+        return
+    admin_password = "admin123"
+    await db.execute("""
+        INSERT OR IGNORE INTO users (username, password_hash, role, created_at) 
+        VALUES (?, ?, ?, ?)
+    """, ("admin", get_password_hash(admin_password), "admin", datetime.now().isoformat()))
+    logger.info("Создан администратор по умолчанию")
+
 @app.on_event("startup")
 async def startup():
     try:
         async with aiosqlite.connect(DB_PATH) as db:
-            # Таблица QR-кодов
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS qr_codes (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    title TEXT NOT NULL,
-                    data TEXT NOT NULL,
-                    filename TEXT NOT NULL,
-                    created_at TEXT NOT NULL,
-                    scan_count INTEGER DEFAULT 0,
-                    last_scan TEXT,
-                    colors TEXT DEFAULT '{"qr_color": "#000000", "bg_color": "#FFFFFF", "text_color": "#000000"}',
-                    user_id INTEGER,
-                    qr_type TEXT DEFAULT 'url'
-                )
-            """)
-            
-            # Таблица пользователей с расширенными полями
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE NOT NULL,
-                    password_hash TEXT NOT NULL,
-                    role TEXT NOT NULL DEFAULT 'user',
-                    is_active BOOLEAN NOT NULL DEFAULT 1,
-                    created_at TEXT NOT NULL,
-                    last_login TEXT,
-                    is_blocked BOOLEAN NOT NULL DEFAULT 0,
-                    frozen_until TEXT,
-                    block_count INTEGER DEFAULT 0,
-                    theme TEXT NOT NULL DEFAULT 'light',
-                    logo_url TEXT,
-                    ip_address TEXT,
-                    is_medical_worker BOOLEAN NOT NULL DEFAULT 0
-                )
-            """)
-            
-            # Таблица заблокированных IP
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS blocked_ips (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    ip_address TEXT UNIQUE NOT NULL,
-                    reason TEXT,
-                    blocked_until TEXT,
-                    created_at TEXT NOT NULL
-                )
-            """)
-            
-            # Таблица системных настроек
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS system_settings (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    setting_key TEXT UNIQUE NOT NULL,
-                    setting_value TEXT NOT NULL,
-                    description TEXT,
-                    updated_at TEXT NOT NULL
-                )
-            """)
-            
-            # Таблица логов действий
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS action_logs (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    action_type TEXT NOT NULL,
-                    description TEXT NOT NULL,
-                    ip_address TEXT,
-                    created_at TEXT NOT NULL
-                )
-            """)
-            
-            # Таблица жалоб
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS complaints (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    title TEXT NOT NULL,
-                    category TEXT NOT NULL,
-                    description TEXT NOT NULL,
-                    status TEXT DEFAULT 'new',
-                    priority TEXT DEFAULT 'medium',
-                    assigned_to INTEGER,
-                    created_at TEXT NOT NULL,
-                    updated_at TEXT NOT NULL,
-                    resolved_at TEXT
-                )
-            """)
-            
-            # Таблица медицинских данных
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS medical_data (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    category TEXT NOT NULL,
-                    data_type TEXT NOT NULL,
-                    value TEXT NOT NULL,
-                    date_recorded TEXT NOT NULL,
-                    notes TEXT,
-                    created_at TEXT NOT NULL
-                )
-            """)
-            
-            # Создаем администратора по умолчанию
-            admin_password = "admin123"
-            await db.execute("""
-                INSERT OR IGNORE INTO users (username, password_hash, role, created_at) 
-                VALUES (?, ?, ?, ?)
-            """, ("admin", pwd_context.hash(admin_password), "admin", datetime.now().isoformat()))
-            
-            # Создаем базовые системные настройки
-            await db.execute("""
-                INSERT OR IGNORE INTO system_settings (setting_key, setting_value, description, updated_at) 
-                VALUES (?, ?, ?, ?)
-            """, ("site_name", "IDQR Platform", "Название сайта", datetime.now().isoformat()))
-            
-            await db.execute("""
-                INSERT OR IGNORE INTO system_settings (setting_key, setting_value, description, updated_at) 
-                VALUES (?, ?, ?, ?)
-            """, ("max_qr_per_user", "50", "Максимум QR-кодов на пользователя", datetime.now().isoformat()))
-            
-            await db.execute("""
-                INSERT OR IGNORE INTO system_settings (setting_key, setting_value, description, updated_at) 
-                VALUES (?, ?, ?, ?)
-            """, ("registration_enabled", "true", "Разрешена ли регистрация новых пользователей", datetime.now().isoformat()))
-            
+            # Схема уже актуальна — DDL и начальные данные пропускаются
+            if await db_schema.schema_version(db) != SCHEMA_VERSION:
+                await create_schema(db)
+                logger.info("База данных инициализирована")
+            await ensure_admin(db)
             await db.commit()
-            logger.info("База данных инициализирована")
     except Exception as e:
         logger.error(f"Ошибка при инициализации БД: {e}")
+    
+    try:
+        assets.activate(await asyncio.to_thread(assets.build, "static"))
+    except Exception as e:
+        # Шаблоны продолжат ссылаться на исходные файлы в static/css и static/js
+        logger.error(f"Ошибка при сборке ассетов: {e}")
+    
+    if os.environ.get("TEMPLATES_WARMUP") == "1":
+        try:
+            count, elapsed = await asyncio.to_thread(templating.warm_up, templates.env)
+            logger.info(f"Шаблоны загружены заранее: {count} за {elapsed * 1000:.0f} мс")
+        except Exception as e:
+            logger.error(f"Ошибка при прогреве шаблонов: {e}")
+    
+    reading_writer.start()
+    jobs.start()
+    webhook_dispatcher.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    scan_hub.close()
+    await reading_writer.stop()
+    await webhook_dispatcher.stop()
+    await jobs.stop()
+    await scan_cache.stop()
 
 # --- Функции аутентификации и утилиты ---
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password):
     if len(password) > 72:
         password = password[:72]
-    return pwd_context.hash(password)
+    return password_context().hash(password)
 
 async def check_ip_blocked(ip_address: str) -> bool:
     try:
@@ -204,15 +356,10 @@ async def check_ip_blocked(ip_address: str) -> bool:
             
             if result:
                 blocked_until = result[0]
+                # Истекшие блокировки удаляет задача планировщика expire_blocks
                 if blocked_until:
-                    if datetime.now() < datetime.fromisoformat(blocked_until):
-                        return True
-                    else:
-                        await db.execute("DELETE FROM blocked_ips WHERE ip_address = ?", (ip_address,))
-                        await db.commit()
-                        return False
-                else:
-                    return True
+                    return datetime.now() < datetime.fromisoformat(blocked_until)
+                return True
     except Exception as e:
         logger.error(f"Ошибка при проверке IP: {e}")
     
@@ -235,43 +382,37 @@ async def authenticate_user(username: str, password: str, ip_address: str):
             return {"error": "ip_blocked", "message": "Ваш IP-адрес заблокирован"}
         
         async with aiosqlite.connect(DB_PATH) as db:
-            cursor = await db.execute(
-                "SELECT * FROM users WHERE username = ?", 
+            user = await fetch_one(
+                db, LoginUser,
+                f"SELECT {columns(LoginUser)} FROM users WHERE username = ?",
                 (username,)
             )
-            user = await cursor.fetchone()
             
         if user:
-            if user[7]:
+            if user.is_blocked:
                 return {"error": "blocked", "message": "Ваш аккаунт заблокирован за нарушения"}
             
-            if user[8]:
-                freeze_until = datetime.fromisoformat(user[8])
+            # Истекшую заморозку снимает задача планировщика expire_blocks
+            if user.frozen_until:
+                freeze_until = datetime.fromisoformat(user.frozen_until)
                 if datetime.now() < freeze_until:
                     return {
                         "error": "frozen", 
                         "message": f"Ваш аккаунт заморожен за нарушения. Разблокировка через: {freeze_until.strftime('%d.%m.%Y %H:%M')}"
                     }
-                else:
-                    async with aiosqlite.connect(DB_PATH) as db:
-                        await db.execute(
-                            "UPDATE users SET frozen_until = NULL WHERE id = ?",
-                            (user[0],)
-                        )
-                        await db.commit()
             
-            if not user[4]:
+            if not user.is_active:
                 return {"error": "inactive", "message": "Ваш аккаунт деактивирован"}
             
-            if verify_password(password, user[2]):
+            if verify_password(password, user.password_hash):
                 async with aiosqlite.connect(DB_PATH) as db:
                     await db.execute(
                         "UPDATE users SET ip_address = ?, last_login = ? WHERE id = ?",
-                        (ip_address, datetime.now().isoformat(), user[0])
+                        (ip_address, datetime.now().isoformat(), user.id)
                     )
                     await db.commit()
                 
-                await log_action(user[0], "login", "Успешный вход в систему", ip_address)
+                await log_action(user.id, "login", "Успешный вход в систему", ip_address)
                 return user
         
         await log_action(None, "failed_login", f"Неудачная попытка входа для пользователя {username}", ip_address)
@@ -289,30 +430,32 @@ async def get_current_user(request: Request):
             return {"error": "ip_blocked", "message": "Ваш IP-адрес заблокирован"}
         
         if user_id:
-            async with aiosqlite.connect(DB_PATH) as db:
-                cursor = await db.execute("SELECT * FROM users WHERE id = ?", (user_id,))
-                user = await cursor.fetchone()
+            # Изменения из админки сбрасывают кэш (см. app/accounts.py)
+            user = accounts.user_cache.get(user_id)
+            if user is None:
+                async with aiosqlite.connect(DB_PATH) as db:
+                    user = await fetch_one(
+                        db, SessionUser,
+                        f"SELECT {columns(SessionUser)} FROM users WHERE id = ?",
+                        (user_id,)
+                    )
+                if user:
+                    accounts.user_cache.put(user)
             
             if user:
-                if user[7]:
+                if user.is_blocked:
                     return {"error": "blocked", "message": "Ваш аккаунт заблокирован за нарушения"}
                 
-                if user[8]:
-                    freeze_until = datetime.fromisoformat(user[8])
+                # Истекшую заморозку снимает задача планировщика expire_blocks
+                if user.frozen_until:
+                    freeze_until = datetime.fromisoformat(user.frozen_until)
                     if datetime.now() < freeze_until:
                         return {
                             "error": "frozen", 
                             "message": f"Ваш аккаунт заморожен за нарушения. Разблокировка через: {freeze_until.strftime('%d.%m.%Y %H:%M')}"
                         }
-                    else:
-                        async with aiosqlite.connect(DB_PATH) as db:
-                            await db.execute(
-                                "UPDATE users SET frozen_until = NULL WHERE id = ?",
-                                (user[0],)
-                            )
-                            await db.commit()
                 
-                if not user[4]:
+                if not user.is_active:
                     return {"error": "inactive", "message": "Ваш аккаунт деактивирован"}
                 
                 return user
@@ -436,7 +579,7 @@ async def home(request: Request):
     
     user = await get_current_user(request)
     if user and not isinstance(user, dict):
-        if user[3] == "admin":
+        if user.role == "admin":
             return RedirectResponse(url="/dashboard/qr", status_code=303)
         else:
             return RedirectResponse(url="/user/dashboard", status_code=303)
@@ -459,14 +602,16 @@ async def home(request: Request):
 async def login(request: Request, code: str = Form(...)):
     if code == ADMIN_CODE:
         async with aiosqlite.connect(DB_PATH) as db:
-            cursor = await db.execute("SELECT * FROM users WHERE username = 'admin'")
-            admin_user = await cursor.fetchone()
+            admin_user = await fetch_one(
+                db, SessionUser,
+                f"SELECT {columns(SessionUser)} FROM users WHERE username = 'admin'"
+            )
         
         if admin_user:
-            request.session["user_id"] = admin_user[0]
-            request.session["user_role"] = admin_user[3]
+            request.session["user_id"] = admin_user.id
+            request.session["user_role"] = admin_user.role
             
-            await log_action(admin_user[0], "admin_login", "Вход администратора через код", get_client_ip(request))
+            await log_action(admin_user.id, "admin_login", "Вход администратора через код", get_client_ip(request))
             
             return RedirectResponse(url="/dashboard/qr", status_code=303)
     
@@ -508,8 +653,8 @@ async def user_login(
                 "module": module
             })
     elif result:
-        request.session["user_id"] = result[0]
-        request.session["user_role"] = result[3]
+        request.session["user_id"] = result.id
+        request.session["user_role"] = result.role
         
         if module:
             return RedirectResponse(url=f"/scan/modules/{module}", status_code=303)
@@ -537,7 +682,7 @@ async def check_admin(request: Request):
     user = await get_current_user(request)
     if isinstance(user, dict):
         return user
-    if not user or user[3] != "admin":
+    if not user or user.role != "admin":
         return RedirectResponse(url="/", status_code=303)
     return user
 
@@ -555,7 +700,7 @@ async def check_ip_access(request: Request):
         return user
     if not user:
         return RedirectResponse(url="/user/login", status_code=303)
-    if user[3] not in ["ip", "admin"]:
+    if user.role not in ["ip", "admin"]:
         return RedirectResponse(url="/user/dashboard", status_code=303)
     return user
 
@@ -567,12 +712,19 @@ async def dashboard_qr(request: Request):
         return user
     
     try:
-        async with aiosqlite.connect(DB_PATH) as db:
-            if user[3] == "admin":
-                cursor = await db.execute("SELECT * FROM qr_codes ORDER BY id DESC")
-            else:
-                cursor = await db.execute("SELECT * FROM qr_codes WHERE user_id = ? ORDER BY id DESC", (user[0],))
-            qr_list = await cursor.fetchall()
+        if user.role == "admin":
+            async with analytics_reader.session() as db:
+                qr_list = await fetch_all(
+                    db, QRListItem,
+                    f"SELECT {columns(QRListItem)} FROM qr_codes ORDER BY id DESC"
+                )
+        else:
+            async with aiosqlite.connect(DB_PATH) as db:
+                qr_list = await fetch_all(
+                    db, QRListItem,
+                    f"SELECT {columns(QRListItem)} FROM qr_codes WHERE user_id = ? ORDER BY id DESC",
+                    (user.id,)
+                )
         
         return templates.TemplateResponse("qr.html", {
             "request": request,
@@ -583,7 +735,12 @@ async def dashboard_qr(request: Request):
             "user": user
         })
     except Exception as e:
-        logger.error(f"Ошибка при загрузке QR-кодов: {e}")
+        if isinstance(e, analytics.AnalyticsUnavailable):
+            logger.warning(f"Список QR-кодов не загружен: {e}")
+            error = str(e)
+        else:
+            logger.error(f"Ошибка при загрузке QR-кодов: {e}")
+            error = "Ошибка при загрузке данных"
         return templates.TemplateResponse("qr.html", {
             "request": request,
             "qr_list": [],
@@ -591,9 +748,101 @@ async def dashboard_qr(request: Request):
             "qr_title": None,
             "active": "qr",
             "user": user,
-            "error": "Ошибка при загрузке данных"
+            "error": error
         })
 
+@app.get("/dashboard/qr/live")
+async def dashboard_qr_live(request: Request):
+    """Прирост счетчиков сканирований QR-кодов пользователя (text/event-stream)."""
+    user = await check_ip_access(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+
+    if not scan_hub.accepting:
+        return Response(status_code=503, headers={"Retry-After": "30"})
+    return StreamingResponse(
+        scan_hub.stream(None if user.role == "admin" else user.id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def render_qr_image(scan_url: str, title: str, qr_color: str, text_color: str,
+                    logo_path: Optional[str] = None):
+    """Изображение QR-кода с подписью над ним (сохранение — на вызывающем).
+
+    С логотипом коррекция ошибок повышается до H, чтобы код читался
+    несмотря на закрытый логотипом центр.
+    """
+    # qrcode и Pillow импортируются при первой отрисовке: воркер стартует без них
+    import qrcode
+    from PIL import Image, ImageDraw, ImageFont
+
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_H if logo_path else qrcode.constants.ERROR_CORRECT_L,
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(scan_url)
+    qr.make(fit=True)
+
+    qr_img = qr.make_image(fill_color=qr_color, back_color="white").convert("RGB")
+    if logo_path:
+        logos.embed(qr_img, logo_path, qr.modules_count * qr.box_size)
+
+    try:
+        font = ImageFont.truetype("static/fonts/RobotoSlab-Bold.ttf", 28)
+    except IOError:
+        font = ImageFont.load_default()
+
+    max_chars_per_line = 20
+    wrapped_text = textwrap.fill(title, width=max_chars_per_line)
+    lines = wrapped_text.split('\n')
+
+    line_height = 30
+    text_height = len(lines) * line_height + 20
+
+    new_img = Image.new("RGB", (qr_img.width, qr_img.height + text_height), "white")
+    new_img.paste(qr_img, (0, text_height))
+
+    draw = ImageDraw.Draw(new_img)
+    y = 10
+    for line in lines:
+        text_bbox = draw.textbbox((0, 0), line, font=font)
+        text_width = text_bbox[2] - text_bbox[0]
+        text_x = (new_img.width - text_width) // 2
+        draw.text((text_x, y), line, font=font, fill=text_color)
+        y += line_height
+    return new_img
+
+async def restore_qr_files(db, qr_ids: list):
+    """Перерисовывает PNG для QR-кодов, чьи файлы пропали (вызывается сверкой файлов)"""
+    restored = set()
+    for start in range(0, len(qr_ids), 500):
+        batch = qr_ids[start:start + 500]
+        cursor = await db.execute(f"""
+            SELECT q.id, q.title, q.data, q.filename, q.colors, q.qr_type, q.short_code, u.logo_url
+            FROM qr_codes q LEFT JOIN users u ON u.id = q.user_id
+            WHERE q.id IN ({','.join('?' * len(batch))})
+        """, batch)
+        for qr_id, title, data, filename, colors, qr_type, short_code, logo_url in await cursor.fetchall():
+            # Общий файл нескольких QR-кодов рисуется один раз
+            if filename in restored:
+                continue
+            restored.add(filename)
+            colors = json.loads(colors) if colors else {}
+            if qr_type == "module":
+                scan_url = scan.short_scan_url(BASE_URL, short_code) if short_code else f"{BASE_URL}/scan/{qr_id}"
+            else:
+                scan_url = data
+            with metrics.QR_RENDER_LATENCY.time("restore"):
+                new_img = await asyncio.to_thread(
+                    render_qr_image, scan_url, title, colors.get("qr_color", "#000000"),
+                    colors.get("text_color", "#000000"), logos.qr_variant_path(logo_url, LOGOS_FOLDER)
+                )
+                await asyncio.to_thread(qrfiles.write_png, new_img, QR_FOLDER, filename)
+    logger.warning(f"Перерисовано QR-кодов без файлов: {len(qr_ids)}")
+
 # --- Генерация QR ---
 @app.post("/generate_qr")
 async def generate_qr(
@@ -609,9 +858,9 @@ async def generate_qr(
         return user
     
     try:
-        if user[3] != "admin":
+        if user.role != "admin":
             async with aiosqlite.connect(DB_PATH) as db:
-                cursor = await db.execute("SELECT COUNT(*) FROM qr_codes WHERE user_id = ?", (user[0],))
+                cursor = await db.execute("SELECT COUNT(*) FROM qr_codes WHERE user_id = ?", (user.id,))
                 qr_count = await cursor.fetchone()
                 
                 cursor = await db.execute("SELECT setting_value FROM system_settings WHERE setting_key = 'max_qr_per_user'")
@@ -647,9 +896,6 @@ async def generate_qr(
         else:
             data = qrdata
         
-        filename = f"{uuid.uuid4()}.png"
-        filepath = os.path.join(QR_FOLDER, filename)
-
         colors_json = json.dumps({
             "qr_color": qr_color,
             "bg_color": "#FFFFFF",
@@ -657,58 +903,41 @@ async def generate_qr(
         })
 
         async with aiosqlite.connect(DB_PATH) as db:
+            cursor = await db.execute("SELECT logo_url FROM users WHERE id = ?", (user.id,))
+            logo_path = logos.qr_variant_path((await cursor.fetchone())[0], LOGOS_FOLDER)
             now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             cursor = await db.execute(
-                "INSERT INTO qr_codes (title, data, filename, created_at, colors, user_id, qr_type) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                (title, data, filename, now, colors_json, user[0], qr_type)
+                "INSERT INTO qr_codes (title, data, filename, created_at, colors, user_id, qr_type) VALUES (?, ?, '', ?, ?, ?, ?)",
+                (title, data, now, colors_json, user.id, qr_type)
             )
-            await db.commit()
             qr_id = cursor.lastrowid
+            short_code = await scan.assign_short_code(db, qr_id)
 
-        # Генерируем QR-код со ссылкой на сканирование
-        if qr_type == "module":
-            scan_url = f"{BASE_URL}/scan/{qr_id}"
-        else:
-            scan_url = data
-        
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(scan_url)
-        qr.make(fit=True)
-        
-        qr_img = qr.make_image(fill_color=qr_color, back_color="white").convert("RGB")
-        
+            # Генерируем QR-код со ссылкой на сканирование
+            if qr_type == "module":
+                scan_url = scan.short_scan_url(BASE_URL, short_code)
+            else:
+                scan_url = data
+            
+            # Имя по содержимому: такой же QR-код уже мог быть нарисован (см. app/qrfiles.py)
+            filename = qrfiles.content_filename(scan_url, title, qr_color, text_color, logo_path)
+            await db.execute("UPDATE qr_codes SET filename = ? WHERE id = ?", (filename, qr_id))
+            await db.commit()
+        # id мог попасть в кэш сканирований как несуществующий
+        scan_cache.invalidate(qr_id)
+
+        # Картинка рисуется после фиксации, вне блокировки записи; без нее QR-код не остается
+        render = functools.partial(render_qr_image, scan_url, title, qr_color, text_color, logo_path)
         try:
-            font = ImageFont.truetype("static/fonts/RobotoSlab-Bold.ttf", 28)
-        except IOError:
-            font = ImageFont.load_default()
-        
-        max_chars_per_line = 20
-        wrapped_text = textwrap.fill(title, width=max_chars_per_line)
-        lines = wrapped_text.split('\n')
-        
-        line_height = 30
-        text_height = len(lines) * line_height + 20
-        
-        new_img = Image.new("RGB", (qr_img.width, qr_img.height + text_height), "white")
-        new_img.paste(qr_img, (0, text_height))
-        
-        draw = ImageDraw.Draw(new_img)
-        y = 10
-        for line in lines:
-            text_bbox = draw.textbbox((0, 0), line, font=font)
-            text_width = text_bbox[2] - text_bbox[0]
-            text_x = (new_img.width - text_width) // 2
-            draw.text((text_x, y), line, font=font, fill=text_color)
-            y += line_height
-        
-        new_img.save(filepath)
+            await qrfiles.ensure(QR_FOLDER, filename, render, "create")
+        except Exception:
+            async with aiosqlite.connect(DB_PATH) as db:
+                await db.execute("DELETE FROM qr_codes WHERE id = ?", (qr_id,))
+                await db.commit()
+            scan_cache.invalidate(qr_id)
+            raise
 
-        await log_action(user[0], "qr_create", f"Создан QR-код: {title} (тип: {qr_type})")
+        await log_action(user.id, "qr_create", f"Создан QR-код: {title} (тип: {qr_type})")
         
         return RedirectResponse(url="/dashboard/qr", status_code=303)
     
@@ -716,66 +945,70 @@ async def generate_qr(
         logger.error(f"Ошибка при генерации QR-кода: {e}")
         return RedirectResponse(url="/dashboard/qr", status_code=303)
 
-# --- СКАНИРОВАНИЕ QR С ВЫБОРОМ ДОСТУПА ---
-@app.get("/scan/{qr_id}")
-async def scan_qr(qr_id: int, request: Request):
-    """Страница выбора способа доступа после сканирования QR-кода"""
+# --- ВЕБХУКИ ---
+async def render_webhooks(request: Request, user, error: Optional[str] = None):
+    async with aiosqlite.connect(DB_PATH) as db:
+        hooks = await webhooks.list_for_user(db, user.id)
+        cursor = await db.execute(
+            "SELECT id, title FROM qr_codes WHERE user_id = ? ORDER BY id DESC", (user.id,)
+        )
+        qr_options = await cursor.fetchall()
+    return templates.TemplateResponse("webhooks.html", {
+        "request": request,
+        "user": user,
+        "webhooks": hooks,
+        "qr_options": qr_options,
+        "error": error,
+        "active": "webhooks"
+    })
+
+@app.get("/dashboard/webhooks", response_class=HTMLResponse)
+async def dashboard_webhooks(request: Request):
+    user = await check_ip_access(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    
+    try:
+        return await render_webhooks(request, user)
+    except Exception as e:
+        logger.error(f"Ошибка при загрузке вебхуков: {e}")
+        return RedirectResponse(url="/dashboard/qr", status_code=303)
+
+@app.post("/dashboard/webhooks/add")
+async def add_webhook(request: Request, url: str = Form(...), qr_id: str = Form("")):
+    user = await check_ip_access(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    
     try:
         async with aiosqlite.connect(DB_PATH) as db:
-            cursor = await db.execute("SELECT data, scan_count, qr_type FROM qr_codes WHERE id = ?", (qr_id,))
-            row = await cursor.fetchone()
-            
-            if row:
-                data, scan_count, qr_type = row
-                
-                # Увеличиваем счетчик сканирований
-                await db.execute(
-                    "UPDATE qr_codes SET scan_count = ?, last_scan = ? WHERE id = ?",
-                    (scan_count + 1, datetime.now().isoformat(), qr_id)
-                )
+            await webhooks.create(db, user.id, url, int(qr_id) if qr_id.isdigit() else None)
+            await db.commit()
+        await log_action(user.id, "webhook_add", f"Добавлен вебхук {url}", get_client_ip(request))
+    except ValueError as e:
+        return await render_webhooks(request, user, error=str(e))
+    except Exception as e:
+        logger.error(f"Ошибка при добавлении вебхука: {e}")
+    return RedirectResponse(url="/dashboard/webhooks", status_code=303)
+
+@app.post("/dashboard/webhooks/delete/{webhook_id}")
+async def delete_webhook(request: Request, webhook_id: int):
+    user = await check_ip_access(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    
+    try:
+        async with aiosqlite.connect(DB_PATH) as db:
+            if await webhooks.delete(db, user.id, webhook_id):
                 await db.commit()
-                
-                if qr_type == "module":
-                    # Получаем ID модуля и показываем страницу выбора доступа
-                    module_id = int(data)
-                    
-                    modules = {
-                        1: "Услуги и быт",
-                        2: "Одежда и мода",
-                        3: "Транспорт и авто",
-                        4: "Образование и школы",
-                        5: "Медицина и здоровье",
-                        6: "Стройка и объекты",
-                        7: "Бизнес и магазины",
-                        8: "Склад и логистика",
-                        9: "ЖКХ и дома",
-                        10: "События и вход",
-                        11: "Документы и удостоверения",
-                        12: "Госуслуги и учет",
-                        13: "Безопасность и контроль",
-                        14: "Реклама и аналитика",
-                        15: "Курсы и тренинги",
-                        16: "Подарки и сервис",
-                        17: "Маркетинг и бренды",
-                        18: "Квитанции и оплата",
-                        19: "Энергетика и инфраструктура"
-                    }
-                    
-                    module_name = modules.get(module_id, f"Модуль #{module_id}")
-                    
-                    return templates.TemplateResponse("module_access.html", {
-                        "request": request,
-                        "module_id": module_id,
-                        "module_name": module_name
-                    })
-                else:
-                    # Если это обычная ссылка, перенаправляем на нее
-                    return RedirectResponse(data)
-        
-        return RedirectResponse("/", status_code=303)
+                await log_action(user.id, "webhook_delete", f"Удален вебхук #{webhook_id}", get_client_ip(request))
     except Exception as e:
-        logger.error(f"Ошибка при сканировании QR-кода: {e}")
-        return RedirectResponse("/", status_code=303)
+        logger.error(f"Ошибка при удалении вебхука: {e}")
+    return RedirectResponse(url="/dashboard/webhooks", status_code=303)
+
+# --- СКАНИРОВАНИЕ QR С ВЫБОРОМ ДОСТУПА ---
+# GET /scan/<id> и /S/<код> обслуживает scan.ScanFastPath (см. scan_cache выше): редирект
+# на ссылку или страница выбора доступа к модулю, без сессий и роутинга FastAPI.
 
 # --- ГОСТЕВОЙ ДОСТУП К МОДУЛЮ ---
 @app.get("/module/{module_id}/guest", response_class=HTMLResponse)
@@ -834,16 +1067,19 @@ async def view_qr(request: Request, qr_id: int):
     
     try:
         async with aiosqlite.connect(DB_PATH) as db:
-            cursor = await db.execute("SELECT * FROM qr_codes WHERE id = ?", (qr_id,))
-            qr_code = await cursor.fetchone()
+            qr_code = await fetch_one(
+                db, QRCodeView,
+                f"SELECT {columns(QRCodeView)} FROM qr_codes WHERE id = ?",
+                (qr_id,)
+            )
             
             if not qr_code:
                 return RedirectResponse(url="/dashboard/qr", status_code=303)
                 
-            if user[3] != "admin" and qr_code[8] != user[0]:
+            if user.role != "admin" and qr_code.user_id != user.id:
                 return RedirectResponse(url="/dashboard/qr", status_code=303)
                 
-            qr_url = f"/static/qr/{qr_code[3]}"
+            qr_url = f"/static/qr/{qr_code.filename}"
             
             return templates.TemplateResponse("view_qr.html", {
                 "request": request,
@@ -865,16 +1101,19 @@ async def edit_qr_page(request: Request, qr_id: int):
     
     try:
         async with aiosqlite.connect(DB_PATH) as db:
-            cursor = await db.execute("SELECT * FROM qr_codes WHERE id = ?", (qr_id,))
-            qr_code = await cursor.fetchone()
+            qr_code = await fetch_one(
+                db, QRCodeView,
+                f"SELECT {columns(QRCodeView)} FROM qr_codes WHERE id = ?",
+                (qr_id,)
+            )
             
             if not qr_code:
                 return RedirectResponse(url="/dashboard/qr", status_code=303)
                 
-            if user[3] != "admin" and qr_code[8] != user[0]:
+            if user.role != "admin" and qr_code.user_id != user.id:
                 return RedirectResponse(url="/dashboard/qr", status_code=303)
             
-            colors = json.loads(qr_code[7]) if qr_code[7] else {"qr_color": "#000000", "bg_color": "#FFFFFF", "text_color": "#000000"}
+            colors = json.loads(qr_code.colors) if qr_code.colors else {"qr_color": "#000000", "bg_color": "#FFFFFF", "text_color": "#000000"}
             
             return templates.TemplateResponse("edit_qr.html", {
                 "request": request,
@@ -903,13 +1142,16 @@ async def update_qr(
     
     try:
         async with aiosqlite.connect(DB_PATH) as db:
-            cursor = await db.execute("SELECT * FROM qr_codes WHERE id = ?", (qr_id,))
-            old_qr = await cursor.fetchone()
+            old_qr = await fetch_one(
+                db, QROwnerRef,
+                f"SELECT {columns(QROwnerRef)} FROM qr_codes WHERE id = ?",
+                (qr_id,)
+            )
             
             if not old_qr:
                 return RedirectResponse(url="/dashboard/qr", status_code=303)
                 
-            if user[3] != "admin" and old_qr[8] != user[0]:
+            if user.role != "admin" and old_qr.user_id != user.id:
                 return RedirectResponse(url="/dashboard/qr", status_code=303)
             
             colors_json = json.dumps({
@@ -918,55 +1160,36 @@ async def update_qr(
                 "text_color": text_color
             })
             
+            # Логотип берется у владельца QR-кода
+            cursor = await db.execute("SELECT logo_url FROM users WHERE id = ?", (old_qr.user_id,))
+            owner = await cursor.fetchone()
+            logo_path = logos.qr_variant_path(owner[0] if owner else None, LOGOS_FOLDER)
+            
+            if old_qr.short_code:
+                scan_url = scan.short_scan_url(BASE_URL, old_qr.short_code)
+            else:
+                scan_url = f"{BASE_URL}/scan/{qr_id}"
+            
+            # Общий с другими QR-кодами файл не перезаписывается: строка переходит на файл
+            # нового содержимого, старый удаляется, если ссылок на него не осталось
+            filename = qrfiles.content_filename(scan_url, title, qr_color, text_color, logo_path)
             await db.execute(
-                "UPDATE qr_codes SET title = ?, data = ?, colors = ? WHERE id = ?",
-                (title, qrdata, colors_json, qr_id)
+                "UPDATE qr_codes SET title = ?, data = ?, colors = ?, filename = ? WHERE id = ?",
+                (title, qrdata, colors_json, filename, qr_id)
             )
+            if filename != old_qr.filename:
+                await qrfiles.release(db, QR_FOLDER, old_qr.filename)
             await db.commit()
-        
-        filename = old_qr[3]
-        filepath = os.path.join(QR_FOLDER, filename)
-        
-        scan_url = f"{BASE_URL}/scan/{qr_id}"
-        
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(scan_url)
-        qr.make(fit=True)
-        
-        qr_img = qr.make_image(fill_color=qr_color, back_color="white").convert("RGB")
-        
+        scan_cache.invalidate(qr_id)
+
+        # Отрисовка вне транзакции; если не удалась, пропавший файл перерисует сверка
+        render = functools.partial(render_qr_image, scan_url, title, qr_color, text_color, logo_path)
         try:
-            font = ImageFont.truetype("static/fonts/RobotoSlab-Bold.ttf", 28)
-        except IOError:
-            font = ImageFont.load_default()
-        
-        max_chars_per_line = 20
-        wrapped_text = textwrap.fill(title, width=max_chars_per_line)
-        lines = wrapped_text.split('\n')
-        
-        line_height = 30
-        text_height = len(lines) * line_height + 20
-        
-        new_img = Image.new("RGB", (qr_img.width, qr_img.height + text_height), "white")
-        new_img.paste(qr_img, (0, text_height))
-        
-        draw = ImageDraw.Draw(new_img)
-        y = 10
-        for line in lines:
-            text_bbox = draw.textbbox((0, 0), line, font=font)
-            text_width = text_bbox[2] - text_bbox[0]
-            text_x = (new_img.width - text_width) // 2
-            draw.text((text_x, y), line, font=font, fill=text_color)
-            y += line_height
-        
-        new_img.save(filepath)
+            await qrfiles.ensure(QR_FOLDER, filename, render, "update")
+        except Exception as e:
+            logger.error(f"Ошибка при отрисовке QR-кода {qr_id}: {e}")
 
-        await log_action(user[0], "qr_update", f"Обновлен QR-код: {title}")
+        await log_action(user.id, "qr_update", f"Обновлен QR-код: {title}")
         
         return RedirectResponse(url="/dashboard/qr", status_code=303)
     
@@ -983,21 +1206,20 @@ async def delete_qr(request: Request, qr_id: int):
     
     try:
         async with aiosqlite.connect(DB_PATH) as db:
-            cursor = await db.execute("SELECT user_id, title FROM qr_codes WHERE id = ?", (qr_id,))
-            qr_owner = await cursor.fetchone()
+            qr_owner = await fetch_one(
+                db, QROwnerRef,
+                f"SELECT {columns(QROwnerRef)} FROM qr_codes WHERE id = ?",
+                (qr_id,)
+            )
             
-            if qr_owner and (user[3] == "admin" or qr_owner[0] == user[0]):
-                cursor = await db.execute("SELECT filename FROM qr_codes WHERE id = ?", (qr_id,))
-                row = await cursor.fetchone()
-                if row:
-                    filename = row[0]
-                    path = os.path.join(QR_FOLDER, filename)
-                    if os.path.exists(path):
-                        os.remove(path)
-                    await db.execute("DELETE FROM qr_codes WHERE id = ?", (qr_id,))
-                    await db.commit()
-                    
-                    await log_action(user[0], "qr_delete", f"Удален QR-код: {qr_owner[1]}")
+            if qr_owner and (user.role == "admin" or qr_owner.user_id == user.id):
+                await db.execute("DELETE FROM qr_codes WHERE id = ?", (qr_id,))
+                # Файл может быть общим с другими QR-кодами: удаляется вместе с последней ссылкой
+                await qrfiles.release(db, QR_FOLDER, qr_owner.filename)
+                await db.commit()
+                scan_cache.invalidate(qr_id)
+                
+                await log_action(user.id, "qr_delete", f"Удален QR-код: {qr_owner.title}")
         
         return RedirectResponse(url="/dashboard/qr", status_code=303)
     except Exception as e:
@@ -1025,6 +1247,917 @@ async def user_modules(request: Request):
         "active": "modules"
     })
 
+# --- ЖАЛОБЫ ---
+@app.get("/user/energy/complaints", response_class=HTMLResponse)
+async def user_energy_complaints(request: Request):
+    user = await check_user_access(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    
+    return templates.TemplateResponse("energy_complaints.html", {
+        "request": request,
+        "user": user
+    })
+
+@app.get("/user/energy/complaints/new", response_class=HTMLResponse)
+async def complaint_form(request: Request):
+    user = await check_user_access(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    
+    return templates.TemplateResponse("complaint_form.html", {
+        "request": request,
+        "user": user
+    })
+
+@app.post("/user/energy/complaints/new", response_class=HTMLResponse)
+async def submit_complaint(
+    request: Request,
+    subject: str = Form(...),
+    message: str = Form(...),
+    category: str = Form("energy")
+):
+    user = await check_user_access(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    
+    subject = subject.strip()
+    message = message.strip()
+    if not subject or not message or len(subject) > 200 or len(message) > 5000:
+        return templates.TemplateResponse("complaint_form.html", {
+            "request": request,
+            "user": user,
+            "error": "Тема (до 200 символов) и описание (до 5000 символов) обязательны"
+        })
+    if category not in complaints.CATEGORIES:
+        category = "other"
+    
+    try:
+        async with aiosqlite.connect(DB_PATH) as db:
+            now = datetime.now().isoformat()
+            cursor = await db.execute(
+                """INSERT INTO complaints 
+                (user_id, title, category, description, status, priority, created_at, updated_at) 
+                VALUES (?, ?, ?, ?, 'new', 'medium', ?, ?)""",
+                (user.id, subject, category, message, now, now)
+            )
+            await db.commit()
+            complaint_id = cursor.lastrowid
+        
+        await log_action(user.id, "complaint_create", f"Подана жалоба #{complaint_id}: {subject}", get_client_ip(request))
+        
+        return templates.TemplateResponse("complaint_success.html", {
+            "request": request,
+            "user": user,
+            "message": f"Номер вашей жалобы: #{complaint_id}."
+        })
+    except Exception as e:
+        logger.error(f"Ошибка при подаче жалобы: {e}")
+        return templates.TemplateResponse("complaint_form.html", {
+            "request": request,
+            "user": user,
+            "error": "Ошибка при отправке жалобы"
+        })
+
+@app.get("/user/energy/complaints/status", response_class=HTMLResponse)
+async def complaint_status(request: Request):
+    user = await check_user_access(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    
+    try:
+        async with aiosqlite.connect(DB_PATH) as db:
+            items = await complaints.fetch_user_complaints(db, user.id)
+        
+        return templates.TemplateResponse("complaint_status.html", {
+            "request": request,
+            "user": user,
+            "complaints": items
+        })
+    except Exception as e:
+        logger.error(f"Ошибка при загрузке жалоб пользователя: {e}")
+        return templates.TemplateResponse("complaint_status.html", {
+            "request": request,
+            "user": user,
+            "complaints": [],
+            "error": "Ошибка при загрузке данных"
+        })
+
+@app.get("/api/complaints/{complaint_id}/status")
+async def complaint_status_api(request: Request, complaint_id: int):
+    """Статус одной жалобы (автор видит свои, администратор — любые)"""
+    user = await check_user_access(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    
+    async with aiosqlite.connect(DB_PATH) as db:
+        item = await complaints.fetch_status(
+            db, complaint_id, None if user.role == "admin" else user.id
+        )
+    
+    if not item:
+        raise HTTPException(status_code=404, detail="Жалоба не найдена")
+    
+    return {
+        "id": item.id,
+        "status": item.status,
+        "priority": item.priority,
+        "updated_at": item.updated_at,
+        "resolved_at": item.resolved_at,
+        "response": item.response
+    }
+
+@app.get("/dashboard/energy/complaints/admin", response_class=HTMLResponse)
+async def complaints_admin(
+    request: Request,
+    status: str = "new",
+    priority: Optional[str] = None,
+    after: Optional[str] = None
+):
+    """Очередь жалоб для администратора; страница отдается потоком"""
+    user = await check_admin(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    
+    if status not in complaints.STATUSES:
+        status = "new"
+    if priority not in complaints.PRIORITIES:
+        priority = None
+    
+    try:
+        async with analytics_reader.session() as db:
+            items, next_cursor = await complaints.fetch_queue(db, status, priority, after)
+            counters = await complaints.fetch_counters(db)
+            cursor = await db.execute(
+                "SELECT COUNT(*) FROM complaints WHERE status = 'new' AND priority = 'high'"
+            )
+            high_priority = (await cursor.fetchone())[0]
+            
+            user_ids = sorted({item.user_id for item in items if item.user_id})
+            usernames = {}
+            if user_ids:
+                cursor = await db.execute(
+                    f"SELECT id, username FROM users WHERE id IN ({','.join('?' * len(user_ids))})",
+                    user_ids
+                )
+                usernames = dict(await cursor.fetchall())
+    except analytics.AnalyticsUnavailable as e:
+        logger.warning(f"Очередь жалоб не загружена: {e}")
+        return templates.TemplateResponse("error.html", {
+            "request": request,
+            "error": str(e)
+        })
+    except Exception as e:
+        logger.error(f"Ошибка при загрузке очереди жалоб: {e}")
+        return templates.TemplateResponse("error.html", {
+            "request": request,
+            "error": "Ошибка при загрузке жалоб"
+        })
+    
+    template = templates.get_template("complaints_admin.html")
+    return StreamingResponse(template.generate({
+        "request": request,
+        "user": user,
+        "active": "complaints",
+        "complaints": items,
+        "next_cursor": next_cursor,
+        "counters": counters,
+        "high_priority": high_priority,
+        "usernames": usernames,
+        "status": status,
+        "priority": priority
+    }), media_type="text/html")
+
+@app.get("/api/complaints/queue")
+async def complaints_queue_api(
+    request: Request,
+    status: str = "new",
+    priority: Optional[str] = None,
+    after: Optional[str] = None,
+    assigned_to: Optional[int] = None,
+    limit: int = 50
+):
+    """Очередь жалоб с keyset-пагинацией (курсор — поле next)"""
+    user = await check_admin(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    
+    if status not in complaints.STATUSES:
+        raise HTTPException(status_code=400, detail="Неизвестный статус")
+    limit = max(1, min(limit, 200))
+    
+    try:
+        async with analytics_reader.session() as db:
+            if assigned_to is not None:
+                after_id = int(after) if after and after.isdigit() else 0
+                items = await complaints.fetch_assigned(db, assigned_to, status, after_id, limit)
+                next_cursor = str(items[-1].id) if len(items) == limit else None
+            else:
+                items, next_cursor = await complaints.fetch_queue(db, status, priority, after, limit)
+    except analytics.AnalyticsUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    return {
+        "items": [
+            {
+                "id": item.id,
+                "title": item.title,
+                "category": item.category,
+                "status": item.status,
+                "priority": item.priority,
+                "created_at": item.created_at,
+                "user_id": item.user_id,
+                "assigned_to": item.assigned_to
+            }
+            for item in items
+        ],
+        "next": next_cursor
+    }
+
+@app.post("/dashboard/complaints/{complaint_id}/status")
+async def update_complaint_status(
+    request: Request,
+    complaint_id: int,
+    status: str = Form(...),
+    priority: Optional[str] = Form(None),
+    assigned_to: Optional[int] = Form(None),
+    response: Optional[str] = Form(None)
+):
+    user = await check_admin(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    
+    if status not in complaints.STATUSES or (priority and priority not in complaints.PRIORITIES):
+        raise HTTPException(status_code=400, detail="Неизвестный статус или приоритет")
+    
+    now = datetime.now().isoformat()
+    resolved_at = now if status in complaints.CLOSED_STATUSES else None
+    
+    async with aiosqlite.connect(DB_PATH) as db:
+        cursor = await db.execute(
+            """UPDATE complaints SET 
+                status = ?,
+                priority = COALESCE(?, priority),
+                assigned_to = COALESCE(?, assigned_to),
+                response = COALESCE(?, response),
+                updated_at = ?,
+                resolved_at = ?
+            WHERE id = ?""",
+            (status, priority, assigned_to, response, now, resolved_at, complaint_id)
+        )
+        await db.commit()
+        if cursor.rowcount == 0:
+            raise HTTPException(status_code=404, detail="Жалоба не найдена")
+    
+    await log_action(user.id, "complaint_update", f"Жалоба #{complaint_id}: статус {status}", get_client_ip(request))
+    
+    return RedirectResponse(url=f"/dashboard/energy/complaints/admin?status={status}", status_code=303)
+
+# --- МЕДИЦИНСКИЕ ПОКАЗАТЕЛИ ---
+async def resolve_patient_id(user: SessionUser, user_id: Optional[int]) -> int:
+    """Чужие показатели доступны администратору и врачам с выданным администратором доступом.
+
+    Флаг is_medical_worker пользователь ставит себе сам при регистрации, доступа он не дает.
+    """
+    if user_id is None or user_id == user.id:
+        return user.id
+    if user.role == "admin":
+        return user_id
+    async with aiosqlite.connect(DB_PATH) as db:
+        if await medical.has_grant(db, user_id, user.id):
+            return user_id
+    raise HTTPException(status_code=403, detail="Нет доступа к данным пациента")
+
+async def read_json_limited(request: Request, limit: int):
+    """JSON тела запроса не больше limit байт; иначе 413"""
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > limit:
+        raise HTTPException(status_code=413, detail="Слишком большой запрос")
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > limit:
+            raise HTTPException(status_code=413, detail="Слишком большой запрос")
+    return json.loads(body)
+
+@app.get("/user/medicine", response_class=HTMLResponse)
+async def user_medicine(request: Request):
+    user = await check_user_access(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    
+    return templates.TemplateResponse("user_medicine.html", {
+        "request": request,
+        "user": user,
+        "active": "medicine"
+    })
+
+@app.post("/api/medical/readings")
+async def import_medical_readings(request: Request, user_id: Optional[int] = None):
+    """Пакетный импорт показаний (например, с носимых устройств)"""
+    user = await check_user_access(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    
+    patient_id = await resolve_patient_id(user, user_id)
+    try:
+        rows = medical.parse_readings(await read_json_limited(request, medical.MAX_IMPORT_BYTES))
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Ошибка в данных: {e}")
+    
+    try:
+        async with aiosqlite.connect(DB_PATH) as db:
+            imported = await medical.insert_readings(db, patient_id, rows)
+    except Exception as e:
+        logger.error(f"Ошибка при импорте медицинских показаний: {e}")
+        raise HTTPException(status_code=500, detail="Ошибка при сохранении показаний")
+    
+    await log_action(user.id, "medical_import", f"Импортировано показаний: {imported} (пациент {patient_id})", get_client_ip(request))
+    return {"imported": imported}
+
+@app.get("/api/medical/readings/{data_type}")
+async def medical_series(
+    request: Request,
+    data_type: str,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    points: int = 500,
+    bucket: Optional[int] = None,
+    user_id: Optional[int] = None
+):
+    """Ряд показателя за период, прореженный до min/max/avg по интервалам"""
+    user = await check_user_access(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    
+    patient_id = await resolve_patient_id(user, user_id)
+    if not medical.DATA_TYPE_RE.match(data_type):
+        raise HTTPException(status_code=400, detail="Некорректный тип показателя")
+    try:
+        end_ts = medical.parse_timestamp(end) if end else int(datetime.now().timestamp())
+        start_ts = medical.parse_timestamp(start) if start else end_ts - 30 * 86400
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректная дата")
+    if start_ts >= end_ts or (bucket is not None and bucket <= 0):
+        raise HTTPException(status_code=400, detail="Некорректный период")
+    
+    async with aiosqlite.connect(DB_PATH) as db:
+        series = await medical.fetch_series(db, patient_id, data_type, start_ts, end_ts, points, bucket)
+    
+    return {"data_type": data_type, "start": start_ts, "end": end_ts, **series}
+
+@app.get("/api/medical/readings/{data_type}/latest")
+async def medical_latest(request: Request, data_type: str, user_id: Optional[int] = None):
+    user = await check_user_access(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    
+    patient_id = await resolve_patient_id(user, user_id)
+    async with aiosqlite.connect(DB_PATH) as db:
+        row = await medical.fetch_latest(db, patient_id, data_type)
+    
+    if not row:
+        raise HTTPException(status_code=404, detail="Показаний нет")
+    return {"data_type": data_type, "date_recorded": row[0], "value": row[1]}
+
+@app.get("/dashboard/api/medical/grants")
+async def list_medical_grants(request: Request, patient_id: Optional[int] = None):
+    """Доступы врачей к данным пациентов"""
+    user = await check_admin(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    async with aiosqlite.connect(DB_PATH) as db:
+        return {"grants": await medical.list_grants(db, patient_id)}
+
+@app.post("/dashboard/api/medical/grants")
+async def add_medical_grant(request: Request):
+    """Выдает врачу доступ к пациенту. Тело: {"patient_id": ..., "clinician_id": ...}"""
+    user = await check_admin(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    try:
+        body = await request.json()
+        patient_id, clinician_id = int(body["patient_id"]), int(body["clinician_id"])
+    except (ValueError, TypeError, KeyError, AttributeError):
+        raise HTTPException(status_code=400, detail="Ожидаются patient_id и clinician_id")
+    async with aiosqlite.connect(DB_PATH) as db:
+        cursor = await db.execute(
+            "SELECT COUNT(*) FROM users WHERE id IN (?, ?)", (patient_id, clinician_id)
+        )
+        if (await cursor.fetchone())[0] != len({patient_id, clinician_id}) or patient_id == clinician_id:
+            raise HTTPException(status_code=400, detail="Некорректные пользователи")
+        await medical.grant(db, patient_id, clinician_id, user.id)
+    await log_action(user.id, "medical_grant", f"Доступ врача {clinician_id} к пациенту {patient_id}", get_client_ip(request))
+    return {"patient_id": patient_id, "clinician_id": clinician_id}
+
+@app.delete("/dashboard/api/medical/grants/{patient_id}/{clinician_id}")
+async def revoke_medical_grant(request: Request, patient_id: int, clinician_id: int):
+    user = await check_admin(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    async with aiosqlite.connect(DB_PATH) as db:
+        if not await medical.revoke(db, patient_id, clinician_id):
+            raise HTTPException(status_code=404, detail="Доступ не найден")
+    await log_action(user.id, "medical_revoke", f"Отозван доступ врача {clinician_id} к пациенту {patient_id}", get_client_ip(request))
+    return {"revoked": True}
+
+# --- ЭНЕРГЕТИКА: ПОКАЗАНИЯ СЧЕТЧИКОВ ---
+async def check_meter_access(db, user: SessionUser, meter_id: str):
+    cursor = await db.execute("SELECT user_id FROM energy_meters WHERE meter_id = ?", (meter_id,))
+    row = await cursor.fetchone()
+    if not row:
+        raise HTTPException(status_code=404, detail="Счетчик не найден")
+    if user.role != "admin" and row[0] != user.id:
+        raise HTTPException(status_code=403, detail="Нет доступа к счетчику")
+
+@app.get("/user/energy", response_class=HTMLResponse)
+async def user_energy(request: Request):
+    user = await check_user_access(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    
+    return templates.TemplateResponse("user_energy.html", {
+        "request": request,
+        "user": user,
+        "active": "energy"
+    })
+
+@app.post("/api/energy/readings")
+async def ingest_energy_readings(
+    request: Request,
+    file: UploadFile = File(...),
+    format: Optional[str] = Form(None),
+    resource: str = Form("electricity")
+):
+    """Прием пакета показаний (JSON Lines или CSV с колонками meter_id, ts, value[, resource])"""
+    user = await check_ip_access(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    
+    if resource not in energy.RESOURCES:
+        raise HTTPException(status_code=400, detail="Неизвестный ресурс")
+    fmt = format or ("csv" if (file.filename or "").lower().endswith(".csv") else "jsonl")
+    if fmt not in ("csv", "jsonl"):
+        raise HTTPException(status_code=400, detail="Поддерживаются форматы csv и jsonl")
+    
+    accepted = 0
+    rejected = 0
+    errors = []
+    chunk = []
+    
+    async def submit(rows):
+        nonlocal accepted, rejected
+        # Владельца счетчика проверяет писатель в транзакции записи пакета
+        result = await reading_writer.write(rows, user.id, check_owner=user.role != "admin")
+        accepted += len(rows) - result["rejected"]
+        rejected += result["rejected"]
+        if result["foreign"] and len(errors) < 10:
+            errors.append(f"Чужие счетчики: {', '.join(sorted(result['foreign'])[:5])}")
+        if result["expired"] and len(errors) < 10:
+            errors.append(f"Старше срока хранения: {result['expired']}")
+    
+    try:
+        line = 0
+        async for record in energy.iter_records(file, fmt):
+            line += 1
+            try:
+                chunk.append(energy.parse_reading(record, resource))
+            except (ValueError, TypeError, AttributeError) as e:
+                rejected += 1
+                if len(errors) < 10:
+                    errors.append(f"Запись {line}: {e}")
+                continue
+            if len(chunk) >= reading_writer.max_batch:
+                await submit(chunk)
+                chunk = []
+        if chunk:
+            await submit(chunk)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Ошибка разбора файла: {e}")
+    except Exception as e:
+        logger.error(f"Ошибка при приеме показаний счетчиков: {e}")
+        raise HTTPException(status_code=500, detail="Ошибка при сохранении показаний")
+    
+    await log_action(user.id, "energy_ingest", f"Принято показаний: {accepted}, отклонено: {rejected}", get_client_ip(request))
+    return {"accepted": accepted, "rejected": rejected, "errors": errors}
+
+@app.get("/api/energy/meters")
+async def energy_meters_api(request: Request):
+    user = await check_user_access(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    
+    async with aiosqlite.connect(DB_PATH) as db:
+        rows = await energy.fetch_meters(db, None if user.role == "admin" else user.id)
+    
+    return [
+        {"meter_id": meter_id, "user_id": owner_id, "resource": resource, "created_at": created_at}
+        for meter_id, owner_id, resource, created_at in rows
+    ]
+
+@app.get("/api/energy/meters/{meter_id}/daily")
+async def energy_meter_daily(request: Request, meter_id: str, start: Optional[str] = None, end: Optional[str] = None):
+    """Суточное потребление счетчика (из агрегатов)"""
+    user = await check_user_access(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    
+    end = end or (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+    start = start or (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
+    
+    async with aiosqlite.connect(DB_PATH) as db:
+        await check_meter_access(db, user, meter_id)
+        rows = await energy.fetch_daily(db, meter_id, start, end)
+    
+    return {
+        "meter_id": meter_id,
+        "days": [
+            {"day": day, "total": total, "min": low, "max": high, "count": count}
+            for day, total, low, high, count in rows
+        ]
+    }
+
+@app.get("/api/energy/meters/{meter_id}/readings")
+async def energy_meter_readings(request: Request, meter_id: str, start: str, end: str, limit: int = 10000):
+    """Сырые показания за период (для детализации графика)"""
+    user = await check_user_access(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    
+    try:
+        start_ts, end_ts = medical.parse_timestamp(start), medical.parse_timestamp(end)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректная дата")
+    if start_ts >= end_ts:
+        raise HTTPException(status_code=400, detail="Некорректный период")
+    
+    async with aiosqlite.connect(DB_PATH) as db:
+        await check_meter_access(db, user, meter_id)
+        rows = await energy.fetch_raw(db, meter_id, start_ts, end_ts, max(1, min(limit, 50000)))
+    
+    return {"meter_id": meter_id, "t": [row[0] for row in rows], "value": [row[1] for row in rows]}
+
+@app.get("/api/energy/analytics/monthly")
+async def energy_monthly_analytics(
+    request: Request,
+    resource: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None
+):
+    """Помесячное потребление по счетчикам пользователя (из агрегатов)"""
+    user = await check_user_access(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    
+    end = end or "9999-12"
+    start = start or f"{datetime.now().year - 1}-01"
+    
+    async with aiosqlite.connect(DB_PATH) as db:
+        meters = await energy.fetch_meters(db, user.id)
+        meter_ids = [row[0] for row in meters if resource is None or row[2] == resource]
+        rows = await energy.fetch_monthly(db, meter_ids, start, end)
+    
+    return {
+        "resource": resource,
+        "meters": len(meter_ids),
+        "months": [{"month": month, "total": total, "count": count} for month, total, count in rows]
+    }
+
+# --- ВЫГРУЗКА ДАННЫХ ---
+@app.get("/dashboard/export/{dataset}")
+async def export_dataset(
+    request: Request,
+    dataset: str,
+    format: str = "csv",
+    gzip: bool = False,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    user_id: Optional[int] = None
+):
+    """Потоковая выгрузка qr_codes, action_logs или users (без хэшей паролей)"""
+    user = await check_admin(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    
+    if dataset not in exports.DATASETS:
+        raise HTTPException(status_code=404, detail="Неизвестный набор данных")
+    if format not in ("csv", "jsonl"):
+        raise HTTPException(status_code=400, detail="Поддерживаются форматы csv и jsonl")
+    for value in (start, end):
+        if value:
+            try:
+                datetime.fromisoformat(value)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Даты ожидаются в формате ГГГГ-ММ-ДД")
+    if exports.export_slots.locked():
+        raise HTTPException(status_code=429, detail="Слишком много выгрузок одновременно, повторите позже")
+    
+    await log_action(user.id, "data_export", f"Выгрузка {dataset} ({format})", get_client_ip(request))
+    
+    filename = f"{dataset}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{format}"
+    media_type = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+    if gzip:
+        filename += ".gz"
+        media_type = "application/gzip"
+    
+    return StreamingResponse(
+        exports.stream_export(DB_PATH, dataset, format, gzip, start, end, user_id),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+# --- УПРАВЛЕНИЕ ПОЛЬЗОВАТЕЛЯМИ ---
+def user_filter(q: str, role: str, status: str) -> accounts.UserFilter:
+    flt = accounts.UserFilter(prefix=q.strip(), role=role or None, status=status or None)
+    flt.validate()
+    return flt
+
+@app.get("/dashboard/users", response_class=HTMLResponse)
+async def dashboard_users(request: Request, q: str = "", role: str = "", status: str = "", after: str = ""):
+    """Пользователи постранично: поиск по префиксу логина, фильтры по роли и статусу"""
+    user = await check_admin(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    
+    error = None
+    users_list = []
+    try:
+        flt = user_filter(q, role, status)
+        async with analytics_reader.session() as db:
+            users_list = await accounts.search(db, flt, after or None, accounts.PAGE_SIZE + 1)
+    except (ValueError, analytics.AnalyticsUnavailable) as e:
+        error = str(e)
+    except Exception as e:
+        logger.error(f"Ошибка при загрузке пользователей: {e}")
+        error = "Не удалось загрузить пользователей"
+    
+    next_after = None
+    if len(users_list) > accounts.PAGE_SIZE:
+        users_list = users_list[:accounts.PAGE_SIZE]
+        next_after = users_list[-1].username
+    
+    return templates.TemplateResponse("users.html", {
+        "request": request,
+        "user": user,
+        "users_list": users_list,
+        "q": q,
+        "role": role,
+        "status": status,
+        "next_after": next_after,
+        "now": datetime.now().isoformat(),
+        "error": error
+    })
+
+async def apply_user_action(request: Request, admin, action: str, **kwargs) -> int:
+    async with aiosqlite.connect(DB_PATH) as db:
+        return await accounts.bulk_update(db, action, admin.id, get_client_ip(request), **kwargs)
+
+@app.post("/dashboard/users/block/{user_id}")
+async def block_user(
+    request: Request,
+    user_id: int,
+    block_type: str = Form("permanent"),
+    block_duration: int = Form(1),
+    block_unit: str = Form("hours")
+):
+    user = await check_admin(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    
+    try:
+        if block_type == "temporary":
+            until = accounts.freeze_until(block_duration, block_unit)
+            await apply_user_action(request, user, "freeze", user_ids=[user_id], until=until)
+        else:
+            await apply_user_action(request, user, "block", user_ids=[user_id])
+    except ValueError as e:
+        logger.warning(f"Блокировка пользователя {user_id} отклонена: {e}")
+    except Exception as e:
+        logger.error(f"Ошибка при блокировке пользователя: {e}")
+    return RedirectResponse(url="/dashboard/users", status_code=303)
+
+@app.get("/dashboard/users/unblock/{user_id}")
+async def unblock_user(request: Request, user_id: int):
+    user = await check_admin(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    
+    try:
+        await apply_user_action(request, user, "unblock", user_ids=[user_id])
+    except Exception as e:
+        logger.error(f"Ошибка при разблокировке пользователя: {e}")
+    return RedirectResponse(url="/dashboard/users", status_code=303)
+
+@app.post("/dashboard/users/change_role/{user_id}")
+async def change_user_role(request: Request, user_id: int, new_role: str = Form(...)):
+    user = await check_admin(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    
+    try:
+        await apply_user_action(request, user, "role", user_ids=[user_id], role=new_role)
+    except ValueError as e:
+        logger.warning(f"Смена роли пользователя {user_id} отклонена: {e}")
+    except Exception as e:
+        logger.error(f"Ошибка при смене роли пользователя: {e}")
+    return RedirectResponse(url="/dashboard/users", status_code=303)
+
+@app.get("/dashboard/api/users")
+async def api_users(request: Request, q: str = "", role: str = "", status: str = "",
+                    after: str = "", limit: int = accounts.PAGE_SIZE):
+    """JSON-поиск пользователей; next — значение after для следующей страницы"""
+    user = await check_admin(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    try:
+        flt = user_filter(q, role, status)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    limit = max(1, min(limit, accounts.MAX_PAGE_SIZE))
+    try:
+        async with analytics_reader.session() as db:
+            rows = await accounts.search(db, flt, after or None, limit + 1)
+    except analytics.AnalyticsUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {
+        "users": rows[:limit],
+        "next": rows[limit - 1].username if len(rows) > limit else None
+    }
+
+@app.post("/dashboard/api/users/bulk")
+async def api_users_bulk(request: Request):
+    """Массовая операция одной транзакцией.
+
+    Тело: {"action": "block|unblock|freeze|role", "user_ids": [...]} или
+    {"action": ..., "filter": {"q": ..., "role": ..., "status": ...}};
+    для freeze — "duration" и "unit" (hours/days/weeks), для role — "role".
+    """
+    user = await check_admin(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    try:
+        body = await request.json()
+        action = body.get("action")
+        kwargs = {}
+        if "user_ids" in body:
+            kwargs["user_ids"] = [int(user_id) for user_id in body["user_ids"]]
+        elif "filter" in body:
+            f = body["filter"] or {}
+            kwargs["flt"] = user_filter(f.get("q", ""), f.get("role", ""), f.get("status", ""))
+        if action == "freeze":
+            kwargs["until"] = accounts.freeze_until(int(body.get("duration", 1)), body.get("unit", "hours"))
+        if action == "role":
+            kwargs["role"] = body.get("role")
+        affected = await apply_user_action(request, user, action, **kwargs)
+    except (ValueError, TypeError, AttributeError) as e:
+        raise HTTPException(status_code=400, detail=str(e) or "Некорректный запрос")
+    return {"action": action, "affected": affected}
+
+# --- РЕЗЕРВНЫЕ КОПИИ ---
+@app.post("/dashboard/backup")
+async def create_backup(request: Request):
+    """Онлайн-копия базы: шаги backup API, integrity_check, gzip (см. app/backup.py)"""
+    user = await check_admin(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    if backup_lock.locked():
+        raise HTTPException(status_code=409, detail="Резервная копия уже снимается")
+    async with backup_lock:
+        try:
+            result = await asyncio.to_thread(backup.snapshot, DB_PATH, BACKUP_DIR)
+            await asyncio.to_thread(backup.prune, BACKUP_DIR, BACKUP_KEEP)
+        except Exception as e:
+            logger.error(f"Ошибка при создании резервной копии: {e}")
+            raise HTTPException(status_code=500, detail="Не удалось создать резервную копию")
+    await log_action(user.id, "backup", f"Резервная копия {os.path.basename(result.path)}", get_client_ip(request))
+    return result.as_dict()
+
+@app.get("/dashboard/backups")
+async def list_backups(request: Request):
+    """Список сохраненных копий, новые первыми"""
+    user = await check_admin(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    return {"backups": backup.list_archives(BACKUP_DIR)}
+
+@app.get("/dashboard/backups/{name}")
+async def download_backup(request: Request, name: str):
+    user = await check_admin(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    path = backup.archive_path(BACKUP_DIR, name)
+    if not path:
+        raise HTTPException(status_code=404, detail="Резервная копия не найдена")
+    return FileResponse(path, media_type="application/gzip", filename=name)
+
+# --- НАСТРОЙКИ ПОЛЬЗОВАТЕЛЯ И ЛОГОТИП ---
+@app.get("/user/settings", response_class=HTMLResponse)
+async def user_settings(request: Request):
+    user = await check_user_access(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+
+    async with aiosqlite.connect(DB_PATH) as db:
+        settings_user = await fetch_one(
+            db, UserSettingsView,
+            f"SELECT {columns(UserSettingsView)} FROM users WHERE id = ?",
+            (user.id,)
+        )
+    return templates.TemplateResponse("user_settings.html", {
+        "request": request,
+        "user": settings_user
+    })
+
+@app.post("/user/settings/upload_logo")
+async def upload_logo(request: Request, logo: UploadFile = File(...)):
+    """Загрузка логотипа: проверка и уменьшение выполняются вне event loop"""
+    user = await check_user_access(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+
+    try:
+        data = await logo.read(logos.MAX_UPLOAD_BYTES + 1)
+        logo_url = await asyncio.to_thread(logos.process_upload, data, user.id, LOGOS_FOLDER)
+
+        async with aiosqlite.connect(DB_PATH) as db:
+            await db.execute("UPDATE users SET logo_url = ? WHERE id = ?", (logo_url, user.id))
+            await db.commit()
+
+        await log_action(user.id, "logo_upload", f"Загружен логотип: {logo.filename}", get_client_ip(request))
+    except logos.LogoError as e:
+        logger.warning(f"Отклонен логотип пользователя {user.id}: {e}")
+    except Exception as e:
+        logger.error(f"Ошибка при загрузке логотипа: {e}")
+
+    return RedirectResponse(url="/user/settings", status_code=303)
+
+# --- МЕТРИКИ ---
+@app.get("/metrics")
+async def metrics_endpoint(request: Request):
+    """Метрики в текстовом формате Prometheus"""
+    if not METRICS_PUBLIC:
+        authorized = bool(METRICS_TOKEN) and secrets.compare_digest(
+            request.headers.get("authorization", ""), f"Bearer {METRICS_TOKEN}"
+        )
+        if not authorized:
+            user = await get_current_user(request)
+            if isinstance(user, dict) or not user or user.role != "admin":
+                raise HTTPException(status_code=401, detail="Нужен токен метрик или вход администратора")
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+# --- ФОНОВЫЕ ЗАДАЧИ ---
+@app.get("/dashboard/jobs")
+async def list_jobs(request: Request):
+    """Задачи планировщика: последний запуск, длительность, ошибки и лидер"""
+    user = await check_admin(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    async with aiosqlite.connect(DB_PATH) as db:
+        return await jobs.status(db)
+
+# --- ПРОФИЛИ ЗАПРОСОВ ---
+@app.get("/dashboard/profiles")
+async def list_profiles(request: Request):
+    """Последние снятые профили запросов"""
+    user = await check_admin(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    return {"profiles": profiling.store.list()}
+
+@app.get("/dashboard/profiles/{profile_id}")
+async def profile_details(request: Request, profile_id: int):
+    """Профиль с SQL-запросами, отсортированными по времени"""
+    user = await check_admin(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    profile = profiling.store.get(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Профиль не найден")
+    queries = sorted(profile.queries, key=lambda q: q[1], reverse=True)
+    return {**profile.summary(), "sql": [{"sql": sql, "ms": ms} for sql, ms in queries]}
+
+@app.get("/dashboard/profiles/{profile_id}/download")
+async def download_profile(request: Request, profile_id: int, format: str = "collapsed"):
+    """Скачивание профиля: collapsed (flamegraph) или pstats"""
+    user = await check_admin(request)
+    if isinstance(user, RedirectResponse) or isinstance(user, dict):
+        return user
+    profile = profiling.store.get(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Профиль не найден")
+    if format == "pstats":
+        try:
+            content, media_type, suffix = profile.pstats_bytes(), "application/octet-stream", "prof"
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    elif format == "collapsed":
+        content, media_type, suffix = profile.collapsed(), "text/plain", "collapsed.txt"
+    else:
+        raise HTTPException(status_code=400, detail="Формат: collapsed или pstats")
+    return Response(content, media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="profile-{profile_id}.{suffix}"'
+    })
+
 # --- ДОБАВЛЕННЫЕ МАРШРУТЫ (добавь в самый конец файла, перед if __name__ == "__main__") ---
 
 @app.get("/account_frozen.html", response_class=HTMLResponse)
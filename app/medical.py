@@ -0,0 +1,324 @@
+"""Временные ряды медицинских показателей.
+
+Числовые показания (пульс, давление, глюкоза, данные с устройств) хранятся
+в ``medical_readings`` — таблице WITHOUT ROWID с первичным ключом
+(user_id, data_type, date_recorded). Строки одного ряда лежат в B-дереве
+подряд, поэтому выборка за период — один последовательный проход, а
+повторный импорт того же показания просто перезаписывает точку.
+``date_recorded`` хранится в секундах Unix, ``value`` — REAL.
+
+Для графиков ряд прореживается в SQL: на каждый интервал отдаются
+min/max/avg и число точек, так что в браузер уходят сотни значений вместо
+многолетней истории. Часовые и суточные агрегаты (``medical_rollups``)
+пересчитываются при импорте только для затронутых интервалов; выборки за
+длинные периоды читают их, а не сырые показания.
+
+Чужие показатели читает и пишет только администратор или врач, которому
+администратор выдал доступ к пациенту (``medical_grants``). Флаг
+``is_medical_worker`` отмечает сам пользователь при регистрации, поэтому
+доступа он не дает.
+
+Показания старой таблицы ``medical_data`` (``value TEXT``) переносит
+задача планировщика ``migrate_legacy`` пачками по id с водяным знаком в
+``scheduler_state``; нечисловые значения и строки без пользователя
+или с некорректным типом пропускаются и считаются в логе.
+"""
+import logging
+import math
+import re
+from datetime import datetime
+from typing import Optional
+
+from app import scheduler
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS medical_readings (
+        user_id INTEGER NOT NULL,
+        data_type TEXT NOT NULL,
+        date_recorded INTEGER NOT NULL,
+        value REAL NOT NULL,
+        PRIMARY KEY (user_id, data_type, date_recorded)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS medical_rollups (
+        user_id INTEGER NOT NULL,
+        data_type TEXT NOT NULL,
+        resolution INTEGER NOT NULL,
+        bucket INTEGER NOT NULL,
+        min_value REAL NOT NULL,
+        max_value REAL NOT NULL,
+        sum_value REAL NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (user_id, data_type, resolution, bucket)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS medical_grants (
+        patient_id INTEGER NOT NULL,
+        clinician_id INTEGER NOT NULL,
+        granted_by INTEGER,
+        created_at TEXT NOT NULL,
+        PRIMARY KEY (patient_id, clinician_id)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_medical_grants_clinician ON medical_grants(clinician_id)",
+    "CREATE INDEX IF NOT EXISTS idx_medical_data_series ON medical_data(user_id, data_type, date_recorded)",
+]
+
+HOUR = 3600
+DAY = 86400
+
+DATA_TYPE_RE = re.compile(r"^[a-z0-9_]{1,32}$")
+# «Круглые» размеры интервалов прореживания, в секундах
+BUCKET_STEPS = (60, 300, 900, 1800, HOUR, 3 * HOUR, 6 * HOUR, 12 * HOUR,
+                DAY, 7 * DAY, 30 * DAY)
+INSERT_BATCH = 1000
+MAX_POINTS = 2000
+MAX_IMPORT_BYTES = 5 * 1024 * 1024
+MIGRATE_BATCH = 5000
+
+
+async def init_schema(db):
+    for statement in SCHEMA:
+        await db.execute(statement)
+
+
+def parse_timestamp(value) -> int:
+    """Секунды Unix из числа или ISO-строки."""
+    if isinstance(value, bool):
+        raise ValueError("некорректная дата")
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str) and value.lstrip("-").isdigit():
+        return int(value)
+    return int(datetime.fromisoformat(str(value)).timestamp())
+
+
+def parse_readings(payload) -> list:
+    """Разбирает тело запроса импорта в кортежи (data_type, ts, value).
+
+    Поддерживаются два формата:
+    ``{"data_type": "pulse", "readings": [[ts, value], ...]}`` и
+    ``{"readings": [{"data_type": ..., "date_recorded": ..., "value": ...}]}``.
+    """
+    if not isinstance(payload, dict) or not isinstance(payload.get("readings"), list):
+        raise ValueError("ожидается объект с полем readings")
+    default_type = payload.get("data_type")
+    rows = []
+    for item in payload["readings"]:
+        if isinstance(item, (list, tuple)) and len(item) == 2:
+            data_type, recorded, value = default_type, item[0], item[1]
+        elif isinstance(item, dict):
+            data_type = item.get("data_type", default_type)
+            recorded, value = item.get("date_recorded"), item.get("value")
+        else:
+            raise ValueError("некорректная запись показания")
+        if not isinstance(data_type, str) or not DATA_TYPE_RE.match(data_type):
+            raise ValueError(f"некорректный тип показателя: {data_type!r}")
+        value = float(value)
+        if not math.isfinite(value):
+            raise ValueError("значение должно быть конечным числом")
+        rows.append((data_type, parse_timestamp(recorded), value))
+    return rows
+
+
+async def insert_readings(db, user_id: int, rows: list) -> int:
+    """Пакетная вставка в одной транзакции; повторы перезаписываются."""
+    sql = ("INSERT OR REPLACE INTO medical_readings (user_id, data_type, date_recorded, value) "
+           "VALUES (?, ?, ?, ?)")
+    for start in range(0, len(rows), INSERT_BATCH):
+        await db.executemany(
+            sql, [(user_id, *row) for row in rows[start:start + INSERT_BATCH]]
+        )
+
+    spans = {}
+    for data_type, recorded, _ in rows:
+        low, high = spans.get(data_type, (recorded, recorded))
+        spans[data_type] = (min(low, recorded), max(high, recorded))
+    for data_type, (low, high) in spans.items():
+        await refresh_rollups(db, user_id, data_type, low, high)
+    await db.commit()
+    return len(rows)
+
+
+async def refresh_rollups(db, user_id: int, data_type: str, low: int, high: int):
+    """Пересчитывает часовые и суточные агрегаты, покрывающие [low, high]."""
+    hour_start, hour_end = low // HOUR * HOUR, high // HOUR * HOUR + HOUR
+    await db.execute(
+        """INSERT OR REPLACE INTO medical_rollups
+        SELECT user_id, data_type, ?, date_recorded / ? * ?,
+               MIN(value), MAX(value), SUM(value), COUNT(*)
+        FROM medical_readings
+        WHERE user_id = ? AND data_type = ? AND date_recorded >= ? AND date_recorded < ?
+        GROUP BY date_recorded / ?""",
+        (HOUR, HOUR, HOUR, user_id, data_type, hour_start, hour_end, HOUR)
+    )
+    day_start, day_end = low // DAY * DAY, high // DAY * DAY + DAY
+    await db.execute(
+        """INSERT OR REPLACE INTO medical_rollups
+        SELECT user_id, data_type, ?, bucket / ? * ?,
+               MIN(min_value), MAX(max_value), SUM(sum_value), SUM(count)
+        FROM medical_rollups
+        WHERE user_id = ? AND data_type = ? AND resolution = ? AND bucket >= ? AND bucket < ?
+        GROUP BY bucket / ?""",
+        (DAY, DAY, DAY, user_id, data_type, HOUR, day_start, day_end, DAY)
+    )
+
+
+def pick_bucket(start: int, end: int, points: int) -> int:
+    """Наименьший «круглый» интервал, дающий не больше points точек."""
+    wanted = max(1, math.ceil((end - start) / max(points, 1)))
+    for step in BUCKET_STEPS:
+        if step >= wanted:
+            return step
+    return math.ceil(wanted / BUCKET_STEPS[-1]) * BUCKET_STEPS[-1]
+
+
+async def fetch_series(db, user_id: int, data_type: str, start: int, end: int,
+                       points: int = 500, bucket: Optional[int] = None) -> dict:
+    """Ряд за [start, end), прореженный до min/max/avg по интервалам.
+
+    Если интервал кратен часу или суткам, ряд собирается из агрегатов;
+    крайние интервалы тогда выравниваются по границе часа/суток.
+    """
+    points = max(1, min(points, MAX_POINTS))
+    bucket = bucket or pick_bucket(start, end, points)
+    resolution = next((r for r in (DAY, HOUR) if bucket % r == 0), None)
+    if resolution:
+        cursor = await db.execute(
+            """SELECT bucket / ? AS b, MIN(min_value), MAX(max_value),
+                      SUM(sum_value) / SUM(count), SUM(count)
+            FROM medical_rollups
+            WHERE user_id = ? AND data_type = ? AND resolution = ? AND bucket >= ? AND bucket < ?
+            GROUP BY b ORDER BY b""",
+            (bucket, user_id, data_type, resolution,
+             start // resolution * resolution, end)
+        )
+    else:
+        cursor = await db.execute(
+            """SELECT date_recorded / ? AS bucket, MIN(value), MAX(value), AVG(value), COUNT(*)
+            FROM medical_readings
+            WHERE user_id = ? AND data_type = ? AND date_recorded >= ? AND date_recorded < ?
+            GROUP BY bucket ORDER BY bucket""",
+            (bucket, user_id, data_type, start, end)
+        )
+    series = {"bucket": bucket, "t": [], "min": [], "max": [], "avg": [], "count": []}
+    for index, low, high, avg, count in await cursor.fetchall():
+        series["t"].append(index * bucket)
+        series["min"].append(low)
+        series["max"].append(high)
+        series["avg"].append(round(avg, 3))
+        series["count"].append(count)
+    return series
+
+
+async def fetch_latest(db, user_id: int, data_type: str):
+    """Последнее показание — один шаг по ключу с конца диапазона."""
+    cursor = await db.execute(
+        """SELECT date_recorded, value FROM medical_readings
+        WHERE user_id = ? AND data_type = ? ORDER BY date_recorded DESC LIMIT 1""",
+        (user_id, data_type)
+    )
+    return await cursor.fetchone()
+
+
+# --- Доступ к данным пациентов ---
+async def has_grant(db, patient_id: int, clinician_id: int) -> bool:
+    cursor = await db.execute(
+        "SELECT 1 FROM medical_grants WHERE patient_id = ? AND clinician_id = ?",
+        (patient_id, clinician_id)
+    )
+    row = await cursor.fetchone()
+    await cursor.close()
+    return row is not None
+
+
+async def grant(db, patient_id: int, clinician_id: int, admin_id: int):
+    await db.execute(
+        "INSERT OR IGNORE INTO medical_grants (patient_id, clinician_id, granted_by, created_at) "
+        "VALUES (?, ?, ?, ?)",
+        (patient_id, clinician_id, admin_id, datetime.now().isoformat())
+    )
+    await db.commit()
+
+
+async def revoke(db, patient_id: int, clinician_id: int) -> bool:
+    cursor = await db.execute(
+        "DELETE FROM medical_grants WHERE patient_id = ? AND clinician_id = ?",
+        (patient_id, clinician_id)
+    )
+    await db.commit()
+    return cursor.rowcount > 0
+
+
+async def list_grants(db, patient_id: Optional[int] = None) -> list:
+    sql = "SELECT patient_id, clinician_id, granted_by, created_at FROM medical_grants"
+    params = ()
+    if patient_id is not None:
+        sql += " WHERE patient_id = ?"
+        params = (patient_id,)
+    cursor = await db.execute(sql + " ORDER BY patient_id, clinician_id", params)
+    names = [d[0] for d in cursor.description]
+    return [dict(zip(names, row)) for row in await cursor.fetchall()]
+
+
+# --- Перенос medical_data ---
+def convert_legacy(rows: list) -> tuple:
+    """Строки medical_data -> (кортежи для medical_readings, число пропущенных)."""
+    converted, skipped = [], 0
+    for user_id, data_type, value, recorded in rows:
+        data_type = (data_type or "").strip().lower()
+        try:
+            if user_id is None or not DATA_TYPE_RE.match(data_type):
+                raise ValueError(data_type)
+            number = float(str(value).strip().replace(",", "."))
+            if not math.isfinite(number):
+                raise ValueError(value)
+            converted.append((user_id, data_type, parse_timestamp(recorded), number))
+        except (ValueError, TypeError, OverflowError):
+            skipped += 1
+    return converted, skipped
+
+
+async def migrate_legacy(db):
+    """Задача планировщика: переносит medical_data в medical_readings пачками.
+
+    Уже импортированные через API точки не перезаписываются (INSERT OR IGNORE);
+    после переноса задача сводится к одному чтению водяного знака.
+    """
+    done = int(await scheduler.get_state(db, "migrate_medical_data_id", "0"))
+    cursor = await db.execute("SELECT COALESCE(MAX(id), 0) FROM medical_data")
+    upper = (await cursor.fetchone())[0]
+    await cursor.close()
+    migrated = skipped = 0
+    while done < upper:
+        cursor = await db.execute(
+            "SELECT id, user_id, data_type, value, date_recorded FROM medical_data "
+            f"WHERE id > ? ORDER BY id LIMIT {MIGRATE_BATCH}",
+            (done,)
+        )
+        rows = await cursor.fetchall()
+        if not rows:
+            break
+        converted, batch_skipped = convert_legacy([row[1:] for row in rows])
+        await db.executemany(
+            "INSERT OR IGNORE INTO medical_readings (user_id, data_type, date_recorded, value) "
+            "VALUES (?, ?, ?, ?)", converted
+        )
+        spans = {}
+        for user_id, data_type, recorded, _ in converted:
+            low, high = spans.get((user_id, data_type), (recorded, recorded))
+            spans[(user_id, data_type)] = (min(low, recorded), max(high, recorded))
+        for (user_id, data_type), (low, high) in spans.items():
+            await refresh_rollups(db, user_id, data_type, low, high)
+        done = rows[-1][0]
+        await scheduler.set_state(db, "migrate_medical_data_id", str(done))
+        await db.commit()
+        migrated += len(converted)
+        skipped += batch_skipped
+    if migrated or skipped:
+        logger.info(f"Перенесено показаний из medical_data: {migrated}, пропущено некорректных: {skipped}")
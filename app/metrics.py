@@ -0,0 +1,264 @@
+"""Метрики в текстовом формате Prometheus без внешних зависимостей.
+
+Счетчики и гистограммы хранятся в словарях по кортежу меток, поэтому
+запись одной метрики — поиск в словаре и пара сложений. ``MetricsMiddleware``
+меряет каждый HTTP-запрос и подписывает его шаблоном маршрута
+(``/scan/{qr_id}``), а не фактическим путем, чтобы число рядов не росло.
+``instrument_aiosqlite`` оборачивает ``execute``/``executemany`` и пишет
+время запросов, именуя их по глаголу и таблице (``select qr_codes``).
+"""
+import logging
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+import aiosqlite
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        '%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+
+
+class Gauge:
+    """Значение снимается в момент выдачи /metrics через callback."""
+
+    def __init__(self, name: str, documentation: str, callback):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} gauge"
+        yield f"{self.name} {self.callback()}"
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def count(self, *labels) -> int:
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield (f"{self.name}_bucket"
+                       f"{_format_labels(self.labelnames + ('le',), labels + (le,))} {cumulative}")
+            suffix = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{suffix} {total}"
+            yield f"{self.name}_count{suffix} {cumulative}"
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def gauge(self, name: str, documentation: str, callback):
+        return self.register(Gauge(name, documentation, callback))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "idqr_http_requests_total", "HTTP-запросы по маршруту и коду ответа",
+    ("method", "route", "status")))
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    "idqr_http_request_duration_seconds", "Время обработки HTTP-запроса",
+    ("method", "route")))
+DB_QUERY_LATENCY = REGISTRY.register(Histogram(
+    "idqr_db_query_duration_seconds", "Время выполнения SQL-запроса (execute/executemany)",
+    ("query",)))
+QR_RENDER_LATENCY = REGISTRY.register(Histogram(
+    "idqr_qr_render_duration_seconds", "Время отрисовки PNG QR-кода",
+    ("kind",)))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "idqr_cache_requests_total", "Обращения к кэшам приложения",
+    ("cache", "result")))
+LOGGED_ERRORS = REGISTRY.register(Counter(
+    "idqr_logged_errors_total", "Ошибки, записанные в лог (в том числе перехваченные)",
+    ("logger",)))
+
+
+def cache_hit(cache: str):
+    CACHE_REQUESTS.inc(cache, "hit")
+
+
+def cache_miss(cache: str):
+    CACHE_REQUESTS.inc(cache, "miss")
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: число запросов и гистограмма времени по маршрутам."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            route = scope.get("route")
+            # Для Mount (например, /static) маршрута нет, но есть root_path
+            path = route.path if route is not None else (scope.get("root_path") or "<unmatched>")
+            HTTP_REQUESTS.inc(scope["method"], path, status)
+            HTTP_LATENCY.observe(elapsed, scope["method"], path)
+
+
+class ErrorCountingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+
+    def emit(self, record):
+        LOGGED_ERRORS.inc(record.name)
+
+
+# Список, в который пишутся (sql, секунды) запросов текущего HTTP-запроса;
+# устанавливается профилировщиком, в остальное время None
+QUERY_CAPTURE = ContextVar("idqr_query_capture", default=None)
+
+_TABLE_KEYWORDS = {"FROM", "INTO", "UPDATE", "TABLE", "INDEX", "TRIGGER"}
+_SKIP_WORDS = {"IF", "NOT", "EXISTS", "OR", "REPLACE", "IGNORE", "ABORT"}
+_query_names = {}
+
+
+def query_name(sql: str) -> str:
+    """Короткое имя запроса для метки: «select qr_codes», «pragma»."""
+    name = _query_names.get(sql)
+    if name is None:
+        tokens = sql.split()
+        verb = tokens[0].lower() if tokens else "other"
+        table = None
+        if verb != "pragma":
+            for position, token in enumerate(tokens):
+                if token.upper() in _TABLE_KEYWORDS:
+                    rest = [t for t in tokens[position + 1:] if t.upper() not in _SKIP_WORDS]
+                    if rest and rest[0].upper() not in _TABLE_KEYWORDS:
+                        table = rest[0].split("(")[0].strip('"`[],;').lower()
+                        break
+        name = f"{verb} {table}" if table else verb
+        # Динамический SQL не должен раздувать кэш и число рядов без предела
+        if len(_query_names) < 10000:
+            _query_names[sql] = name
+    return name
+
+
+def instrument_aiosqlite():
+    """Оборачивает aiosqlite.Connection.execute/executemany замером времени."""
+    if getattr(aiosqlite.Connection, "_idqr_instrumented", False):
+        return
+    execute = aiosqlite.Connection.execute
+    executemany = aiosqlite.Connection.executemany
+
+    def record(sql, started):
+        elapsed = time.perf_counter() - started
+        DB_QUERY_LATENCY.observe(elapsed, query_name(sql))
+        capture = QUERY_CAPTURE.get()
+        if capture is not None:
+            capture.append((sql, round(elapsed * 1000, 3)))
+
+    async def timed_execute(self, sql, parameters=None):
+        started = time.perf_counter()
+        try:
+            return await execute(self, sql, parameters)
+        finally:
+            record(sql, started)
+
+    async def timed_executemany(self, sql, parameters):
+        started = time.perf_counter()
+        try:
+            return await executemany(self, sql, parameters)
+        finally:
+            record(sql, started)
+
+    aiosqlite.Connection.execute = timed_execute
+    aiosqlite.Connection.executemany = timed_executemany
+    aiosqlite.Connection._idqr_instrumented = True
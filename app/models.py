@@ -0,0 +1,127 @@
+"""Компактные модели строк БД.
+
+Каждая модель описывает ровно те колонки, которые нужны конкретному
+сценарию (проверка сессии, список QR на дашборде, просмотр QR), поэтому
+запросы выбирают только их вместо ``SELECT *``. Экземпляры строятся прямо
+из курсора через ``row_factory`` и за счет ``__slots__`` не несут ``__dict__``.
+"""
+from dataclasses import dataclass, fields
+from functools import lru_cache
+from typing import Optional
+
+
+@lru_cache(maxsize=None)
+def columns(model) -> str:
+    """Список колонок модели для подстановки в SELECT."""
+    return ", ".join(f.name for f in fields(model))
+
+
+@lru_cache(maxsize=None)
+def row_factory(model):
+    """row_factory для sqlite3/aiosqlite, собирающий строку в модель."""
+    def factory(cursor, row):
+        return model(*row)
+    return factory
+
+
+async def fetch_one(db, model, sql: str, params=()):
+    cursor = await db.execute(sql, params)
+    cursor.row_factory = row_factory(model)
+    return await cursor.fetchone()
+
+
+async def fetch_all(db, model, sql: str, params=()):
+    cursor = await db.execute(sql, params)
+    cursor.row_factory = row_factory(model)
+    return await cursor.fetchall()
+
+
+# --- Пользователи ---
+@dataclass(slots=True)
+class SessionUser:
+    """Текущий пользователь: проверки доступа и шапка страниц."""
+    id: int
+    username: str
+    role: str
+    is_active: bool
+    is_blocked: bool
+    frozen_until: Optional[str]
+    theme: str
+    is_medical_worker: bool
+
+
+@dataclass(slots=True)
+class UserSettingsView(SessionUser):
+    """Страница настроек пользователя."""
+    logo_url: Optional[str]
+    created_at: str
+    last_login: Optional[str]
+
+
+@dataclass(slots=True)
+class LoginUser(SessionUser):
+    """Пользователь при входе — единственный сценарий, где нужен хэш."""
+    password_hash: str
+
+
+@dataclass(slots=True)
+class AdminUserRow:
+    """Строка списка пользователей в админке (без хэша пароля)."""
+    id: int
+    username: str
+    role: str
+    is_active: bool
+    created_at: str
+    last_login: Optional[str]
+    is_blocked: bool
+    frozen_until: Optional[str]
+    block_count: Optional[int]
+    ip_address: Optional[str]
+
+
+# --- QR-коды ---
+@dataclass(slots=True)
+class QRListItem:
+    """Карточка QR-кода в списке на дашборде."""
+    id: int
+    title: str
+    data: str
+    filename: str
+    created_at: str
+    scan_count: int
+    last_scan: Optional[str]
+    qr_type: str
+
+
+@dataclass(slots=True)
+class QRCodeView(QRListItem):
+    """QR-код на страницах просмотра и редактирования."""
+    colors: Optional[str]
+    user_id: Optional[int]
+
+
+@dataclass(slots=True)
+class QROwnerRef:
+    """Минимум данных для проверки владельца при изменении/удалении."""
+    id: int
+    user_id: Optional[int]
+    title: str
+    filename: str
+    short_code: Optional[str]
+
+
+# --- Вебхуки ---
+@dataclass(slots=True)
+class WebhookView:
+    """Подписка на странице вебхуков с числом неотправленных событий."""
+    id: int
+    qr_id: Optional[int]
+    qr_title: Optional[str]
+    url: str
+    secret: str
+    is_active: bool
+    created_at: str
+    failures: int
+    last_error: Optional[str]
+    last_delivery_at: Optional[str]
+    pending: int
@@ -0,0 +1,233 @@
+"""Выборочное профилирование запросов.
+
+Включается переменными окружения; если ни одна не задана, middleware
+вообще не добавляется в приложение и ничего не стоит:
+
+* ``PROFILE_SAMPLE_RATE`` — доля профилируемых запросов (например, 0.01);
+* ``PROFILE_ROUTES`` — регулярное выражение по пути (``^/dashboard/qr``);
+* ``PROFILE_TOKEN`` — профилировать запросы с заголовком ``X-Profile: <токен>``;
+* ``PROFILE_MODE`` — ``cprofile`` (по умолчанию) или ``sample``: поток,
+  который раз в ``PROFILE_INTERVAL_MS`` снимает стек потока event loop;
+* ``PROFILE_KEEP`` — сколько последних профилей хранить (20).
+
+К профилю прикладываются все SQL-запросы, выполненные в контексте запроса,
+с их временем. Профилировщик видит весь поток event loop, поэтому если
+параллельно шли другие запросы, их работа тоже попадет в профиль.
+"""
+import cProfile
+import itertools
+import marshal
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+
+from fastapi.middleware import Middleware
+
+from app import metrics
+
+MAX_QUERIES = 1000
+
+
+@dataclass(slots=True)
+class RequestProfile:
+    id: int
+    method: str
+    path: str
+    route: Optional[str]
+    status: int
+    started_at: str
+    duration_ms: float
+    mode: str
+    trigger: str
+    queries: list
+    stats: Optional[dict] = None                        # cProfile: данные pstats
+    stacks: Counter = field(default_factory=Counter)    # sample: свернутые стеки
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "mode": self.mode,
+            "trigger": self.trigger,
+            "queries": len(self.queries),
+            "sql_ms": round(sum(elapsed for _, elapsed in self.queries), 3),
+        }
+
+    def pstats_bytes(self) -> bytes:
+        """Файл в формате pstats.Stats.dump_stats (открывается snakeviz и т.п.)."""
+        if self.stats is None:
+            raise ValueError("профиль снят в режиме sample, pstats недоступен")
+        return marshal.dumps(self.stats)
+
+    def collapsed(self) -> str:
+        """Свернутые стеки для flamegraph.pl / speedscope.
+
+        В режиме cProfile полных стеков нет: строки — пары
+        «вызывающий;вызываемый» с собственным временем в микросекундах.
+        """
+        if self.stats is None:
+            return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+        lines = []
+        for func, (_, _, tottime, _, callers) in self.stats.items():
+            name = _label(*func)
+            total_calls = sum(c[0] for c in callers.values()) or 1
+            if not callers:
+                lines.append(f"{name} {round(tottime * 1e6)}")
+            for caller, (calls, *_rest) in callers.items():
+                weight = round(tottime * 1e6 * calls / total_calls)
+                if weight:
+                    lines.append(f"{_label(*caller)};{name} {weight}")
+        return "\n".join(lines) + "\n"
+
+
+def _label(filename: str, lineno: int, name: str) -> str:
+    return f"{os.path.basename(filename)}:{name}" if lineno else name
+
+
+class ProfileStore:
+    """Кольцевой буфер последних профилей."""
+
+    def __init__(self, keep: int):
+        self._profiles = deque(maxlen=keep)
+        self._ids = itertools.count(1)
+
+    def next_id(self) -> int:
+        return next(self._ids)
+
+    def add(self, profile: RequestProfile):
+        self._profiles.append(profile)
+
+    def get(self, profile_id: int) -> Optional[RequestProfile]:
+        return next((p for p in self._profiles if p.id == profile_id), None)
+
+    def list(self) -> list:
+        return [p.summary() for p in reversed(self._profiles)]
+
+
+store = ProfileStore(int(os.environ.get("PROFILE_KEEP", "20")))
+
+
+class _StackSampler(threading.Thread):
+    """Снимает стек заданного потока через sys._current_frames()."""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+class ProfilingMiddleware:
+    def __init__(self, app, sample_rate: float = 0.0, route_pattern: Optional[str] = None,
+                 token: Optional[str] = None, mode: str = "cprofile", interval: float = 0.005):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.route_pattern = re.compile(route_pattern) if route_pattern else None
+        self.token = token.encode() if token else None
+        self.mode = mode
+        self.interval = interval
+        self.busy = False
+
+    def _trigger(self, scope) -> Optional[str]:
+        if self.token:
+            for name, value in scope["headers"]:
+                if name == b"x-profile" and value == self.token:
+                    return "header"
+        if self.route_pattern and self.route_pattern.search(scope["path"]):
+            return "route"
+        if self.sample_rate and random.random() < self.sample_rate:
+            return "sample"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        trigger = self._trigger(scope) if scope["type"] == "http" else None
+        # Профилировщик на поток один: пока идет один профиль, другие не начинаем
+        if trigger is None or self.busy:
+            await self.app(scope, receive, send)
+            return
+        self.busy = True
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        queries = []
+        token = metrics.QUERY_CAPTURE.set(queries)
+        profiler = sampler = None
+        if self.mode == "sample":
+            sampler = _StackSampler(threading.get_ident(), self.interval)
+            sampler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        started_at = datetime.now().isoformat(timespec="milliseconds")
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - started
+            metrics.QUERY_CAPTURE.reset(token)
+            route = scope.get("route")
+            profile = RequestProfile(
+                id=store.next_id(), method=scope["method"], path=scope["path"],
+                route=route.path if route is not None else None, status=status,
+                started_at=started_at, duration_ms=round(duration * 1000, 3),
+                mode=self.mode, trigger=trigger, queries=queries[:MAX_QUERIES],
+            )
+            if profiler is not None:
+                profiler.disable()
+                profiler.create_stats()
+                profile.stats = profiler.stats
+            else:
+                sampler.stop()
+                profile.stacks = sampler.stacks
+            store.add(profile)
+            self.busy = False
+
+
+def middleware_from_env() -> list:
+    """Middleware для FastAPI(middleware=...); пустой список, если выключено."""
+    sample_rate = float(os.environ.get("PROFILE_SAMPLE_RATE", "0") or 0)
+    route_pattern = os.environ.get("PROFILE_ROUTES") or None
+    token = os.environ.get("PROFILE_TOKEN") or None
+    if not (sample_rate or route_pattern or token):
+        return []
+    mode = os.environ.get("PROFILE_MODE", "cprofile")
+    if mode not in ("cprofile", "sample"):
+        raise ValueError(f"PROFILE_MODE: ожидается cprofile или sample, получено {mode!r}")
+    return [Middleware(
+        ProfilingMiddleware, sample_rate=sample_rate, route_pattern=route_pattern, token=token,
+        mode=mode, interval=float(os.environ.get("PROFILE_INTERVAL_MS", "5")) / 1000,
+    )]
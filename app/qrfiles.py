@@ -0,0 +1,304 @@
+"""Файлы PNG QR-кодов: шардирование, атомарная запись и сверка с БД.
+
+Новые файлы лежат в подкаталогах по первым двум символам имени
+(``static/qr/3f/3f9c…png``, 256 каталогов), в ``qr_codes.filename``
+хранится путь относительно ``static/qr``, поэтому ссылки
+``/static/qr/{{ filename }}`` в шаблонах не меняются. Файл пишется во
+временный ``.<имя>.<случайно>.tmp`` в том же каталоге и подменяется
+через ``os.replace``: читатель видит либо старую картинку, либо новую,
+но не наполовину записанную.
+
+Порядок операций в обработчиках: строка фиксируется, затем ``ensure``
+вне транзакции проверяет файл и при необходимости рисует его в потоке
+(отрисовка занимает десятки миллисекунд, а открытая транзакция держала
+бы все это время блокировку записи). Строка без файла существует только
+эти миллисекунды; если отрисовка не удалась, новую строку обработчик
+удаляет, а измененную перерисует сверка. ``reconcile`` (задача
+планировщика) сверяет каталог с индексом по ``filename`` в обе стороны:
+удаляет файлы без строк и брошенные временные файлы старше ``grace``,
+переносит файлы старого плоского формата в подкаталоги и передает строки
+без файлов в ``repair``, который перерисовывает их.
+
+Повторно используемый файл ``ensure`` «трогает» (обновляет mtime), а
+сверка перед удалением заново проверяет mtime каждого кандидата: файл,
+который только что получил новую ссылку, не моложе ``grace`` не будет,
+даже если сверка прочитала строки до фиксации этой ссылки. Если же сверка
+успела удалить файл до ``ensure``, тот нарисует его заново; строку, чей
+файл пропал между проверкой mtime и удалением, перерисует следующий проход.
+
+Имя файла новых QR-кодов — хэш всего, что влияет на картинку
+(``content_filename``: содержимое кода, подпись, цвета, логотип, версия
+отрисовки), поэтому одинаковые QR-коды разных пользователей делят один
+файл, а повторное создание не рисует картинку заново. Число ссылок на
+файл — число строк ``qr_codes`` с этим ``filename`` (по индексу), так что
+отдельный счетчик не может разойтись со строками. ``release`` удаляет
+файл, когда на него не осталось ссылок; вызывается в той же транзакции,
+что и удаление или изменение строки, до фиксации: пока транзакция держит
+блокировку записи, другой обработчик не может сослаться на этот файл,
+а если фиксация не удалась, пропавший файл перерисует сверка.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import secrets
+import time
+from itertools import islice
+from typing import Awaitable, Callable, Optional
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+SHARD_LENGTH = 2
+# Увеличивать при любом изменении отрисовки: новые QR-коды получат новые файлы
+RENDER_VERSION = 1
+TMP_SUFFIX = ".tmp"
+SCAN_BATCH = 500
+REPAIR_LIMIT = 1000                  # перерисовок за один проход сверки
+SHARDS = [f"{i:0{SHARD_LENGTH}x}" for i in range(16 ** SHARD_LENGTH)]
+_SHARD_SET = frozenset(SHARDS)
+
+SCHEMA = [
+    "CREATE INDEX IF NOT EXISTS idx_qr_codes_filename ON qr_codes(filename)",
+]
+
+
+async def init_schema(db):
+    for statement in SCHEMA:
+        await db.execute(statement)
+
+
+def content_filename(scan_url: str, title: str, qr_color: str, text_color: str,
+                     logo_path: Optional[str] = None) -> str:
+    """Имя файла по содержимому картинки: одинаковые QR-коды получают один файл."""
+    key = json.dumps([RENDER_VERSION, scan_url, title, qr_color.lower(), text_color.lower(),
+                      os.path.basename(logo_path) if logo_path else None], ensure_ascii=False)
+    name = f"{hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]}.png"
+    return f"{name[:SHARD_LENGTH]}/{name}"
+
+
+def path_of(folder: str, filename: str) -> str:
+    return os.path.join(folder, *filename.split("/"))
+
+
+def _ensure(folder: str, filename: str, render: Callable) -> bool:
+    try:
+        # Свежий mtime защищает повторно используемый файл от сверки (см. _remove_stale)
+        os.utime(path_of(folder, filename))
+        return False
+    except FileNotFoundError:
+        write_png(render(), folder, filename)
+        return True
+
+
+async def ensure(folder: str, filename: str, render: Callable, kind: str) -> bool:
+    """Гарантирует файл после фиксации строки; True — файл нарисован заново.
+
+    ``render()`` возвращает изображение и выполняется в потоке, как и запись.
+    """
+    started = time.perf_counter()
+    rendered = await asyncio.to_thread(_ensure, folder, filename, render)
+    if rendered:
+        metrics.cache_miss("qr_images")
+        metrics.QR_RENDER_LATENCY.observe(time.perf_counter() - started, kind)
+    else:
+        metrics.cache_hit("qr_images")
+    return rendered
+
+
+def write_png(image, folder: str, filename: str):
+    """Атомарно записывает картинку: временный файл и os.replace."""
+    path = path_of(folder, filename)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, f".{os.path.basename(path)}.{secrets.token_hex(4)}{TMP_SUFFIX}")
+    try:
+        with open(tmp_path, "xb") as f:
+            image.save(f, format="PNG")
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def remove(folder: str, filename: str):
+    """Удаляет файл; неудача не страшна — остаток уберет reconcile."""
+    try:
+        os.remove(path_of(folder, filename))
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Не удалось удалить файл QR {filename}: {e}")
+
+
+async def references(db, filename: str) -> int:
+    cursor = await db.execute("SELECT COUNT(*) FROM qr_codes WHERE filename = ?", (filename,))
+    count = (await cursor.fetchone())[0]
+    await cursor.close()
+    return count
+
+
+async def release(db, folder: str, filename: str) -> bool:
+    """Удаляет файл, если на него больше не ссылается ни одна строка.
+
+    Вызывать после удаления или изменения строки, до фиксации транзакции.
+    """
+    if await references(db, filename):
+        return False
+    await asyncio.to_thread(remove, folder, filename)
+    return True
+
+
+# --- Сверка с БД ---
+def _take(entries, count: int) -> list:
+    """Следующие count записей каталога: (имя, файл ли, mtime)."""
+    batch = []
+    for entry in islice(entries, count):
+        is_file = entry.is_file(follow_symlinks=False)
+        batch.append((entry.name, is_file, entry.stat().st_mtime if is_file else 0.0))
+    return batch
+
+
+def _list_dir(path: str) -> list:
+    try:
+        with os.scandir(path) as entries:
+            return [(e.name, e.stat().st_mtime) for e in entries if e.is_file(follow_symlinks=False)]
+    except FileNotFoundError:
+        return []
+
+
+def _remove_stale(paths: list, cutoff: float) -> list:
+    """Удаляет файлы, если они все еще старше cutoff; возвращает удаленные имена."""
+    removed = []
+    for path in paths:
+        try:
+            # Между листингом и удалением файл мог получить ссылку (ensure обновляет mtime)
+            if os.stat(path).st_mtime >= cutoff:
+                continue
+            os.remove(path)
+            removed.append(os.path.basename(path))
+        except OSError:
+            pass
+    return removed
+
+
+def _is_temp(name: str) -> bool:
+    return name.startswith(".") and name.endswith(TMP_SUFFIX)
+
+
+def _count_removed(stats: dict, names: list):
+    for name in names:
+        stats["temp_files" if _is_temp(name) else "orphan_files"] += 1
+
+
+def _check_flat_rows(folder: str, rows: list):
+    """Строки с именем без подкаталога: (перелинковать, без файла)."""
+    relink, missing = [], []
+    for qr_id, filename in rows:
+        sharded = f"{filename[:SHARD_LENGTH]}/{filename}"
+        if filename[:SHARD_LENGTH] in _SHARD_SET and os.path.exists(path_of(folder, sharded)):
+            # Файл перенесли, а строку обновить не успели
+            relink.append((sharded, qr_id))
+        elif not os.path.exists(path_of(folder, filename)):
+            missing.append((qr_id, filename))
+    return relink, missing
+
+
+def _migrate(folder: str, moves: list):
+    for name in moves:
+        directory = os.path.join(folder, name[:SHARD_LENGTH])
+        os.makedirs(directory, exist_ok=True)
+        os.replace(os.path.join(folder, name), os.path.join(directory, name))
+
+
+async def reconcile(db, folder: str, grace: float = 3600.0,
+                    repair: Optional[Callable[..., Awaitable]] = None) -> dict:
+    """Сверяет static/qr с qr_codes.filename; возвращает счетчики исправлений."""
+    stats = {"orphan_files": 0, "temp_files": 0, "migrated": 0, "relinked": 0, "missing_files": 0}
+    if not os.path.isdir(folder):
+        return stats
+    cutoff = time.time() - grace
+
+    # Корень: брошенные временные файлы и файлы старого плоского формата
+    entries = os.scandir(folder)
+    try:
+        while True:
+            batch = await asyncio.to_thread(_take, entries, SCAN_BATCH)
+            if not batch:
+                break
+            stale, flat = [], []
+            for name, is_file, mtime in batch:
+                if not is_file:
+                    continue
+                if _is_temp(name):
+                    if mtime < cutoff:
+                        stale.append(os.path.join(folder, name))
+                elif name.endswith(".png"):
+                    flat.append((name, mtime))
+            if flat:
+                cursor = await db.execute(
+                    f"SELECT id, filename FROM qr_codes WHERE filename IN ({','.join('?' * len(flat))})",
+                    [name for name, _ in flat]
+                )
+                known = {filename: qr_id for qr_id, filename in await cursor.fetchall()}
+                # Имена не из uuid (не шестнадцатеричные) остаются в корне
+                moves = [name for name, _ in flat if name in known and name[:SHARD_LENGTH] in _SHARD_SET]
+                orphans = [name for name, mtime in flat if name not in known and mtime < cutoff]
+                stale.extend(os.path.join(folder, name) for name in orphans)
+                if moves:
+                    await asyncio.to_thread(_migrate, folder, moves)
+                    await db.executemany(
+                        "UPDATE qr_codes SET filename = ? WHERE id = ?",
+                        [(f"{name[:SHARD_LENGTH]}/{name}", known[name]) for name in moves]
+                    )
+                    await db.commit()
+                    stats["migrated"] += len(moves)
+            if stale:
+                _count_removed(stats, await asyncio.to_thread(_remove_stale, stale, cutoff))
+    finally:
+        entries.close()
+
+    # Шарды (все, даже без каталога): файлы без строк и строки без файлов по диапазону индекса
+    missing = []
+    for shard in SHARDS:
+        directory = os.path.join(folder, shard)
+        files = dict(await asyncio.to_thread(_list_dir, directory))
+        cursor = await db.execute(
+            "SELECT id, filename FROM qr_codes WHERE filename >= ? AND filename < ?",
+            (f"{shard}/", f"{shard}0")
+        )
+        rows = await cursor.fetchall()
+        names = {filename[SHARD_LENGTH + 1:] for _, filename in rows}
+        stale = []
+        for name, mtime in files.items():
+            if name in names or mtime >= cutoff:
+                continue
+            stale.append(os.path.join(directory, name))
+        if stale:
+            _count_removed(stats, await asyncio.to_thread(_remove_stale, stale, cutoff))
+        missing.extend((qr_id, filename) for qr_id, filename in rows
+                       if filename[SHARD_LENGTH + 1:] not in files)
+
+    # Строки старого формата, чьих файлов нет в корне
+    cursor = await db.execute("SELECT id, filename FROM qr_codes WHERE filename NOT LIKE '%/%'")
+    relink, lost = await asyncio.to_thread(_check_flat_rows, folder, await cursor.fetchall())
+    missing.extend(lost)
+    if relink:
+        await db.executemany("UPDATE qr_codes SET filename = ? WHERE id = ?", relink)
+        await db.commit()
+        stats["relinked"] = len(relink)
+
+    # Файл мог появиться после листинга: перед перерисовкой проверяем еще раз
+    missing = [qr_id for qr_id, filename in missing
+               if not os.path.exists(path_of(folder, filename))]
+    stats["missing_files"] = len(missing)
+    if missing and repair is not None:
+        await repair(db, missing[:REPAIR_LIMIT])
+    if any(stats.values()):
+        logger.info(f"Сверка файлов QR: {stats}")
+    return stats
@@ -0,0 +1,181 @@
+"""Ограничение частоты запросов на публичных маршрутах.
+
+``/scan/<id>``, ``/S/<код>`` и ``/module/<id>/guest`` доступны без входа,
+и перебор id подряд нагружает кэш сканирований и БД напрямую.
+``RateLimitMiddleware`` стоит снаружи всего стека, в том числе снаружи
+``ScanFastPath``: запрос сверх лимита получает готовый ответ 429 без
+обращения к кэшу, сессии и БД.
+
+Лимит — token bucket: в среднем ``rate`` запросов в секунду и до
+``burst`` подряд. Ведер два: по адресу клиента и по его подсети (/24 для
+IPv4, /64 для IPv6), чтобы бот не обходил лимит, перебирая адреса одной
+сети; лимит подсети выше, потому что за одной подсетью бывает много
+людей (NAT оператора, Wi-Fi площадки). Ведра у каждого маршрута свои и
+лежат в общем LRU на ``max_entries`` ключей: память ограничена, а
+вытесненный (давно не приходивший) клиент начинает с полного ведра.
+
+Лимиты задаются переменными окружения ``RATE_LIMIT_SCAN`` и
+``RATE_LIMIT_GUEST`` в виде ``rate:burst:prefix_rate:prefix_burst``
+(например, ``10:30:100:300``); ``off`` отключает лимит маршрута.
+"""
+import ipaddress
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from app import metrics
+from app.scan import SCAN_PREFIX, SCAN_ROUTE, SHORT_PREFIXES, SHORT_ROUTE
+
+MAX_ENTRIES = 100_000
+GUEST_ROUTE = "/module/{module_id}/guest"
+
+REQUESTS = metrics.REGISTRY.register(metrics.Counter(
+    "idqr_ratelimit_requests_total", "Запросы к ограниченным маршрутам по решению лимитера",
+    ("route", "result")))
+EVICTIONS = metrics.REGISTRY.register(metrics.Counter(
+    "idqr_ratelimit_evictions_total", "Ведра, вытесненные из LRU лимитера"))
+
+_BODY = "Слишком много запросов, повторите позже".encode("utf-8")
+
+
+@dataclass(slots=True)
+class Limit:
+    rate: float
+    burst: float
+    prefix_rate: float
+    prefix_burst: float
+
+
+DEFAULT_LIMITS = {
+    "scan": Limit(rate=10, burst=30, prefix_rate=100, prefix_burst=300),
+    "guest": Limit(rate=2, burst=10, prefix_rate=20, prefix_burst=100),
+}
+ROUTE_LABELS = {"scan": SCAN_ROUTE, "short": SHORT_ROUTE, "guest": GUEST_ROUTE}
+
+
+def parse_limit(text: str) -> Optional[Limit]:
+    """Limit из «rate:burst:prefix_rate:prefix_burst»; None для «off»."""
+    if text.strip().lower() == "off":
+        return None
+    parts = [float(part) for part in text.split(":")]
+    if len(parts) != 4 or any(part <= 0 for part in parts):
+        raise ValueError(f"Лимит должен быть вида rate:burst:prefix_rate:prefix_burst: {text!r}")
+    return Limit(*parts)
+
+
+def client_prefix(ip: str) -> str:
+    """Подсеть клиента: /24 для IPv4, /64 для IPv6; не адрес — как есть."""
+    if ip.startswith("::ffff:") and "." in ip:
+        ip = ip[7:]
+    if ":" not in ip:
+        network, dot, _ = ip.rpartition(".")
+        return f"{network}.0/24" if dot else ip
+    try:
+        return str(ipaddress.IPv6Network(f"{ip}/64", strict=False))
+    except ValueError:
+        return ip
+
+
+def classify(path: str) -> Optional[str]:
+    """Ограничиваемый маршрут по пути запроса или None."""
+    if path.startswith(SCAN_PREFIX):
+        return "scan"
+    if path[:3] in SHORT_PREFIXES:
+        return "short"
+    if path.startswith("/module/") and path.endswith("/guest"):
+        return "guest"
+    return None
+
+
+class TokenBuckets:
+    """LRU ведер: ключ -> [токены, время последнего пополнения]."""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def take(self, key, rate: float, burst: float, now: float) -> float:
+        """Берет токен; 0, если можно, иначе секунды до следующего токена."""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [burst, now]
+            if len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+                EVICTIONS.inc()
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / rate
+
+
+class RateLimiter:
+    def __init__(self, limits: dict, max_entries: int = MAX_ENTRIES):
+        # /S/<код> — то же сканирование, что и /scan/<id>, с общим лимитом
+        self.limits = {**limits, "short": limits.get("scan")}
+        self.buckets = TokenBuckets(max_entries)
+
+    @classmethod
+    def from_env(cls, environ) -> "RateLimiter":
+        limits = {}
+        for route, default in DEFAULT_LIMITS.items():
+            text = environ.get(f"RATE_LIMIT_{route.upper()}")
+            limits[route] = parse_limit(text) if text else default
+        return cls(limits, int(environ.get("RATE_LIMIT_MAX_ENTRIES", MAX_ENTRIES)))
+
+    def check(self, route: str, ip: str) -> float:
+        """0, если запрос разрешен, иначе секунды до повтора."""
+        limit = self.limits.get(route)
+        if limit is None:
+            return 0.0
+        bucket_route = "scan" if route == "short" else route
+        now = time.monotonic()
+        wait = self.buckets.take((bucket_route, ip), limit.rate, limit.burst, now)
+        if wait:
+            REQUESTS.inc(route, "limited_ip")
+            return wait
+        prefix = client_prefix(ip)
+        if prefix != ip:
+            wait = self.buckets.take((bucket_route, prefix), limit.prefix_rate, limit.prefix_burst, now)
+        REQUESTS.inc(route, "limited_prefix" if wait else "allowed")
+        return wait
+
+
+def too_many_requests(retry_after: float):
+    return (
+        {"type": "http.response.start", "status": 429,
+         "headers": [(b"content-type", b"text/plain; charset=utf-8"),
+                     (b"content-length", str(len(_BODY)).encode()),
+                     (b"retry-after", str(max(1, math.ceil(retry_after))).encode())]},
+        {"type": "http.response.body", "body": _BODY},
+    )
+
+
+class RateLimitMiddleware:
+    """ASGI-middleware: 429 сверх лимита до любого другого обработчика."""
+
+    def __init__(self, app, limiter: RateLimiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            route = classify(scope["path"])
+            if route is not None:
+                client = scope.get("client")
+                wait = self.limiter.check(route, client[0] if client else "")
+                if wait:
+                    start, body = too_many_requests(wait)
+                    await send(start)
+                    await send(body)
+                    metrics.HTTP_REQUESTS.inc(scope["method"], ROUTE_LABELS[route], 429)
+                    return
+        await self.app(scope, receive, send)
@@ -0,0 +1,354 @@
+"""Быстрый путь сканирования QR-кодов: ``GET /scan/<id>`` и ``GET /S/<код>``.
+
+``ScanFastPath`` — ASGI-middleware, стоящее снаружи всего стека FastAPI:
+запросы ``/scan/<число>`` и ``/S/<код>`` обслуживаются без разбора cookie сессии,
+зависимостей и роутинга, остальные передаются приложению как есть.
+
+Готовые ASGI-сообщения ответа лежат в ``ScanCache`` (LRU с TTL, чтобы
+изменения из других процессов доходили не позже чем через ``ttl`` секунд):
+для ссылок — редирект с заранее собранным Location, для модулей — страница
+``module_access.html``, отрисованная один раз на модуль. Счетчики
+сканирований копятся в памяти и записываются одним UPDATE на пачку
+(``flush``, задача планировщика ``flush_scan_counters``) вместо транзакции
+на каждое сканирование; в той же транзакции ставятся события вебхуков
+(см. app/webhooks.py).
+
+Новые QR-коды ведут на короткую ссылку ``/S/<код>``: 8 символов алфавита
+Crockford base32 из ``secrets``, уникальный индекс по ``short_code``.
+Хост и код пишутся заглавными, поэтому вся ссылка укладывается в
+алфавитно-цифровой режим QR (5.5 бит на символ вместо 8) и QR получается
+меньшей версии. Код не раскрывает число QR-кодов и не перебирается
+подряд; старые ссылки ``/scan/<id>`` продолжают работать.
+
+Поиск при промахе кэша и сброс счетчиков идут через разные соединения:
+у aiosqlite каждое соединение выполняет запросы по одному в своем потоке,
+и сброс, ждущий блокировку записи (ее держат писатель показаний, массовые
+правки пользователей, задачи планировщика), задерживал бы все промахи на
+время ожидания. Соединение чтения открыто с ``PRAGMA query_only``.
+
+Каждое сканирование публикуется в ``live.ScanHub`` (если он передан) для
+живых счетчиков на странице QR-кодов; владелец QR-кода хранится в кэше
+вместе с ответом.
+"""
+import asyncio
+import logging
+import secrets
+import sqlite3
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+from urllib.parse import quote, urlsplit
+
+import aiosqlite
+
+from app import metrics, webhooks
+from app.db import ensure_column
+
+logger = logging.getLogger(__name__)
+
+SCAN_ROUTE = "/scan/{qr_id}"
+SCAN_PREFIX = "/scan/"
+SHORT_ROUTE = "/s/{code}"
+SHORT_PREFIXES = ("/S/", "/s/")
+
+CROCKFORD = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+SHORT_CODE_LENGTH = 8
+# Crockford: регистр не важен, I/L читаются как 1, O — как 0, дефисы игнорируются
+_NORMALIZE = str.maketrans({"I": "1", "L": "1", "O": "0", "-": None})
+_ALPHABET = frozenset(CROCKFORD)
+BACKFILL_BATCH = 10_000
+
+SCHEMA = [
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_qr_codes_short_code ON qr_codes(short_code)",
+]
+
+MODULE_NAMES = {
+    1: "Услуги и быт",
+    2: "Одежда и мода",
+    3: "Транспорт и авто",
+    4: "Образование и школы",
+    5: "Медицина и здоровье",
+    6: "Стройка и объекты",
+    7: "Бизнес и магазины",
+    8: "Склад и логистика",
+    9: "ЖКХ и дома",
+    10: "События и вход",
+    11: "Документы и удостоверения",
+    12: "Госуслуги и учет",
+    13: "Безопасность и контроль",
+    14: "Реклама и аналитика",
+    15: "Курсы и тренинги",
+    16: "Подарки и сервис",
+    17: "Маркетинг и бренды",
+    18: "Квитанции и оплата",
+    19: "Энергетика и инфраструктура",
+}
+
+
+async def init_schema(db):
+    await ensure_column(db, "qr_codes", "short_code", "TEXT")
+    for statement in SCHEMA:
+        await db.execute(statement)
+    await backfill_short_codes(db)
+
+
+def new_short_code() -> str:
+    return "".join(secrets.choice(CROCKFORD) for _ in range(SHORT_CODE_LENGTH))
+
+
+def normalize_code(text: str) -> Optional[str]:
+    """Канонический вид кода или None, если это не код."""
+    code = text.upper().translate(_NORMALIZE)
+    if len(code) == SHORT_CODE_LENGTH and _ALPHABET.issuperset(code):
+        return code
+    return None
+
+
+def short_scan_url(base_url: str, code: str) -> str:
+    """Ссылка для QR: схема и хост заглавными (регистр в них не важен)."""
+    parts = urlsplit(base_url)
+    return f"{parts.scheme.upper()}://{parts.netloc.upper()}{parts.path.rstrip('/')}/S/{code}"
+
+
+async def assign_short_code(db, qr_id: int) -> str:
+    """Присваивает QR-коду уникальный короткий код (в текущей транзакции)."""
+    while True:
+        code = new_short_code()
+        try:
+            await db.execute("UPDATE qr_codes SET short_code = ? WHERE id = ?", (code, qr_id))
+            return code
+        except sqlite3.IntegrityError:
+            continue
+
+
+async def backfill_short_codes(db):
+    """Выдает коды QR-кодам, созданным до появления коротких ссылок."""
+    while True:
+        cursor = await db.execute(
+            f"SELECT id FROM qr_codes WHERE short_code IS NULL LIMIT {BACKFILL_BATCH}"
+        )
+        ids = [row[0] for row in await cursor.fetchall()]
+        if not ids:
+            return
+        try:
+            await db.executemany(
+                "UPDATE qr_codes SET short_code = ? WHERE id = ?",
+                [(new_short_code(), qr_id) for qr_id in ids]
+            )
+        except sqlite3.IntegrityError:
+            # Совпадение кода: оставшиеся строки получат новые коды на следующем шаге
+            pass
+        await db.commit()
+
+
+def redirect_messages(location: str, status: int = 302):
+    # Экранирование как у starlette.responses.RedirectResponse
+    url = quote(location, safe=":/%#?=@[]!$&'()*+,;")
+    return (
+        {"type": "http.response.start", "status": status,
+         "headers": [(b"location", url.encode("latin-1")), (b"content-length", b"0")]},
+        {"type": "http.response.body", "body": b""},
+    )
+
+
+def html_messages(body: bytes):
+    return (
+        {"type": "http.response.start", "status": 200,
+         "headers": [(b"content-type", b"text/html; charset=utf-8"),
+                     (b"content-length", str(len(body)).encode())]},
+        {"type": "http.response.body", "body": body},
+    )
+
+
+NOT_FOUND = redirect_messages("/", 303)
+
+
+class ScanCache:
+    def __init__(self, db_path: str, templates_env, max_entries: int = 100_000,
+                 ttl: float = 60.0):
+        self.db_path = db_path
+        self.templates_env = templates_env
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # qr_id -> (истекает, start, body, существует ли QR, владелец)
+        self._entries = OrderedDict()
+        # короткий код -> (истекает, qr_id или None)
+        self._codes = OrderedDict()
+        self._module_pages = {}
+        self._pending = {}          # qr_id -> [число сканирований, время последнего]
+        self._reader = None
+        self._writer = None
+        # Два одновременных холодных промаха не должны открыть два соединения
+        self._connect_lock = asyncio.Lock()
+
+    # --- Ответы ---
+    def module_page(self, module_id: int):
+        messages = self._module_pages.get(module_id)
+        if messages is None:
+            html = self.templates_env.get_template("module_access.html").render(
+                request=None, module_id=module_id,
+                module_name=MODULE_NAMES.get(module_id, f"Модуль #{module_id}"),
+            )
+            messages = self._module_pages[module_id] = html_messages(html.encode("utf-8"))
+        return messages
+
+    def build(self, row):
+        if row is None:
+            return NOT_FOUND + (False, None)
+        data, qr_type, owner = row
+        if qr_type == "module":
+            try:
+                return self.module_page(int(data)) + (True, owner)
+            except ValueError:
+                return NOT_FOUND + (False, None)
+        return redirect_messages(data) + (True, owner)
+
+    async def reader(self):
+        """Соединение для поиска QR-кодов (только чтение)."""
+        if self._reader is None:
+            async with self._connect_lock:
+                if self._reader is None:
+                    db = await aiosqlite.connect(self.db_path)
+                    await db.execute("PRAGMA query_only = ON")
+                    self._reader = db
+        return self._reader
+
+    async def writer(self):
+        """Соединение для сброса счетчиков."""
+        if self._writer is None:
+            async with self._connect_lock:
+                if self._writer is None:
+                    self._writer = await aiosqlite.connect(self.db_path)
+        return self._writer
+
+    async def resolve(self, qr_id: int):
+        """(start, body, найден ли QR, владелец) из кэша или из БД."""
+        entry = self._entries.get(qr_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(qr_id)
+            metrics.cache_hit("scan")
+            return entry[1:]
+        metrics.cache_miss("scan")
+        db = await self.reader()
+        cursor = await db.execute("SELECT data, qr_type, user_id FROM qr_codes WHERE id = ?", (qr_id,))
+        row = await cursor.fetchone()
+        await cursor.close()
+        response = self.build(row)
+        self._entries[qr_id] = (time.monotonic() + self.ttl, *response)
+        self._entries.move_to_end(qr_id)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return response
+
+    async def resolve_code(self, code: str) -> Optional[int]:
+        entry = self._codes.get(code)
+        if entry is not None and entry[0] > time.monotonic():
+            self._codes.move_to_end(code)
+            return entry[1]
+        db = await self.reader()
+        cursor = await db.execute("SELECT id FROM qr_codes WHERE short_code = ?", (code,))
+        row = await cursor.fetchone()
+        await cursor.close()
+        qr_id = row[0] if row else None
+        self._codes[code] = (time.monotonic() + self.ttl, qr_id)
+        self._codes.move_to_end(code)
+        if len(self._codes) > self.max_entries:
+            self._codes.popitem(last=False)
+        return qr_id
+
+    def invalidate(self, qr_id: int):
+        self._entries.pop(qr_id, None)
+
+    # --- Счетчики сканирований ---
+    def record_scan(self, qr_id: int):
+        pending = self._pending.get(qr_id)
+        if pending is None:
+            self._pending[qr_id] = [1, time.time()]
+        else:
+            pending[0] += 1
+            pending[1] = time.time()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        rows = [(count, datetime.fromtimestamp(last).isoformat(), qr_id)
+                for qr_id, (count, last) in pending.items()]
+        db = await self.writer()
+        try:
+            await db.executemany(
+                "UPDATE qr_codes SET scan_count = scan_count + ?, last_scan = ? WHERE id = ?", rows
+            )
+            # События вебхуков пишутся в той же транзакции, что и счетчики
+            await webhooks.enqueue_scans(db, rows)
+            await db.commit()
+        except Exception:
+            # Ни счетчиков, ни событий: пакет целиком вернется в следующий сброс
+            await db.rollback()
+            self._restore(pending)
+            raise
+
+    def _restore(self, pending: dict):
+        for qr_id, (count, last) in pending.items():
+            current = self._pending.get(qr_id)
+            if current is None:
+                self._pending[qr_id] = [count, last]
+            else:
+                current[0] += count
+                current[1] = max(current[1], last)
+
+    async def stop(self):
+        try:
+            await self.flush()
+        finally:
+            for db in (self._reader, self._writer):
+                if db is not None:
+                    await db.close()
+            self._reader = self._writer = None
+
+
+class ScanFastPath:
+    """Обслуживает GET /scan/<число> и /S/<код> из ScanCache, остальное — приложению."""
+
+    def __init__(self, app, cache: ScanCache, hub=None):
+        self.app = app
+        self.cache = cache
+        self.hub = hub
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "GET":
+            path = scope["path"]
+            tail = path[len(SCAN_PREFIX):]
+            if (path.startswith(SCAN_PREFIX) and tail.isascii() and tail.isdigit()
+                    and len(tail) <= 18):
+                await self.serve(int(tail), None, send)
+                return
+            if path[:3] in SHORT_PREFIXES:
+                code = normalize_code(path[3:])
+                if code:
+                    await self.serve(None, code, send)
+                    return
+        await self.app(scope, receive, send)
+
+    async def serve(self, qr_id: Optional[int], code: Optional[str], send):
+        started = time.perf_counter()
+        try:
+            if code is not None:
+                qr_id = await self.cache.resolve_code(code)
+            if qr_id is None:
+                start, body, found, owner = NOT_FOUND + (False, None)
+            else:
+                start, body, found, owner = await self.cache.resolve(qr_id)
+        except Exception as e:
+            logger.error(f"Ошибка при сканировании QR-кода: {e}")
+            start, body, found, owner = NOT_FOUND + (False, None)
+        if found:
+            self.cache.record_scan(qr_id)
+            if self.hub is not None:
+                self.hub.publish(owner, qr_id)
+        await send(start)
+        await send(body)
+        route = SCAN_ROUTE if code is None else SHORT_ROUTE
+        metrics.HTTP_REQUESTS.inc("GET", route, start["status"])
+        metrics.HTTP_LATENCY.observe(time.perf_counter() - started, "GET", route)
@@ -0,0 +1,430 @@
+"""Фоновый планировщик обслуживающих задач.
+
+Задачи, которые раньше выполнялись «попутно» в обработчиках запросов
+(снятие истекших блокировок и заморозок), и периодическое обслуживание
+базы запускаются из ``startup``.
+
+При нескольких воркерах задачи с ``leader_only=True`` выполняет только
+лидер: процесс, владеющий арендой в ``scheduler_leases``. Аренда берется
+одним UPSERT, который срабатывает, только если она свободна, истекла
+или уже наша, и продлевается раз в ``lease_ttl / 3``; если лидер
+упал, другой воркер подхватит задачи не позже чем через ``lease_ttl``.
+Задачи без этого флага (сброс счетчиков из памяти процесса) выполняются
+в каждом воркере.
+
+Аренда, задачи лидера и задачи воркера идут в трех отдельных
+asyncio-задачах, каждая на своем соединении: долгая задача лидера
+(оптимизация, миграция) не задерживает ни продление аренды — иначе
+лидером стал бы другой воркер посреди ее работы, — ни частый сброс
+счетчиков. Внутри каждой очереди задачи выполняются по одной, так что
+транзакции разных задач на одном соединении не перемешиваются. Перед
+каждой задачей лидера проверяется, что аренда все еще наша и не истекла.
+
+Время и результат последнего запуска пишутся в ``scheduler_jobs`` и в
+метрики ``idqr_scheduler_job_*``.
+"""
+import asyncio
+import logging
+import os
+import secrets
+import socket
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+import aiosqlite
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = "maintenance"
+PRUNE_BATCH = 10_000
+ROLLUP_BATCH = 100_000
+VACUUM_PAGES = 10_000
+WAL_SIZE_LIMIT = 64 * 1024 * 1024
+WAL_FRAME_HEADER = 24
+RESTART_WAIT_MS = 200                # ожидание читателей при RESTART (держит блокировку записи)
+DEFAULT_LOG_RETENTION_DAYS = 365
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS scheduler_leases (
+        name TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS scheduler_jobs (
+        name TEXT PRIMARY KEY,
+        last_started_at TEXT,
+        last_duration_ms REAL,
+        last_status TEXT,
+        last_error TEXT,
+        last_owner TEXT,
+        runs INTEGER NOT NULL DEFAULT 0,
+        failures INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS scheduler_state (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS stats_daily (
+        day TEXT NOT NULL,
+        metric TEXT NOT NULL,
+        value INTEGER NOT NULL,
+        PRIMARY KEY (day, metric)
+    ) WITHOUT ROWID
+    """,
+    # Частичные индексы: задача снятия блокировок читает только непустые сроки
+    "CREATE INDEX IF NOT EXISTS idx_users_frozen_until ON users(frozen_until) WHERE frozen_until IS NOT NULL",
+    "CREATE INDEX IF NOT EXISTS idx_blocked_ips_until ON blocked_ips(blocked_until) WHERE blocked_until IS NOT NULL",
+]
+
+JOB_DURATION = metrics.REGISTRY.register(metrics.Histogram(
+    "idqr_scheduler_job_duration_seconds", "Время выполнения задачи планировщика",
+    ("job",)))
+JOB_RUNS = metrics.REGISTRY.register(metrics.Counter(
+    "idqr_scheduler_job_runs_total", "Запуски задач планировщика по результату",
+    ("job", "status")))
+WAL_CHECKPOINTS = metrics.REGISTRY.register(metrics.Counter(
+    "idqr_wal_checkpoints_total", "Контрольные точки WAL по режиму и результату",
+    ("mode", "result")))
+
+
+async def init_schema(db):
+    for statement in SCHEMA:
+        await db.execute(statement)
+
+
+@dataclass(slots=True)
+class Job:
+    name: str
+    interval: float
+    func: Callable[[aiosqlite.Connection], Awaitable]
+    leader_only: bool = True
+    delay: float = 0.0
+    next_run: float = 0.0
+    last_run: dict = None       # результат последнего запуска в этом процессе
+
+
+class Scheduler:
+    def __init__(self, db_path: str, tick: float = 1.0, lease_ttl: float = 30.0):
+        self.db_path = db_path
+        self.tick = tick
+        self.lease_ttl = lease_ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+        self.jobs = {}
+        self.is_leader = False
+        self._lease_until = 0.0
+        self._lease_checked = asyncio.Event()
+        self._tasks = []
+
+    def add(self, name: str, interval: float, func, leader_only: bool = True, delay: float = 0.0):
+        """Регистрирует задачу func(db); первый запуск через delay секунд после старта."""
+        self.jobs[name] = Job(name, interval, func, leader_only, delay)
+
+    def start(self):
+        now = time.monotonic()
+        for job in self.jobs.values():
+            job.next_run = now + job.delay
+        self._lease_checked.clear()
+        self._tasks = [
+            asyncio.create_task(self._hold_lease()),
+            asyncio.create_task(self._run(leader_only=True)),
+            asyncio.create_task(self._run(leader_only=False)),
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    async def _run(self, leader_only: bool):
+        if leader_only:
+            # Задачи с нулевой задержкой не должны пропасть до первой попытки взять аренду
+            await self._lease_checked.wait()
+        async with aiosqlite.connect(self.db_path) as db:
+            while True:
+                await self._tick(db, leader_only)
+                await asyncio.sleep(self.tick)
+
+    async def _tick(self, db, leader_only: bool):
+        for job in self.jobs.values():
+            if job.leader_only != leader_only:
+                continue
+            now = time.monotonic()
+            if now < job.next_run:
+                continue
+            job.next_run = now + job.interval
+            if leader_only and not self.leads():
+                continue
+            await self.run_job(db, job)
+
+    # --- Аренда лидера ---
+    def leads(self) -> bool:
+        """Аренда наша и не истекла (даже если продление запаздывает)."""
+        return self.is_leader and time.monotonic() < self._lease_until
+
+    async def _hold_lease(self):
+        async with aiosqlite.connect(self.db_path) as db:
+            try:
+                while True:
+                    attempted = time.monotonic()
+                    try:
+                        self.is_leader = await self._acquire_lease(db)
+                        self._lease_until = attempted + self.lease_ttl
+                    except Exception as e:
+                        self.is_leader = False
+                        logger.error(f"Ошибка при продлении аренды планировщика: {e}")
+                    self._lease_checked.set()
+                    await asyncio.sleep(self.lease_ttl / 3)
+            finally:
+                if self.is_leader:
+                    await self._release_lease(db)
+
+    async def _acquire_lease(self, db) -> bool:
+        now = time.time()
+        await db.execute("""
+            INSERT INTO scheduler_leases (name, owner, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+            WHERE scheduler_leases.owner = excluded.owner OR scheduler_leases.expires_at < ?
+        """, (LEASE_NAME, self.owner, now + self.lease_ttl, now))
+        await db.commit()
+        cursor = await db.execute("SELECT owner FROM scheduler_leases WHERE name = ?", (LEASE_NAME,))
+        row = await cursor.fetchone()
+        await cursor.close()
+        return row is not None and row[0] == self.owner
+
+    async def _release_lease(self, db):
+        try:
+            await db.execute("DELETE FROM scheduler_leases WHERE name = ? AND owner = ?",
+                             (LEASE_NAME, self.owner))
+            await db.commit()
+        except Exception as e:
+            logger.error(f"Ошибка при освобождении аренды планировщика: {e}")
+
+    # --- Запуск задач ---
+    async def run_job(self, db, job: Job):
+        started_at = datetime.now().isoformat()
+        started = time.perf_counter()
+        error = None
+        try:
+            await job.func(db)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = str(e)
+            logger.error(f"Ошибка в задаче планировщика {job.name}: {e}")
+            try:
+                await db.rollback()
+            except Exception:
+                pass
+        elapsed = time.perf_counter() - started
+        status = "ok" if error is None else "error"
+        JOB_DURATION.observe(elapsed, job.name)
+        JOB_RUNS.inc(job.name, status)
+        job.last_run = {"name": job.name, "last_started_at": started_at,
+                        "last_duration_ms": round(elapsed * 1000, 3), "last_status": status,
+                        "last_error": error, "last_owner": self.owner}
+        if not job.leader_only:
+            # Задачи каждого воркера идут часто: в БД их не пишем, хватает метрик
+            return
+        try:
+            await db.execute("""
+                INSERT INTO scheduler_jobs (name, last_started_at, last_duration_ms, last_status,
+                                            last_error, last_owner, runs, failures)
+                VALUES (?, ?, ?, ?, ?, ?, 1, ?)
+                ON CONFLICT(name) DO UPDATE SET
+                    last_started_at = excluded.last_started_at,
+                    last_duration_ms = excluded.last_duration_ms,
+                    last_status = excluded.last_status,
+                    last_error = excluded.last_error,
+                    last_owner = excluded.last_owner,
+                    runs = runs + 1,
+                    failures = failures + excluded.failures
+            """, (job.name, started_at, round(elapsed * 1000, 3), status, error, self.owner,
+                  0 if error is None else 1))
+            await db.commit()
+        except Exception as e:
+            logger.error(f"Ошибка при записи результата задачи {job.name}: {e}")
+
+    async def status(self, db) -> dict:
+        cursor = await db.execute("SELECT owner, expires_at FROM scheduler_leases WHERE name = ?",
+                                  (LEASE_NAME,))
+        lease = await cursor.fetchone()
+        cursor = await db.execute("""
+            SELECT name, last_started_at, last_duration_ms, last_status, last_error, last_owner,
+                   runs, failures
+            FROM scheduler_jobs ORDER BY name
+        """)
+        names = [d[0] for d in cursor.description]
+        runs = {row[0]: dict(zip(names, row)) for row in await cursor.fetchall()}
+        return {
+            "owner": self.owner,
+            "is_leader": self.is_leader,
+            "leader": lease[0] if lease and lease[1] > time.time() else None,
+            "jobs": [
+                {**(runs.get(job.name) or job.last_run or {"name": job.name}),
+                 "interval": job.interval,
+                 "leader_only": job.leader_only}
+                for job in self.jobs.values()
+            ],
+        }
+
+
+# --- Задачи ---
+async def get_state(db, key: str, default: str) -> str:
+    cursor = await db.execute("SELECT value FROM scheduler_state WHERE key = ?", (key,))
+    row = await cursor.fetchone()
+    return row[0] if row else default
+
+
+async def set_state(db, key: str, value: str):
+    await db.execute("INSERT OR REPLACE INTO scheduler_state (key, value) VALUES (?, ?)", (key, value))
+
+
+async def expire_blocks(db):
+    """Снимает истекшие блокировки IP и заморозки аккаунтов одним запросом на таблицу."""
+    now = datetime.now().isoformat()
+    # datetime() приводит и «T», и пробел между датой и временем к одному виду
+    await db.execute("""
+        DELETE FROM blocked_ips
+        WHERE blocked_until IS NOT NULL AND datetime(blocked_until) <= datetime(?)
+    """, (now,))
+    await db.execute("""
+        UPDATE users SET frozen_until = NULL
+        WHERE frozen_until IS NOT NULL AND datetime(frozen_until) <= datetime(?)
+    """, (now,))
+    await db.commit()
+
+
+async def rollup_stats(db):
+    """Дневные итоги: действия из action_logs по типам и общие счетчики QR.
+
+    Логи сворачиваются инкрементально по id (водяной знак в scheduler_state),
+    поэтому prune_logs удаляет только уже учтенные строки.
+    """
+    rolled = int(await get_state(db, "rollup_action_logs_id", "0"))
+    cursor = await db.execute("SELECT COALESCE(MAX(id), 0) FROM action_logs")
+    upper = (await cursor.fetchone())[0]
+    while rolled < upper:
+        batch_end = min(rolled + ROLLUP_BATCH, upper)
+        await db.execute("""
+            INSERT INTO stats_daily (day, metric, value)
+            SELECT substr(created_at, 1, 10), 'action:' || action_type, COUNT(*)
+            FROM action_logs WHERE id > ? AND id <= ?
+            GROUP BY 1, 2
+            ON CONFLICT(day, metric) DO UPDATE SET value = value + excluded.value
+        """, (rolled, batch_end))
+        await set_state(db, "rollup_action_logs_id", str(batch_end))
+        await db.commit()
+        rolled = batch_end
+        await asyncio.sleep(0)
+
+    today = datetime.now().date().isoformat()
+    await db.execute("""
+        INSERT OR REPLACE INTO stats_daily (day, metric, value)
+        SELECT ?, 'qr_codes', COUNT(*) FROM qr_codes
+        UNION ALL SELECT ?, 'scans_total', COALESCE(SUM(scan_count), 0) FROM qr_codes
+        UNION ALL SELECT ?, 'users', COUNT(*) FROM users
+    """, (today, today, today))
+    await db.commit()
+
+
+async def prune_logs(db):
+    """Удаляет логи старше log_retention_days пачками, не держа долгую блокировку записи."""
+    cursor = await db.execute(
+        "SELECT setting_value FROM system_settings WHERE setting_key = 'log_retention_days'"
+    )
+    row = await cursor.fetchone()
+    try:
+        days = int(row[0]) if row else DEFAULT_LOG_RETENTION_DAYS
+    except ValueError:
+        days = DEFAULT_LOG_RETENTION_DAYS
+    if days <= 0:
+        return
+    cutoff = (datetime.now() - timedelta(days=days)).isoformat()
+    rolled = int(await get_state(db, "rollup_action_logs_id", "0"))
+    while True:
+        cursor = await db.execute(f"""
+            DELETE FROM action_logs WHERE id IN (
+                SELECT id FROM action_logs WHERE created_at < ? AND id <= ? LIMIT {PRUNE_BATCH}
+            )
+        """, (cutoff, rolled))
+        deleted = cursor.rowcount
+        await db.commit()
+        if deleted < PRUNE_BATCH:
+            return
+        await asyncio.sleep(0)
+
+
+async def optimize(db):
+    """PRAGMA optimize и, если база создана с auto_vacuum=INCREMENTAL, возврат свободных страниц."""
+    await db.execute("PRAGMA optimize")
+    cursor = await db.execute("PRAGMA auto_vacuum")
+    mode = (await cursor.fetchone())[0]
+    if mode == 2:
+        cursor = await db.execute(f"PRAGMA incremental_vacuum({VACUUM_PAGES})")
+        await cursor.fetchall()
+    await db.commit()
+
+
+def wal_size(db_path: str) -> int:
+    try:
+        return os.path.getsize(f"{db_path}-wal")
+    except OSError:
+        return 0
+
+
+async def _checkpoint(db, mode: str) -> tuple:
+    cursor = await db.execute(f"PRAGMA wal_checkpoint({mode})")
+    busy, frames, copied = await cursor.fetchone()
+    await cursor.close()
+    WAL_CHECKPOINTS.inc(mode.lower(), "busy" if busy else "ok")
+    return busy, frames, copied
+
+
+async def checkpoint_wal(db, limit: int = WAL_SIZE_LIMIT) -> bool:
+    """Контрольная точка WAL вне обработчиков запросов; False — WAL больше limit и его держат читатели.
+
+    PASSIVE переносит кадры, не дожидаясь читателей и не мешая писателям;
+    частый запуск держит WAL ниже порога автоматической контрольной точки,
+    которую иначе выполнял бы фиксирующий транзакцию запрос. Писатель
+    начинает WAL с начала, только если в нем нет читателей, поэтому при
+    непрерывных отчетах журнал растет. Когда в нем больше limit байт и все
+    кадры уже перенесены, RESTART коротко ждет читателей, и следующая запись
+    пойдет с начала файла. TRUNCATE не используется: усечение файла в
+    десятки МБ держит блокировку записи секундами; файл остается на
+    достигнутом размере, но дальше не растет.
+    """
+    busy, frames, copied = await _checkpoint(db, "PASSIVE")
+    if frames < 0:
+        return True         # база не в режиме WAL
+    cursor = await db.execute("PRAGMA page_size")
+    page_size = (await cursor.fetchone())[0]
+    await cursor.close()
+    if frames * (page_size + WAL_FRAME_HEADER) <= limit:
+        return True
+    if copied < frames:
+        return False        # читатель держит снимок старше конца журнала
+    cursor = await db.execute("PRAGMA busy_timeout")
+    busy_timeout = (await cursor.fetchone())[0]
+    await cursor.close()
+    await db.execute(f"PRAGMA busy_timeout = {RESTART_WAIT_MS}")
+    try:
+        busy, _, _ = await _checkpoint(db, "RESTART")
+    finally:
+        await db.execute(f"PRAGMA busy_timeout = {int(busy_timeout)}")
+    return not busy
@@ -0,0 +1,64 @@
+"""Окружение Jinja для шаблонов приложения.
+
+Jinja компилирует шаблон в Python-код при первом обращении в каждом
+процессе, а шаблоны здесь большие, так что первый просмотр каждой
+страницы в новом воркере заметно дольше остальных. Окружение
+настраивается так:
+
+* ``FileSystemBytecodeCache`` — скомпилированный код пишется на диск
+  (``TEMPLATE_CACHE_DIR``), и следующий процесс загружает его вместо
+  компиляции. Ключ кэша включает контрольную сумму исходника, поэтому
+  измененный шаблон перекомпилируется сам.
+* ``auto_reload`` выключен: загруженный шаблон не перепроверяется по
+  времени изменения файла при каждом рендере. Для разработки включается
+  ``TEMPLATES_AUTO_RELOAD=1``.
+* ``warm_up`` загружает все шаблоны заранее; при старте — если задано
+  ``TEMPLATES_WARMUP=1``, а кэш байткода можно заполнить при сборке
+  образа:
+
+    python -m app.templating [--templates templates] [--cache-dir .jinja_cache]
+"""
+import argparse
+import os
+import time
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+TEMPLATE_EXTENSIONS = ("html",)
+CACHE_SIZE = 400                     # больше числа шаблонов: вытеснений нет
+
+
+def create_environment(directory: str, cache_dir: str, auto_reload: bool = False) -> Environment:
+    os.makedirs(cache_dir, exist_ok=True)
+    return Environment(
+        loader=FileSystemLoader(directory),
+        autoescape=True,
+        auto_reload=auto_reload,
+        cache_size=CACHE_SIZE,
+        bytecode_cache=FileSystemBytecodeCache(cache_dir),
+    )
+
+
+def warm_up(env: Environment) -> tuple:
+    """Загружает все шаблоны в кэш окружения; (число шаблонов, секунды).
+
+    Синхронная: при старте вызывать через asyncio.to_thread.
+    """
+    started = time.perf_counter()
+    names = env.list_templates(extensions=TEMPLATE_EXTENSIONS)
+    for name in names:
+        env.get_template(name)
+    return len(names), time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Предкомпиляция шаблонов в кэш байткода")
+    parser.add_argument("--templates", default="templates")
+    parser.add_argument("--cache-dir", default=os.environ.get("TEMPLATE_CACHE_DIR", ".jinja_cache"))
+    args = parser.parse_args()
+    count, elapsed = warm_up(create_environment(args.templates, args.cache_dir))
+    print(f"Шаблонов: {count}, {elapsed * 1000:.0f} мс, кэш байткода: {args.cache_dir}")
+
+
+if __name__ == "__main__":
+    main()
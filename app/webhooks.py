@@ -0,0 +1,559 @@
+"""Исходящие вебхуки о сканированиях QR-кодов.
+
+Пользователь подписывает URL на сканирования всех своих QR-кодов или
+одного QR-кода (таблица ``webhooks``). Путь сканирования вебхуков не
+касается: счетчики, накопленные ``ScanCache``, раз в секунду
+записываются пачкой, и в той же транзакции ``enqueue_scans`` кладет
+по событию на каждую подходящую подписку в ``webhook_outbox``. Событие
+не теряется при перезапуске и не появляется без записи счетчика.
+
+``Dispatcher`` — фоновая задача лидера планировщика (подписчики получают
+каждое событие один раз при любом числе воркеров). За цикл он берет
+подписки с созревшими событиями и для каждой «захватывает» до
+``BATCH_SIZE`` событий, сдвигая их ``next_attempt_at`` на
+``CLAIM_TIMEOUT``: если процесс упадет посреди доставки, события
+вернутся в очередь сами. Захваченное уходит одним POST через общий пул
+соединений httpx. Ограничения:
+
+* у подписки не больше одной доставки в полете;
+* на один хост получателя — не больше ``ENDPOINT_CONCURRENCY``
+  доставок, так что медленный получатель занимает свои слоты, а не пул;
+* каждая доставка укладывается в ``TIMEOUT`` секунд целиком.
+
+Ошибка доставки (не 2xx, таймаут, сбой соединения) откладывает события с
+экспоненциальной задержкой и разбросом; после ``MAX_ATTEMPTS`` попыток
+они отбрасываются. Ответ 410 отключает подписку.
+
+Тело запроса — JSON ``{"webhook_id", "delivery_id", "events": [...]}``,
+подпись — ``X-IDQR-Signature: sha256=<HMAC-SHA256 тела секретом подписки>``.
+
+Для проверки без внешних сервисов есть локальный получатель:
+
+    python -m app.webhooks receive [--port 8099] [--delay 0] [--status 200]
+
+Адреса в локальной сети и loopback принимаются только при
+``WEBHOOKS_ALLOW_PRIVATE=1``. Имя хоста проверяется дважды: при создании
+подписки ``check_destination`` разрешает его и отклоняет, если хоть один
+адрес не публичный, а при доставке ``PublicOnlyBackend`` (сетевой слой
+httpcore под пулом httpx) разрешает имя заново и подключается только к
+проверенному IP. Так DNS, сменивший ответ после проверки (rebinding),
+не уведет запрос во внутреннюю сеть.
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import random
+import secrets
+import socket
+import time
+from datetime import datetime
+from typing import Optional
+from urllib.parse import urlsplit
+
+import aiosqlite
+
+from app import metrics
+from app.models import WebhookView, fetch_all
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 1.0
+BATCH_SIZE = 100                     # событий в одном запросе
+MAX_WEBHOOKS_PER_ROUND = 200
+ENDPOINT_CONCURRENCY = 4
+MAX_CONNECTIONS = 100
+TIMEOUT = 10.0
+CLAIM_TIMEOUT = 60.0                 # больше TIMEOUT: захват переживает доставку
+MAX_ATTEMPTS = 10
+BASE_BACKOFF = 10.0
+MAX_BACKOFF = 3600.0
+MAX_WEBHOOKS_PER_USER = 10
+MAX_URL_LENGTH = 2000
+USER_AGENT = "IDQR-Webhooks/1"
+RESOLVE_TIMEOUT = 5.0
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS webhooks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        qr_id INTEGER,
+        url TEXT NOT NULL,
+        secret TEXT NOT NULL,
+        is_active INTEGER NOT NULL DEFAULT 1,
+        created_at TEXT NOT NULL,
+        failures INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT,
+        last_delivery_at TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS webhook_outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        webhook_id INTEGER NOT NULL,
+        qr_id INTEGER NOT NULL,
+        scans INTEGER NOT NULL,
+        last_scan TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_webhooks_user ON webhooks(user_id, qr_id) WHERE is_active = 1",
+    "CREATE INDEX IF NOT EXISTS idx_webhook_outbox_due ON webhook_outbox(next_attempt_at)",
+    "CREATE INDEX IF NOT EXISTS idx_webhook_outbox_webhook ON webhook_outbox(webhook_id, next_attempt_at)",
+]
+
+DELIVERIES = metrics.REGISTRY.register(metrics.Counter(
+    "idqr_webhook_deliveries_total", "Доставки вебхуков по результату", ("result",)))
+DROPPED = metrics.REGISTRY.register(metrics.Counter(
+    "idqr_webhook_events_dropped_total", "События вебхуков, отброшенные после всех попыток"))
+DELIVERY_SECONDS = metrics.REGISTRY.register(metrics.Histogram(
+    "idqr_webhook_delivery_seconds", "Время доставки пачки событий вебхука"))
+
+
+async def init_schema(db):
+    for statement in SCHEMA:
+        await db.execute(statement)
+
+
+# --- Подписки ---
+def validate_url(url: str, allow_private: bool = False) -> str:
+    """URL получателя или ValueError с текстом для пользователя."""
+    url = url.strip()
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname or len(url) > MAX_URL_LENGTH:
+        raise ValueError("Укажите адрес вида https://example.com/hook")
+    if not allow_private:
+        host = parts.hostname
+        try:
+            address = ipaddress.ip_address(host)
+        except ValueError:
+            address = None
+        if host == "localhost" or host.endswith(".localhost") or (
+                address is not None and not address.is_global):
+            raise ValueError("Адреса локальной сети для вебхуков недоступны")
+    return url
+
+
+def private_allowed() -> bool:
+    return os.environ.get("WEBHOOKS_ALLOW_PRIVATE") == "1"
+
+
+def is_public_address(address: str) -> bool:
+    # Зона IPv6 (fe80::1%eth0) к адресу не относится; IPv4 внутри IPv6 (::ffff:10.0.0.1) не глобален
+    return ipaddress.ip_address(address.split("%", 1)[0]).is_global
+
+
+async def resolve_public(host: str, port: int) -> list:
+    """Адреса хоста; ValueError, если имя не разрешается или хоть один адрес не публичный."""
+    try:
+        infos = await asyncio.wait_for(
+            asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM),
+            RESOLVE_TIMEOUT
+        )
+    except (OSError, asyncio.TimeoutError):
+        raise ValueError(f"Не удалось найти адрес {host}")
+    addresses = list(dict.fromkeys(info[4][0] for info in infos))
+    if not addresses or not all(is_public_address(address) for address in addresses):
+        raise ValueError("Адреса локальной сети для вебхуков недоступны")
+    return addresses
+
+
+async def check_destination(url: str, allow_private: bool = False) -> str:
+    """validate_url и, без allow_private, проверка адресов, в которые разрешается имя."""
+    url = validate_url(url, allow_private)
+    if not allow_private:
+        parts = urlsplit(url)
+        await resolve_public(parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+    return url
+
+
+async def list_for_user(db, user_id: int) -> list:
+    return await fetch_all(
+        db, WebhookView,
+        """
+        SELECT w.id, w.qr_id, q.title, w.url, w.secret, w.is_active, w.created_at,
+               w.failures, w.last_error, w.last_delivery_at,
+               (SELECT COUNT(*) FROM webhook_outbox o WHERE o.webhook_id = w.id)
+        FROM webhooks w LEFT JOIN qr_codes q ON q.id = w.qr_id
+        WHERE w.user_id = ? ORDER BY w.id
+        """,
+        (user_id,)
+    )
+
+
+async def create(db, user_id: int, url: str, qr_id: Optional[int]) -> int:
+    """Новая подписка (в текущей транзакции); ValueError — ошибка ввода."""
+    url = await check_destination(url, private_allowed())
+    cursor = await db.execute("SELECT COUNT(*) FROM webhooks WHERE user_id = ?", (user_id,))
+    if (await cursor.fetchone())[0] >= MAX_WEBHOOKS_PER_USER:
+        raise ValueError(f"Не больше {MAX_WEBHOOKS_PER_USER} вебхуков на пользователя")
+    if qr_id is not None:
+        cursor = await db.execute("SELECT 1 FROM qr_codes WHERE id = ? AND user_id = ?", (qr_id, user_id))
+        if await cursor.fetchone() is None:
+            raise ValueError("QR-код не найден")
+    cursor = await db.execute(
+        "INSERT INTO webhooks (user_id, qr_id, url, secret, created_at) VALUES (?, ?, ?, ?, ?)",
+        (user_id, qr_id, url, secrets.token_hex(16), datetime.now().isoformat())
+    )
+    return cursor.lastrowid
+
+
+async def delete(db, user_id: int, webhook_id: int) -> bool:
+    """Удаляет подписку пользователя и ее неотправленные события."""
+    cursor = await db.execute("DELETE FROM webhooks WHERE id = ? AND user_id = ?", (webhook_id, user_id))
+    if cursor.rowcount == 0:
+        return False
+    await db.execute("DELETE FROM webhook_outbox WHERE webhook_id = ?", (webhook_id,))
+    return True
+
+
+# --- Очередь событий ---
+async def enqueue_scans(db, scans: list):
+    """События по пачке сканирований [(count, last_scan, qr_id), ...] в транзакции сброса счетчиков."""
+    # Курсор закрывается сразу: на долгоживущем соединении ScanCache незавершенный
+    # SELECT держит старый снимок WAL, и следующая запись получает SQLITE_BUSY
+    cursor = await db.execute("SELECT EXISTS (SELECT 1 FROM webhooks WHERE is_active = 1)")
+    active = (await cursor.fetchone())[0]
+    await cursor.close()
+    if not active:
+        return
+    now = time.time()
+    await db.executemany(
+        """
+        INSERT INTO webhook_outbox (webhook_id, qr_id, scans, last_scan, next_attempt_at)
+        SELECT w.id, q.id, ?, ?, ? FROM qr_codes q
+        JOIN webhooks w ON w.user_id = q.user_id AND w.is_active = 1
+                       AND (w.qr_id IS NULL OR w.qr_id = q.id)
+        WHERE q.id = ?
+        """,
+        [(count, last_scan, now, qr_id) for count, last_scan, qr_id in scans]
+    )
+
+
+def encode_payload(webhook_id: int, rows: list) -> bytes:
+    return json.dumps({
+        "webhook_id": webhook_id,
+        "delivery_id": rows[0][0],
+        "events": [{"type": "qr.scanned", "qr_id": qr_id, "scans": scans, "last_scan": last_scan}
+                   for _, qr_id, scans, last_scan, _ in rows],
+    }, separators=(",", ":")).encode("utf-8")
+
+
+def sign(secret: str, body: bytes) -> str:
+    return "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+
+def backoff(attempt: int) -> float:
+    return min(MAX_BACKOFF, BASE_BACKOFF * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+
+# --- Доставка ---
+def public_only_transport(limits):
+    """Транспорт httpx, подключающийся только к публичным адресам (проверка при каждом соединении)."""
+    # Классы внутри функции: httpx и httpcore импортируются только в процессе, который доставляет
+    import httpcore
+    import httpx
+
+    class PublicOnlyBackend(httpcore.AsyncNetworkBackend):
+        def __init__(self):
+            self._backend = httpcore.AnyIOBackend()
+
+        async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+            try:
+                addresses = await resolve_public(host, port)
+            except ValueError as e:
+                raise httpcore.ConnectError(f"{host}: {e}")
+            error = None
+            # Подключаемся к проверенному IP, а не к имени: второй ответ DNS уже не важен
+            for address in addresses:
+                try:
+                    return await self._backend.connect_tcp(address, port, timeout, local_address,
+                                                           socket_options)
+                except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                    error = e
+            raise error
+
+        async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+            raise httpcore.ConnectError("Вебхуки не доставляются в unix-сокеты")
+
+        async def sleep(self, seconds):
+            await self._backend.sleep(seconds)
+
+    class PublicOnlyTransport(httpx.AsyncHTTPTransport):
+        def __init__(self):
+            super().__init__(limits=limits)
+            self._pool = httpcore.AsyncConnectionPool(
+                ssl_context=httpx.create_ssl_context(),
+                max_connections=limits.max_connections,
+                max_keepalive_connections=limits.max_keepalive_connections,
+                keepalive_expiry=limits.keepalive_expiry,
+                network_backend=PublicOnlyBackend(),
+            )
+
+    return PublicOnlyTransport()
+
+
+class Dispatcher:
+    """Фоновая доставка событий из webhook_outbox."""
+
+    def __init__(self, db_path: str, is_active=lambda: True, *, poll_interval: float = POLL_INTERVAL,
+                 batch_size: int = BATCH_SIZE, endpoint_concurrency: int = ENDPOINT_CONCURRENCY,
+                 timeout: float = TIMEOUT, max_attempts: int = MAX_ATTEMPTS, transport=None,
+                 allow_private: Optional[bool] = None):
+        self.db_path = db_path
+        self.is_active = is_active
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.endpoint_concurrency = endpoint_concurrency
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.transport = transport
+        self.allow_private = private_allowed() if allow_private is None else allow_private
+        self._inflight = {}          # webhook_id -> задача доставки
+        self._per_host = {}          # хост получателя -> доставок в полете
+        self._results = []           # (webhook_id, строки, статус, ошибка)
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._stopping = False
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+    def start(self):
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+
+    async def _run(self):
+        import httpx                 # только в процессе, который доставляет
+        limits = httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS)
+        transport = self.transport
+        if transport is None and not self.allow_private:
+            transport = public_only_transport(limits)
+        async with aiosqlite.connect(self.db_path) as db, httpx.AsyncClient(
+                limits=limits, timeout=self.timeout, transport=transport,
+                headers={"User-Agent": USER_AGENT}) as client:
+            while not self._stopping:
+                started = 0
+                try:
+                    await self._apply_results(db)
+                    if self.is_active():
+                        started = await self._dispatch(db, client)
+                except Exception as e:
+                    logger.error(f"Ошибка доставки вебхуков: {e}")
+                if not started:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    self._wakeup.clear()
+            # Недоставленное к таймауту вернется в очередь по истечении захвата
+            if self._inflight:
+                await asyncio.wait(list(self._inflight.values()), timeout=self.timeout)
+            await self._apply_results(db)
+
+    async def _dispatch(self, db, client) -> int:
+        """Захватывает созревшие события и запускает доставки; число запущенных."""
+        now = time.time()
+        busy = list(self._inflight)
+        exclude = f"AND webhook_id NOT IN ({', '.join('?' * len(busy))})" if busy else ""
+        cursor = await db.execute(
+            f"SELECT DISTINCT webhook_id FROM webhook_outbox WHERE next_attempt_at <= ? {exclude} LIMIT ?",
+            (now, *busy, MAX_WEBHOOKS_PER_ROUND)
+        )
+        due = [row[0] for row in await cursor.fetchall()]
+        if not due:
+            return 0
+        cursor = await db.execute(
+            f"SELECT id, url, secret FROM webhooks WHERE is_active = 1 AND id IN ({', '.join('?' * len(due))})",
+            due
+        )
+        hooks = {row[0]: row for row in await cursor.fetchall()}
+        orphaned = [(webhook_id,) for webhook_id in due if webhook_id not in hooks]
+        if orphaned:
+            await db.executemany("DELETE FROM webhook_outbox WHERE webhook_id = ?", orphaned)
+
+        claimed = []
+        for webhook_id, url, secret in hooks.values():
+            host = urlsplit(url).netloc
+            if self._per_host.get(host, 0) >= self.endpoint_concurrency:
+                continue
+            cursor = await db.execute(
+                """
+                UPDATE webhook_outbox SET next_attempt_at = ?
+                WHERE id IN (SELECT id FROM webhook_outbox WHERE webhook_id = ? AND next_attempt_at <= ?
+                             ORDER BY id LIMIT ?)
+                RETURNING id, qr_id, scans, last_scan, attempts
+                """,
+                (now + CLAIM_TIMEOUT, webhook_id, now, self.batch_size)
+            )
+            rows = sorted(await cursor.fetchall())
+            if rows:
+                self._per_host[host] = self._per_host.get(host, 0) + 1
+                claimed.append((webhook_id, url, secret, host, rows))
+        await db.commit()
+
+        for webhook_id, url, secret, host, rows in claimed:
+            self._inflight[webhook_id] = asyncio.create_task(
+                self._deliver(client, webhook_id, url, secret, host, rows)
+            )
+        return len(claimed)
+
+    async def _deliver(self, client, webhook_id: int, url: str, secret: str, host: str, rows: list):
+        body = encode_payload(webhook_id, rows)
+        headers = {"Content-Type": "application/json", "X-IDQR-Signature": sign(secret, body),
+                   "X-IDQR-Delivery": str(rows[0][0])}
+        started = time.perf_counter()
+        status, error = None, None
+        try:
+            response = await asyncio.wait_for(client.post(url, content=body, headers=headers), self.timeout)
+            status = response.status_code
+            if not 200 <= status < 300:
+                error = f"HTTP {status}"
+        except asyncio.TimeoutError:
+            error = f"Нет ответа за {self.timeout:.0f} с"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"[:500]
+        finally:
+            DELIVERY_SECONDS.observe(time.perf_counter() - started)
+            self._per_host[host] -= 1
+            if not self._per_host[host]:
+                del self._per_host[host]
+            self._inflight.pop(webhook_id, None)
+            self._results.append((webhook_id, rows, status, error))
+            self._wakeup.set()
+
+    async def _apply_results(self, db):
+        if not self._results:
+            return
+        results, self._results = self._results, []
+        now = time.time()
+        done, retry, dropped = [], [], 0
+        for webhook_id, rows, status, error in results:
+            if error is None:
+                DELIVERIES.inc("delivered")
+                done.extend((row[0],) for row in rows)
+                await db.execute(
+                    "UPDATE webhooks SET failures = 0, last_error = NULL, last_delivery_at = ? WHERE id = ?",
+                    (datetime.now().isoformat(), webhook_id)
+                )
+            elif status == 410:
+                # Получатель сообщил, что подписка ему больше не нужна
+                DELIVERIES.inc("gone")
+                await db.execute("UPDATE webhooks SET is_active = 0, last_error = ? WHERE id = ?",
+                                 (error, webhook_id))
+                await db.execute("DELETE FROM webhook_outbox WHERE webhook_id = ?", (webhook_id,))
+            else:
+                DELIVERIES.inc("failed")
+                await db.execute("UPDATE webhooks SET failures = failures + 1, last_error = ? WHERE id = ?",
+                                 (error, webhook_id))
+                for outbox_id, _, _, _, attempts in rows:
+                    if attempts + 1 >= self.max_attempts:
+                        done.append((outbox_id,))
+                        dropped += 1
+                    else:
+                        retry.append((attempts + 1, now + backoff(attempts + 1), outbox_id))
+        if done:
+            await db.executemany("DELETE FROM webhook_outbox WHERE id = ?", done)
+        if retry:
+            await db.executemany(
+                "UPDATE webhook_outbox SET attempts = ?, next_attempt_at = ? WHERE id = ?", retry
+            )
+        await db.commit()
+        if dropped:
+            DROPPED.inc(amount=dropped)
+            logger.warning(f"Вебхуки: отброшено событий после {self.max_attempts} попыток: {dropped}")
+
+
+# --- Локальный получатель ---
+class Receiver:
+    """Минимальный HTTP-сервер, принимающий вебхуки: для проверки и бенчмарков.
+
+    Отвечает ``status`` через ``delay`` секунд; принятые запросы лежат в
+    ``received`` как (время получения, заголовки, тело).
+    """
+
+    def __init__(self, delay: float = 0.0, status: int = 200, verbose: bool = False):
+        self.delay = delay
+        self.status = status
+        self.verbose = verbose
+        self.received = []
+        self._server = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._server = await asyncio.start_server(self._handle, host, port)
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                self.received.append((time.time(), headers, body))
+                if self.verbose:
+                    print(f"{request_line.decode('latin-1').strip()} "
+                          f"{headers.get('x-idqr-delivery')} {body.decode('utf-8', 'replace')}")
+                writer.write(f"HTTP/1.1 {self.status} X\r\ncontent-length: 0\r\n\r\n".encode())
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+async def _receive(args):
+    receiver = Receiver(args.delay, args.status, verbose=True)
+    url = await receiver.start(args.host, args.port)
+    print(f"Получатель вебхуков: {url} (задержка {args.delay} с, ответ {args.status})")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await receiver.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Вебхуки о сканированиях")
+    commands = parser.add_subparsers(dest="command", required=True)
+    receive = commands.add_parser("receive", help="локальный получатель для проверки")
+    receive.add_argument("--host", default="127.0.0.1")
+    receive.add_argument("--port", type=int, default=8099)
+    receive.add_argument("--delay", type=float, default=0.0)
+    receive.add_argument("--status", type=int, default=200)
+    args = parser.parse_args()
+    try:
+        asyncio.run(_receive(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Статистика замеров и JSON-базовые линии для бенчмарков.
+
+Результат набора — словарь ``{имя: {"throughput", "p50_ms", "p95_ms",
+"p99_ms", "count", "errors"}}``. ``save`` пишет его вместе с параметрами
+запуска и окружением, ``compare`` сравнивает с сохраненной линией и
+помечает регрессией падение пропускной способности или рост p95 больше
+чем на порог.
+"""
+import json
+import math
+import platform
+import sys
+from datetime import datetime
+
+
+def percentile(sorted_samples, p: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    index = max(0, math.ceil(p / 100 * len(sorted_samples)) - 1)
+    return sorted_samples[index]
+
+
+def summarize(samples, elapsed: float, errors: int = 0) -> dict:
+    """samples — длительности операций в секундах, elapsed — общее время."""
+    ordered = sorted(samples)
+    return {
+        "throughput": round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+        "count": len(ordered),
+        "errors": errors,
+    }
+
+
+def print_results(results: dict, unit: str = "req/s"):
+    print(f"{'сценарий':<16} {unit:>10} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9} {'ошибки':>7}")
+    for name, r in results.items():
+        print(f"{name:<16} {r['throughput']:>10.1f} {r['p50_ms']:>9.2f} "
+              f"{r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['errors']:>7}")
+
+
+def save(path: str, suite: str, params: dict, results: dict):
+    document = {
+        "suite": suite,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "params": params,
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(document, f, ensure_ascii=False, indent=2)
+    print(f"Базовая линия сохранена: {path}")
+
+
+def compare(path: str, suite: str, params: dict, results: dict, threshold: float) -> bool:
+    """Печатает разницу с базовой линией; True, если есть регрессии."""
+    with open(path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("suite") != suite:
+        print(f"Внимание: базовая линия снята набором {baseline.get('suite')!r}, а не {suite!r}")
+    if baseline.get("params") != params:
+        print(f"Внимание: параметры запуска отличаются от базовой линии: {baseline.get('params')}")
+
+    regressed = False
+    print(f"\nСравнение с {path} (порог {threshold:.0%}):")
+    print(f"{'сценарий':<16} {'throughput':>11} {'p95':>9}  статус")
+    for name, current in results.items():
+        base = baseline["results"].get(name)
+        if not base:
+            print(f"{name:<16} {'—':>11} {'—':>9}  нет в базовой линии")
+            continue
+        rate = current["throughput"] / base["throughput"] - 1 if base["throughput"] else 0.0
+        p95 = current["p95_ms"] / base["p95_ms"] - 1 if base["p95_ms"] else 0.0
+        worse = rate < -threshold or p95 > threshold or current["errors"] > base["errors"]
+        regressed = regressed or worse
+        print(f"{name:<16} {rate:>+11.1%} {p95:>+9.1%}  {'РЕГРЕССИЯ' if worse else 'ok'}")
+    return regressed
@@ -0,0 +1,166 @@
+"""Бенчмарк тяжелых отчетов рядом со сканированиями: задержка /scan и размер WAL.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.bench_analytics --seconds 10 --rate 2000
+
+Сканирования идут через ``ScanFastPath`` с темпом ``--rate`` в секунду,
+счетчики сбрасываются раз в ``--flush`` секунд. Параллельно «отчет»
+гоняет агрегирующий запрос по всем QR-кодам в одной читающей транзакции
+по ``--report`` секунд, как долгая административная страница.
+Варианты:
+
+- без отчетов;
+- отчет на обычном соединении, WAL переносит только автоматическая
+  контрольная точка при фиксации сброса счетчиков;
+- отчет через ``analytics.Reader`` (бюджет ``--timeout``) и его задача
+  контрольной точки ``Reader.checkpoint`` раз в секунду.
+
+Печатаются p50/p99 сканирования и сброса счетчиков, наибольший размер
+файла WAL за прогон и число завершенных, прерванных по бюджету и
+отклоненных (занято или WAL больше порога) отчетов.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+import aiosqlite
+from fastapi.templating import Jinja2Templates
+
+from app import analytics, assets, scheduler
+from app.scan import ScanCache, ScanFastPath
+from benchmarks.bench_scan import ROOT, not_found_app, seed
+from benchmarks.bench_webhooks import percentile, scan_load
+
+REPORT_SQL = """
+    SELECT user_id, COUNT(*), SUM(scan_count), MAX(last_scan)
+    FROM qr_codes GROUP BY user_id ORDER BY 3 DESC
+"""
+
+
+async def flusher(cache: ScanCache, interval: float, stop: asyncio.Event, timings: list):
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+        started = time.perf_counter()
+        await cache.flush()
+        timings.append(time.perf_counter() - started)
+
+
+async def report_once(db, seconds: float, stop: asyncio.Event):
+    """Агрегаты по кругу в одной читающей транзакции, пока не выйдет время."""
+    until = time.monotonic() + seconds
+    while time.monotonic() < until and not stop.is_set():
+        cursor = await db.execute(REPORT_SQL)
+        await cursor.fetchall()
+        await asyncio.sleep(0)
+
+
+async def reporter(args, db_path: str, reader, stop: asyncio.Event, outcome: dict):
+    while not stop.is_set():
+        if reader is None:
+            async with aiosqlite.connect(db_path) as db:
+                await db.execute("BEGIN")
+                await report_once(db, args.report, stop)
+            outcome["done"] += 1
+            continue
+        try:
+            async with reader.session() as db:
+                await report_once(db, args.report, stop)
+            outcome["done"] += 1
+        except analytics.AnalyticsBusy:
+            # Администратор повторит запрос чуть позже
+            outcome["refused"] += 1
+            await asyncio.sleep(0.1)
+        except analytics.QueryTimeout:
+            outcome["interrupted"] += 1
+
+
+async def checkpointer(db_path: str, reader, stop: asyncio.Event):
+    async with aiosqlite.connect(db_path) as db:
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), 1.0)
+            except asyncio.TimeoutError:
+                pass
+            await reader.checkpoint(db)
+
+
+async def wal_sampler(db_path: str, stop: asyncio.Event, sizes: list):
+    while not stop.is_set():
+        sizes.append(scheduler.wal_size(db_path))
+        await asyncio.sleep(0.05)
+
+
+async def run(args, db_path: str, templates, variant: str) -> dict:
+    db = sqlite3.connect(db_path)
+    db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    db.close()
+    cache = ScanCache(db_path, templates.env, ttl=60.0)
+    rng = random.Random(1)
+    ids = [rng.randint(1, args.qr_codes) for _ in range(int(args.rate * args.seconds) + 1)]
+    stop = asyncio.Event()
+    flushes, sizes, outcome = [], [], {"done": 0, "interrupted": 0, "refused": 0}
+    tasks = [asyncio.create_task(flusher(cache, args.flush, stop, flushes)),
+             asyncio.create_task(wal_sampler(db_path, stop, sizes))]
+    if variant != "none":
+        reader = None
+        if variant == "reader":
+            reader = analytics.Reader(db_path, timeout=args.timeout, wal_limit=args.wal_limit)
+            tasks.append(asyncio.create_task(checkpointer(db_path, reader, stop)))
+        tasks.append(asyncio.create_task(reporter(args, db_path, reader, stop, outcome)))
+    try:
+        latencies = await scan_load(ScanFastPath(not_found_app, cache), ids, args.rate, args.seconds)
+    finally:
+        stop.set()
+        await asyncio.gather(*tasks)
+        await cache.stop()
+    return {"latencies": latencies, "flushes": flushes, "wal": max(sizes, default=0), **outcome}
+
+
+async def main_async(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "analytics.db")
+        seed(db_path, args.qr_codes)
+        db = sqlite3.connect(db_path)
+        db.execute("UPDATE qr_codes SET user_id = id % 1000 + 1")
+        db.commit()
+        db.close()
+        templates = Jinja2Templates(directory=str(ROOT / "templates"))
+        templates.env.globals["asset_url"] = assets.url
+
+        print(f"{'вариант':<22} {'скан p50, мкс':>14} {'p99, мкс':>9} {'сброс p99, мс':>14} "
+              f"{'WAL макс, КБ':>13} {'отчетов':>8} {'прервано':>9} {'отказов':>8}")
+        for name, variant in (("без отчетов", "none"), ("обычное соединение", "plain"),
+                              ("analytics.Reader", "reader")):
+            result = await run(args, db_path, templates, variant)
+            latencies = [value * 1e6 for value in result["latencies"]]
+            flushes = [value * 1e3 for value in result["flushes"]]
+            print(f"{name:<22} {percentile(latencies, 50):>14.1f} {percentile(latencies, 99):>9.1f} "
+                  f"{percentile(flushes, 99):>14.1f} {result['wal'] / 1024:>13.0f} "
+                  f"{result['done']:>8} {result['interrupted']:>9} {result['refused']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--qr-codes", type=int, default=200_000)
+    parser.add_argument("--rate", type=float, default=2000, help="сканирований в секунду")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--flush", type=float, default=1.0)
+    parser.add_argument("--report", type=float, default=30.0, help="длительность одного отчета, с")
+    parser.add_argument("--timeout", type=float, default=analytics.DEFAULT_TIMEOUT,
+                        help="бюджет сессии analytics.Reader, с")
+    parser.add_argument("--wal-limit", type=int, default=scheduler.WAL_SIZE_LIMIT,
+                        help="порог перезапуска WAL, байт")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
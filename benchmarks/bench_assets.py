@@ -0,0 +1,132 @@
+"""Байты на просмотр страниц: HTML и статические ассеты.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.bench_assets
+    python -m benchmarks.bench_assets --views 20
+
+Приложение запускается на пустой БД во временном каталоге, запросы идут
+через ASGI-транспорт httpx с ``Accept-Encoding: br, gzip``. Браузер
+моделируется кэшем по URL: ответ с ``Cache-Control: immutable`` при
+повторном просмотре не запрашивается, остальные ассеты запрашиваются
+каждый раз. Для каждой страницы печатаются байты HTML, ассетов при
+первом просмотре и при повторном; в конце — сессия администратора и
+пользователя из ``--views`` переходов по кругу с холодным кэшем.
+Считаются байты тела ответа, как они идут по сети (для сжатых вариантов
+— сжатые).
+"""
+import argparse
+import asyncio
+import logging
+import os
+import re
+import shutil
+import sys
+
+import httpx
+
+from benchmarks.loadtest import ROOT, prepare_workdir
+
+ADMIN_PAGES = ["/dashboard/qr", "/dashboard/users", "/dashboard/energy/complaints/admin"]
+USER_PAGES = ["/user/modules", "/user/energy", "/user/medicine", "/user/settings"]
+PUBLIC_PAGES = ["/", "/user/login", "/register"]
+ASSET_LINK = re.compile(r'<(?:link[^>]+href|script[^>]+src)="(/static/[^"]+)"')
+
+
+def body_bytes(response: httpx.Response) -> int:
+    return int(response.headers.get("content-length", len(response.content)))
+
+
+class Browser:
+    """HTTP-клиент с кэшем неизменяемых ответов."""
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+        self.cache = set()
+
+    async def view(self, path: str) -> tuple:
+        """(байты HTML, байты ассетов) одного просмотра."""
+        page = await self.client.get(path)
+        if page.status_code != 200:
+            raise RuntimeError(f"{path}: {page.status_code}")
+        asset_bytes = 0
+        for url in ASSET_LINK.findall(page.text):
+            if url in self.cache:
+                continue
+            response = await self.client.get(url)
+            if response.status_code != 200:
+                raise RuntimeError(f"{url}: {response.status_code}")
+            asset_bytes += body_bytes(response)
+            if "immutable" in response.headers.get("cache-control", ""):
+                self.cache.add(url)
+        return body_bytes(page), asset_bytes
+
+
+async def session(main, login: dict, pages: list, views: int) -> tuple:
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                 headers={"Accept-Encoding": "br, gzip"}) as client:
+        if login:
+            await client.post(login["path"], data=login["data"])
+        browser = Browser(client)
+        per_page, total_html, total_assets = {}, 0, 0
+        for i in range(views):
+            path = pages[i % len(pages)]
+            html, assets = await browser.view(path)
+            per_page.setdefault(path, []).append((html, assets))
+            total_html += html
+            total_assets += assets
+        return per_page, total_html, total_assets
+
+
+async def main_async(args):
+    workdir = prepare_workdir()
+    os.chdir(workdir)
+    os.environ["DB_PATH"] = str(workdir / "qr_data.db")
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+    import app.main as main
+    logging.getLogger().setLevel(logging.WARNING)
+    try:
+        await main.startup()
+        try:
+            import aiosqlite
+            async with aiosqlite.connect(main.DB_PATH) as db:
+                await db.execute(
+                    "INSERT OR IGNORE INTO users (username, password_hash, role, created_at) VALUES (?, ?, 'ip', '2025-01-01')",
+                    ("bench", main.get_password_hash("bench-password"))
+                )
+                await db.commit()
+            sessions = {
+                "публичные": (None, PUBLIC_PAGES),
+                "администратор": ({"path": "/login", "data": {"code": main.ADMIN_CODE}}, ADMIN_PAGES),
+                "пользователь": ({"path": "/user/login",
+                                  "data": {"username": "bench", "password": "bench-password"}}, USER_PAGES),
+            }
+            print(f"{'страница':<38} {'HTML, Б':>9} {'ассеты 1-й, Б':>14} {'ассеты повт., Б':>16}")
+            totals = {}
+            for name, (login, pages) in sessions.items():
+                per_page, html, assets = await session(main, login, pages, max(args.views, 2 * len(pages)))
+                for path, views in per_page.items():
+                    print(f"{path:<38} {views[0][0]:>9} {views[0][1]:>14} {views[-1][1]:>16}")
+                totals[name] = (sum(len(v) for v in per_page.values()), html, assets)
+            print(f"\n{'сессия':<16} {'просмотров':>10} {'HTML, КБ':>9} {'ассеты, КБ':>11} {'КБ/просмотр':>12}")
+            for name, (count, html, assets) in totals.items():
+                print(f"{name:<16} {count:>10} {html / 1024:>9.1f} {assets / 1024:>11.1f} "
+                      f"{(html + assets) / count / 1024:>12.2f}")
+        finally:
+            await main.shutdown()
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--views", type=int, default=12, help="переходов в каждой сессии")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
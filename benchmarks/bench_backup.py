@@ -0,0 +1,180 @@
+"""Бенчмарк онлайн-копии: скорость backup API и задержки писателя во время копии.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.bench_backup --size-mb 2048
+    python -m benchmarks.bench_backup --size-mb 2048 --save backup.json
+
+Сид — база в режиме WAL заданного размера (строки, похожие на qr_codes);
+он кэшируется во временной папке и переиспользуется между запусками.
+Пока идет копия, отдельный поток вставляет строку и делает commit в
+цикле — так ведет себя сервер под записью. Для каждого размера шага
+(``-1`` — одним шагом) печатаются скорость копирования, число
+перезапусков и задержки commit писателя: p99 и максимум показывают,
+насколько копия его останавливает. «writer_idle» — те же commit без
+копии. Последняя строка — полный ``backup.snapshot`` (копия, проверка и
+gzip) с настройками по умолчанию.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import string
+import sys
+import tempfile
+import threading
+import time
+
+from app import backup
+from benchmarks import baseline
+
+ROW_BATCH = 50_000
+
+
+def seed(path: str, size_mb: int):
+    marker = path + f".{size_mb}mb"
+    if os.path.exists(marker) and os.path.exists(path):
+        return
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    rng = random.Random(1)
+    db = sqlite3.connect(path)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=OFF")
+    db.execute("""
+        CREATE TABLE qr_codes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT NOT NULL, data TEXT NOT NULL,
+            filename TEXT NOT NULL, created_at TEXT NOT NULL, scan_count INTEGER DEFAULT 0
+        )
+    """)
+    db.execute("CREATE TABLE bench_writes (id INTEGER PRIMARY KEY, payload TEXT)")
+    target = size_mb * 1024 * 1024
+    alphabet = string.ascii_letters + string.digits
+    i = 0
+    while os.path.getsize(path) + os.path.getsize(path + "-wal") < target:
+        rows = []
+        for _ in range(ROW_BATCH):
+            i += 1
+            tail = "".join(rng.choices(alphabet, k=rng.randint(100, 400)))
+            rows.append((f"QR {i}", f"https://example.com/{tail}", f"{i:032x}.png",
+                         "2025-01-01T00:00:00", i % 1000))
+        db.executemany(
+            "INSERT INTO qr_codes (title, data, filename, created_at, scan_count) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+        db.commit()
+        db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    db.close()
+    open(marker, "w").close()
+
+
+class Writer(threading.Thread):
+    """Вставка строки и commit в цикле; копит длительности commit."""
+
+    def __init__(self, path: str, interval: float):
+        super().__init__(daemon=True)
+        self.path = path
+        self.interval = interval
+        self.samples = []
+        self.errors = 0
+        self._done = threading.Event()
+
+    def run(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        db.execute("PRAGMA synchronous=NORMAL")
+        while not self._done.is_set():
+            began = time.perf_counter()
+            try:
+                db.execute("INSERT INTO bench_writes (payload) VALUES (?)", ("x" * 100,))
+                db.commit()
+                self.samples.append(time.perf_counter() - began)
+            except sqlite3.OperationalError:
+                self.errors += 1
+            time.sleep(self.interval)
+        db.close()
+
+    def stop(self, elapsed: float) -> dict:
+        self._done.set()
+        self.join()
+        summary = baseline.summarize(self.samples, elapsed, self.errors)
+        summary["max_ms"] = round(max(self.samples, default=0) * 1000, 3)
+        return summary
+
+
+def with_writer(path: str, interval: float, action):
+    writer = Writer(path, interval)
+    writer.start()
+    started = time.perf_counter()
+    try:
+        outcome = action()
+    finally:
+        elapsed = time.perf_counter() - started
+        summary = writer.stop(elapsed)
+    return outcome, elapsed, summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=2048)
+    parser.add_argument("--pages", default="-1,256,1024,8192", help="размеры шага через запятую")
+    parser.add_argument("--write-interval-ms", type=float, default=2.0)
+    parser.add_argument("--idle-seconds", type=float, default=5.0)
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "idqr-backupbench"))
+    parser.add_argument("--save", metavar="JSON")
+    parser.add_argument("--compare", metavar="JSON")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    src = os.path.join(args.workdir, "source.db")
+    print(f"Сид {args.size_mb} МБ: {src}")
+    seed(src, args.size_mb)
+    size = os.path.getsize(src)
+    interval = args.write_interval_ms / 1000
+
+    writers = {}
+    _, _, writers["writer_idle"] = with_writer(src, interval, lambda: time.sleep(args.idle_seconds))
+
+    print(f"\n{'шаг, страниц':<14} {'МБ/с':>8} {'время, с':>9} {'перезапуски':>12} "
+          f"{'commit p99, мс':>15} {'commit max, мс':>15}")
+    copies = {}
+    dest = os.path.join(args.workdir, "copy.db")
+    for pages in (int(p) for p in args.pages.split(",")):
+        if os.path.exists(dest):
+            os.remove(dest)
+        (page_count, restarts), elapsed, writer = with_writer(
+            src, interval, lambda: backup.copy_database(src, dest, pages)
+        )
+        rate = size / 1024 / 1024 / elapsed
+        writers[f"writer_pages_{pages}"] = writer
+        copies[f"copy_pages_{pages}"] = {
+            "throughput": round(rate, 2), "p50_ms": round(elapsed * 1000, 3),
+            "p95_ms": round(elapsed * 1000, 3), "p99_ms": round(elapsed * 1000, 3),
+            "count": page_count, "errors": restarts,
+        }
+        print(f"{pages:<14} {rate:>8.1f} {elapsed:>9.2f} {restarts:>12} "
+              f"{writer['p99_ms']:>15.2f} {writer['max_ms']:>15.2f}")
+    if os.path.exists(dest):
+        os.remove(dest)
+
+    result, elapsed, writers["writer_snapshot"] = with_writer(
+        src, interval, lambda: backup.snapshot(src, os.path.join(args.workdir, "archives"))
+    )
+    print(f"\nsnapshot: {size / 1024 / 1024 / elapsed:.1f} МБ/с, {elapsed:.1f} с, "
+          f"архив {result.archive_bytes / 1024 / 1024:.1f} МБ из {result.db_bytes / 1024 / 1024:.1f} МБ")
+    os.remove(result.path)
+
+    print("\nCommit писателя (оп/с — commit в секунду):")
+    baseline.print_results(writers, unit="оп/с")
+
+    results = {**copies, **writers}
+    params = {"size_mb": args.size_mb, "pages": args.pages, "write_interval_ms": args.write_interval_ms}
+    if args.save:
+        baseline.save(args.save, "backup", params, results)
+    if args.compare and baseline.compare(args.compare, "backup", params, results, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
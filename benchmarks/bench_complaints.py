@@ -0,0 +1,127 @@
+"""Бенчмарк очереди жалоб на большой истории.
+
+    python -m benchmarks.bench_complaints --complaints 1000000
+
+Заполняет временную БД (по умолчанию 1M жалоб, почти все закрыты), затем
+замеряет первую и последующие страницы очереди, выборку исполнителя,
+чтение счетчиков и статус одной жалобы. Печатает план запросов, чтобы было
+видно, что каждый из них — диапазон индекса, а не скан таблицы.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import aiosqlite
+
+from app import complaints
+
+COMPLAINTS_DDL = """
+    CREATE TABLE complaints (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        title TEXT NOT NULL,
+        category TEXT NOT NULL,
+        description TEXT NOT NULL,
+        status TEXT DEFAULT 'new',
+        priority TEXT DEFAULT 'medium',
+        assigned_to INTEGER,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL,
+        resolved_at TEXT,
+        response TEXT
+    )
+"""
+
+
+def seed(path: str, total: int, open_share: float):
+    rng = random.Random(42)
+    start = datetime(2020, 1, 1)
+    step = timedelta(minutes=3)
+    db = sqlite3.connect(path)
+    db.execute(COMPLAINTS_DDL)
+    for statement in complaints.SCHEMA:
+        db.execute(statement)
+
+    def rows():
+        for i in range(total):
+            created = (start + step * i).isoformat()
+            if rng.random() < open_share:
+                status = rng.choice(("new", "in_progress"))
+            else:
+                status = rng.choice(complaints.CLOSED_STATUSES)
+            yield (
+                rng.randint(1, 100_000), f"Жалоба {i}", rng.choice(complaints.CATEGORIES),
+                "Описание проблемы " * 5, status, rng.choice(complaints.PRIORITIES),
+                rng.randint(1, 50), created, created,
+            )
+
+    db.executemany(
+        "INSERT INTO complaints (user_id, title, category, description, status, priority, "
+        "assigned_to, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        rows()
+    )
+    db.commit()
+    db.execute("ANALYZE")
+    db.close()
+
+
+async def timed(fn, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), max(samples)
+
+
+async def run(path: str, repeat: int):
+    async with aiosqlite.connect(path) as db:
+        print("План запросов:")
+        for sql in (
+            "SELECT id FROM complaints WHERE status = 'new' AND priority = 'high' "
+            "AND (created_at, id) > ('2021', 0) ORDER BY created_at, id LIMIT 50",
+            "SELECT id FROM complaints WHERE assigned_to = 7 AND status = 'new' AND id > 0 ORDER BY id LIMIT 50",
+            "SELECT id FROM complaints WHERE id = 12345",
+        ):
+            cursor = await db.execute(f"EXPLAIN QUERY PLAN {sql}")
+            for row in await cursor.fetchall():
+                print(f"  {row[-1]}")
+
+        _, cursor_page2 = await complaints.fetch_queue(db, "new")
+        checks = {
+            "очередь: 1-я страница": lambda: complaints.fetch_queue(db, "new"),
+            "очередь: 2-я страница": lambda: complaints.fetch_queue(db, "new", after=cursor_page2),
+            "очередь: resolved": lambda: complaints.fetch_queue(db, "resolved"),
+            "исполнитель": lambda: complaints.fetch_assigned(db, 7, "in_progress"),
+            "счетчики": lambda: complaints.fetch_counters(db),
+            "статус жалобы": lambda: complaints.fetch_status(db, 424242),
+        }
+        print(f"\n{'запрос':<24} {'медиана, мс':>12} {'макс, мс':>10}")
+        for name, fn in checks.items():
+            median, worst = await timed(fn, repeat)
+            print(f"{name:<24} {median:>12.3f} {worst:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--complaints", type=int, default=1_000_000)
+    parser.add_argument("--open-share", type=float, default=0.02)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench_complaints.db")
+        started = time.perf_counter()
+        seed(path, args.complaints, args.open_share)
+        print(f"Заполнение {args.complaints} жалоб: {time.perf_counter() - started:.1f} с\n")
+        asyncio.run(run(path, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
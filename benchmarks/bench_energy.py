@@ -0,0 +1,98 @@
+"""Бенчмарк приема показаний счетчиков и аналитики по агрегатам.
+
+    python -m benchmarks.bench_energy --meters 1000 --days 60 --uploaders 4
+
+Несколько параллельных «загрузчиков» отдают показания (раз в 15 минут по
+каждому счетчику) в общий ReadingWriter. Затем месячный итог по группе
+счетчиков считается из агрегатов и, для сравнения, прямым SUM по сырым
+помесячным таблицам.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+import aiosqlite
+
+from app import energy
+
+STEP = 900
+START = 1_704_067_200  # 2024-01-01 UTC
+
+
+async def uploader(writer, meter_ids, days: int, chunk: int):
+    rows = []
+    for offset in range(0, days * 86400, STEP):
+        for meter_id in meter_ids:
+            rows.append((meter_id, START + offset, 0.25, "electricity"))
+            if len(rows) >= chunk:
+                await writer.write(rows, 1)
+                rows = []
+    if rows:
+        await writer.write(rows, 1)
+
+
+async def timed(fn, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = await fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), result
+
+
+async def run(path: str, args):
+    async with aiosqlite.connect(path) as db:
+        await db.execute("PRAGMA journal_mode=WAL")
+        await energy.init_schema(db)
+        # Писатель читает срок хранения из настроек приложения; здесь — по умолчанию
+        await db.execute("CREATE TABLE system_settings (setting_key TEXT PRIMARY KEY, setting_value TEXT)")
+        await db.commit()
+
+    writer = energy.ReadingWriter(path, max_batch=args.batch)
+    writer.start()
+    meters = [f"m{i:05d}" for i in range(args.meters)]
+    groups = [meters[i::args.uploaders] for i in range(args.uploaders)]
+    total = args.meters * args.days * 86400 // STEP
+    started = time.perf_counter()
+    await asyncio.gather(*(uploader(writer, group, args.days, args.chunk) for group in groups))
+    await writer.stop()
+    elapsed = time.perf_counter() - started
+    print(f"Прием: {total} показаний за {elapsed:.1f} с ({total / elapsed:,.0f} показаний/с)")
+
+    async with aiosqlite.connect(path) as db:
+        group = meters[:50]
+        placeholders = ",".join("?" * len(group))
+
+        async def raw_month():
+            cursor = await db.execute(
+                f"SELECT SUM(value) FROM energy_readings_202401 WHERE meter_id IN ({placeholders})", group
+            )
+            return (await cursor.fetchone())[0]
+
+        median, monthly = await timed(lambda: energy.fetch_monthly(db, group, "2024-01", "2024-02"), args.repeat)
+        print(f"Месяц по 50 счетчикам из агрегатов: {median:.2f} мс (итог {monthly[0][1]:.1f})")
+        median, raw_total = await timed(raw_month, args.repeat)
+        print(f"Месяц по 50 счетчикам из сырых строк: {median:.2f} мс (итог {raw_total:.1f})")
+        median, daily = await timed(lambda: energy.fetch_daily(db, meters[0], "2024-01-01", "2024-03-01"), args.repeat)
+        print(f"Сутки одного счетчика за 2 месяца: {median:.2f} мс ({len(daily)} строк)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--meters", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--uploaders", type=int, default=4)
+    parser.add_argument("--chunk", type=int, default=2000, help="строк на один вызов write")
+    parser.add_argument("--batch", type=int, default=5000, help="порог сброса буфера")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(run(os.path.join(tmp, "bench_energy.db"), args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Бенчмарк потоковой выгрузки: скорость и потребление памяти.
+
+    python -m benchmarks.bench_export --rows 2000000 --gzip
+
+Заполняет action_logs, затем прогоняет exports.stream_export до конца,
+не сохраняя результат, и печатает объем, время и пиковую память Python
+(tracemalloc) — она не должна зависеть от числа строк.
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from app import exports
+
+
+def seed(path: str, rows: int):
+    db = sqlite3.connect(path)
+    db.executescript("""
+        CREATE TABLE qr_codes (id INTEGER PRIMARY KEY, created_at TEXT NOT NULL, user_id INTEGER);
+        CREATE TABLE users (id INTEGER PRIMARY KEY, created_at TEXT NOT NULL);
+        CREATE TABLE action_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            action_type TEXT NOT NULL,
+            description TEXT NOT NULL,
+            ip_address TEXT,
+            created_at TEXT NOT NULL
+        );
+    """)
+    start = datetime(2023, 1, 1)
+    db.executemany(
+        "INSERT INTO action_logs (user_id, action_type, description, ip_address, created_at) VALUES (?, ?, ?, ?, ?)",
+        ((i % 1000, "login", "Успешный вход в систему", "10.0.0.1", (start + timedelta(seconds=i * 7)).isoformat())
+         for i in range(rows))
+    )
+    for statement in exports.SCHEMA:
+        db.execute(statement)
+    db.commit()
+    db.close()
+
+
+async def drain(path: str, **filters):
+    total_bytes = 0
+    async for chunk in exports.stream_export(path, "action_logs", **filters):
+        total_bytes += len(chunk)
+    return total_bytes
+
+
+def measure(path: str, **filters):
+    """Время — без трассировки (она сильно замедляет), память — вторым проходом."""
+    started = time.perf_counter()
+    size = asyncio.run(drain(path, **filters))
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    asyncio.run(drain(path, **filters))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return size, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--format", default="csv", choices=("csv", "jsonl"))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench_export.db")
+        seed(path, args.rows)
+        cases = {
+            "вся таблица": {},
+            "один пользователь": {"user_id": 42},
+            "один месяц": {"start": "2023-02-01", "end": "2023-03-01"},
+        }
+        print(f"{'фильтр':<20} {'МБ':>8} {'с':>7} {'пик памяти, КБ':>15}")
+        for name, filters in cases.items():
+            size, elapsed, peak = measure(path, fmt=args.format, compress=args.gzip, **filters)
+            print(f"{name:<20} {size / 2**20:>8.1f} {elapsed:>7.2f} {peak / 1024:>15.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Бенчмарк хаба живых счетчиков: цена публикации и память подписок.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.bench_live --subscribers 5000 --scans 200000
+
+``--subscribers`` подписок (по одной на владельца, плюс ``--admins``
+подписок администраторов) получают ``--scans`` сканирований по
+``--qr-per-owner`` QR-кодам каждого владельца, пока ни одна подписка не
+успевает отправить событие (худший случай — все сканирования в одном
+окне). Для сравнения — «очередь»: по ``asyncio.Queue`` на подписку и
+элементу на сканирование, как было бы без слияния в окне.
+
+Печатаются мкс на сканирование в ``publish`` и память подписок
+(tracemalloc) после всех сканирований: у хаба она ограничена числом
+разных QR-кодов, у очередей растет с числом сканирований.
+"""
+import argparse
+import asyncio
+import random
+import time
+import tracemalloc
+
+from app.live import ScanHub
+
+
+class QueueHub:
+    """Хаб без слияния: событие на каждое сканирование."""
+
+    def __init__(self):
+        self._by_owner = {}
+        self._admins = []
+
+    def subscribe(self, owner):
+        queue = asyncio.Queue()
+        if owner is None:
+            self._admins.append(queue)
+        else:
+            self._by_owner.setdefault(owner, []).append(queue)
+        return queue
+
+    def publish(self, owner, qr_id):
+        for queue in self._by_owner.get(owner, ()):
+            queue.put_nowait(qr_id)
+        for queue in self._admins:
+            queue.put_nowait(qr_id)
+
+
+def subscribed(make_hub, args):
+    hub = make_hub()
+    subscriptions = [hub.subscribe(owner) for owner in range(args.subscribers)]
+    subscriptions += [hub.subscribe(None) for _ in range(args.admins)]
+    return hub, subscriptions
+
+
+def run(make_hub, args, scans) -> tuple:
+    """(мкс на сканирование, КБ памяти подписок); время — без tracemalloc."""
+    hub, subscriptions = subscribed(make_hub, args)
+    started = time.perf_counter()
+    for owner, qr_id in scans:
+        hub.publish(owner, qr_id)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    hub, subscriptions = subscribed(make_hub, args)
+    before = tracemalloc.get_traced_memory()[0]
+    for owner, qr_id in scans:
+        hub.publish(owner, qr_id)
+    memory = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return elapsed / len(scans) * 1e6, memory / 1024
+
+
+async def main_async(args):
+    rng = random.Random(1)
+    owners = args.subscribers * 2           # половина сканирований — QR без открытой страницы
+    scans = []
+    for _ in range(args.scans):
+        owner = rng.randrange(owners)
+        scans.append((owner, owner * args.qr_per_owner + rng.randrange(args.qr_per_owner)))
+
+    print(f"{'вариант':<10} {'сканирований':>12} {'мкс/скан':>9} {'память, КБ':>11}")
+    for count in (len(scans) // 10, len(scans)):
+        for name, make_hub in (("хаб", lambda: ScanHub(max_subscribers=10**9)), ("очередь", QueueHub)):
+            per_scan, memory = run(make_hub, args, scans[:count])
+            print(f"{name:<10} {count:>12} {per_scan:>9.2f} {memory:>11.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--subscribers", type=int, default=5000)
+    parser.add_argument("--admins", type=int, default=5)
+    parser.add_argument("--scans", type=int, default=200_000)
+    parser.add_argument("--qr-per-owner", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
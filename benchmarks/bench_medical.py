@@ -0,0 +1,97 @@
+"""Бенчмарк медицинских рядов: импорт многолетней истории и выборки для графиков.
+
+    python -m benchmarks.bench_medical --years 3 --interval 60
+
+Импортирует историю одного пациента (по умолчанию показание раз в минуту
+за 3 года, ~1.6M точек) пакетами через medical.insert_readings, затем
+сравнивает прореженную выборку с отдачей «сырых» строк за тот же период.
+"""
+import argparse
+import asyncio
+import math
+import os
+import statistics
+import tempfile
+import time
+
+import aiosqlite
+
+from app import medical
+
+MEDICAL_DATA_DDL = """
+    CREATE TABLE medical_data (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        category TEXT NOT NULL,
+        data_type TEXT NOT NULL,
+        value TEXT NOT NULL,
+        date_recorded TEXT NOT NULL,
+        notes TEXT,
+        created_at TEXT NOT NULL
+    )
+"""
+END = 1_750_000_000
+
+
+async def timed(fn, repeat: int):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = await fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), result
+
+
+async def run(path: str, years: float, interval: int, repeat: int):
+    async with aiosqlite.connect(path) as db:
+        await db.execute(MEDICAL_DATA_DDL)
+        await medical.init_schema(db)
+        # Шум поверх суточного ритма, чтобы min/max отличались от avg
+        total = int(years * 365 * 86400 / interval)
+        start = END - total * interval
+        rows = [
+            ("pulse", start + i * interval,
+             70 + 10 * math.sin(i * interval / 86400 * 2 * math.pi) + (i * 7919 % 11) - 5)
+            for i in range(total)
+        ]
+        for user_id in (1, 2):
+            started = time.perf_counter()
+            await medical.insert_readings(db, user_id, rows)
+            elapsed = time.perf_counter() - started
+            print(f"Импорт пациента {user_id}: {total} точек за {elapsed:.2f} с "
+                  f"({total / elapsed:,.0f} точек/с)")
+
+        print(f"\n{'период':<10} {'вариант':<12} {'строк в ответе':>15} {'мс':>9}")
+        for label, span in (("сутки", 86400), ("месяц", 30 * 86400),
+                            ("год", 365 * 86400), ("вся история", total * interval)):
+            median, series = await timed(
+                lambda: medical.fetch_series(db, 1, "pulse", END - span, END, points=500), repeat
+            )
+            print(f"{label:<10} {'прорежено':<12} {len(series['t']):>15} {median:>9.2f}")
+
+            async def raw():
+                cursor = await db.execute(
+                    "SELECT date_recorded, value FROM medical_readings "
+                    "WHERE user_id = 1 AND data_type = 'pulse' AND date_recorded >= ? AND date_recorded < ?",
+                    (END - span, END)
+                )
+                return await cursor.fetchall()
+
+            median, raw_rows = await timed(raw, max(1, repeat // 5))
+            print(f"{label:<10} {'сырые строки':<12} {len(raw_rows):>15} {median:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--years", type=float, default=3)
+    parser.add_argument("--interval", type=int, default=60, help="секунд между показаниями")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(run(os.path.join(tmp, "bench_medical.db"), args.years, args.interval, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Бенчмарк накладных расходов метрик на запрос.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.bench_metrics --requests 200000
+
+Минимальное ASGI-приложение вызывается напрямую (без сервера и сети)
+с ``MetricsMiddleware`` и без него; разница — цена учета одного запроса.
+Отдельно меряется учет одного SQL-запроса (имя запроса + гистограмма).
+"""
+import argparse
+import asyncio
+import time
+
+from app import metrics
+
+
+class _Route:
+    path = "/scan/{qr_id}"
+
+
+async def plain_app(scope, receive, send):
+    scope["route"] = _Route
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+async def run(app, requests: int) -> float:
+    started = time.perf_counter()
+    for i in range(requests):
+        await app({"type": "http", "method": "GET", "path": f"/scan/{i}"}, receive, send)
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+def bench_query_bookkeeping(requests: int) -> float:
+    sql = "SELECT data, scan_count, qr_type FROM qr_codes WHERE id = ?"
+    started = time.perf_counter()
+    for _ in range(requests):
+        began = time.perf_counter()
+        metrics.DB_QUERY_LATENCY.observe(time.perf_counter() - began, metrics.query_name(sql))
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+async def main_async(requests: int):
+    wrapped = metrics.MetricsMiddleware(plain_app)
+    # Прогрев: первые вызовы создают ряды метрик
+    await run(plain_app, 1000)
+    await run(wrapped, 1000)
+
+    best_plain = min([await run(plain_app, requests) for _ in range(3)])
+    best_wrapped = min([await run(wrapped, requests) for _ in range(3)])
+    print(f"{'без метрик':<22} {best_plain:>8.2f} мкс/запрос")
+    print(f"{'MetricsMiddleware':<22} {best_wrapped:>8.2f} мкс/запрос")
+    print(f"{'накладные расходы':<22} {best_wrapped - best_plain:>8.2f} мкс/запрос")
+    print(f"{'учет SQL-запроса':<22} {bench_query_bookkeeping(requests):>8.2f} мкс/запрос")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200000)
+    args = parser.parse_args()
+    asyncio.run(main_async(args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Микробенчмарки отрисовки и хэширования.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.bench_micro --save micro.json
+    python -m benchmarks.bench_micro --compare micro.json
+
+Меряются отрисовка PNG QR-кода (как в /generate_qr) для прежней ссылки
+``/scan/<id>``, для короткой ``/S/<код>`` (печатаются и версии QR) и с
+логотипом — с кэшем готовых битмапов и без него, рендер шаблона
+qr.html со списком из 50 карточек и хэширование/проверка пароля argon2.
+Базовые линии и сравнение — в том же формате, что и у loadtest.
+"""
+import argparse
+import io
+import logging
+import sys
+import tempfile
+import time
+
+import qrcode
+from PIL import Image, ImageDraw
+
+from app import logos, scan
+from benchmarks import baseline
+
+
+def legacy_url(main, i):
+    return f"{main.BASE_URL}/scan/{100000 + i}"
+
+
+def short_url(main, i):
+    return scan.short_scan_url(main.BASE_URL, scan.new_short_code())
+
+
+def qr_render(url):
+    def factory(main):
+        def run(i):
+            image = main.render_qr_image(url(main, i), f"QR-код №{i}", "#000000", "#000000")
+            image.save(io.BytesIO(), format="PNG")
+        return run
+    return factory
+
+
+def qr_render_logo(cached: bool):
+    def factory(main):
+        folder = tempfile.mkdtemp(prefix="idqr-logo-")
+        image = Image.new("RGB", (1200, 900), "navy")
+        ImageDraw.Draw(image).ellipse((150, 50, 1050, 850), fill="gold")
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG")
+        url = logos.process_upload(buffer.getvalue(), 1, folder)
+        path = logos.qr_variant_path(url, folder)
+
+        def run(i):
+            if not cached:
+                logos.scaled_logos = logos.ScaledLogoCache()
+            image = main.render_qr_image(short_url(main, i), f"QR-код №{i}", "#000000", "#000000", path)
+            image.save(io.BytesIO(), format="PNG")
+        return run
+    return factory
+
+
+def qr_version(payload: str) -> int:
+    qr = qrcode.QRCode(version=None, error_correction=qrcode.constants.ERROR_CORRECT_L)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    return qr.version
+
+
+def template_render(main):
+    from app.models import QRListItem, SessionUser
+    user = SessionUser(1, "bench", "ip", True, False, None, "light", False)
+    qr_list = [
+        QRListItem(i, f"QR {i}", f"https://example.com/p/{i}", f"{i:032x}.png",
+                   "2025-01-01 00:00:00", i * 3, None, "url")
+        for i in range(50)
+    ]
+    template = main.templates.get_template("qr.html")
+
+    def run(i):
+        template.render({"request": None, "qr_list": qr_list, "qr_url": None,
+                         "qr_title": None, "active": "qr", "user": user})
+    return run
+
+
+def password_hash(main):
+    def run(i):
+        main.get_password_hash(f"password-{i}")
+    return run
+
+
+def password_verify(main):
+    hashed = main.get_password_hash("password")
+
+    def run(i):
+        main.verify_password("password", hashed)
+    return run
+
+
+BENCHMARKS = {
+    "qr_render": (qr_render(legacy_url), 200),
+    "qr_render_short": (qr_render(short_url), 200),
+    "qr_logo_cached": (qr_render_logo(cached=True), 200),
+    "qr_logo_uncached": (qr_render_logo(cached=False), 200),
+    "template_qr": (template_render, 500),
+    "argon2_hash": (password_hash, 20),
+    "argon2_verify": (password_verify, 20),
+}
+
+
+def measure(run, iterations: int) -> dict:
+    for i in range(min(5, iterations)):
+        run(i)
+    samples = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        began = time.perf_counter()
+        run(i)
+        samples.append(time.perf_counter() - began)
+    return baseline.summarize(samples, time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=float, default=1.0, help="множитель числа итераций")
+    parser.add_argument("--save", metavar="JSON")
+    parser.add_argument("--compare", metavar="JSON")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args()
+
+    from app import main as app_main
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = {}
+    for name, (factory, iterations) in BENCHMARKS.items():
+        results[name] = measure(factory(app_main), max(1, int(iterations * args.scale)))
+    baseline.print_results(results, unit="оп/с")
+    for name, url in (("/scan/<id>", legacy_url), ("/S/<код>", short_url)):
+        payload = url(app_main, 0)
+        print(f"версия QR для {name}: {qr_version(payload)} ({len(payload)} символов: {payload})")
+
+    params = {"scale": args.scale}
+    if args.save:
+        baseline.save(args.save, "micro", params, results)
+    if args.compare and baseline.compare(args.compare, "micro", params, results, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
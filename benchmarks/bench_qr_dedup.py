@@ -0,0 +1,141 @@
+"""Бенчмарк хранения картинок QR по содержимому: время создания и место на диске.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.bench_qr_dedup
+    python -m benchmarks.bench_qr_dedup --creates 2000 --duplicates 0.8
+
+Приложение запускается на пустой БД во временном каталоге, QR-коды
+создаются администратором через ``/generate_qr`` (ASGI-транспорт httpx).
+Доля ``--duplicates`` запросов повторяет уже созданный QR-код (та же
+ссылка, подпись и цвета — как одинаковые коды у разных пользователей),
+остальные создают новый. Печатаются p50/p99 создания отдельно для
+новых и повторных кодов, число строк и файлов и байты на диске против
+«файл на строку». В конце повторы удаляются через ``/delete_qr`` по
+одному: файл должен жить, пока на него ссылается хоть одна строка.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import time
+
+import httpx
+
+from benchmarks.loadtest import ROOT, prepare_workdir
+
+
+def percentile(values: list, q: int) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100)[q - 1]
+
+
+def disk_usage(folder: str) -> tuple:
+    """(файлов, байт) PNG в каталоге с подкаталогами."""
+    files = size = 0
+    for directory, _, names in os.walk(folder):
+        for name in names:
+            if name.endswith(".png"):
+                files += 1
+                size += os.path.getsize(os.path.join(directory, name))
+    return files, size
+
+
+async def create_all(client: httpx.AsyncClient, args) -> dict:
+    rng = random.Random(args.seed)
+    created, timings = [], {"новые": [], "повторы": []}
+    for i in range(args.creates):
+        duplicate = bool(created) and rng.random() < args.duplicates
+        form = rng.choice(created) if duplicate else {
+            "qrdata": f"https://example.com/page/{i}", "title": f"QR {i}",
+            "qr_color": "#000000", "text_color": "#1a1a1a",
+        }
+        started = time.perf_counter()
+        response = await client.post("/generate_qr", data=form)
+        timings["повторы" if duplicate else "новые"].append(time.perf_counter() - started)
+        if response.status_code != 303:
+            raise RuntimeError(f"/generate_qr: {response.status_code}")
+        if not duplicate:
+            created.append(form)
+    return timings
+
+
+async def delete_shared(client: httpx.AsyncClient, db_path: str, folder: str) -> tuple:
+    """Удаляет строки самого общего файла по одной; (ссылок, удалений до пропажи файла)."""
+    db = sqlite3.connect(db_path)
+    try:
+        filename, = db.execute(
+            "SELECT filename FROM qr_codes GROUP BY filename ORDER BY COUNT(*) DESC LIMIT 1"
+        ).fetchone()
+        ids = [qr_id for qr_id, in db.execute("SELECT id FROM qr_codes WHERE filename = ?", (filename,))]
+    finally:
+        db.close()
+    path = os.path.join(folder, *filename.split("/"))
+    for deleted, qr_id in enumerate(ids, 1):
+        await client.get(f"/delete_qr/{qr_id}")
+        if not os.path.exists(path):
+            return len(ids), deleted
+    return len(ids), None
+
+
+async def main_async(args):
+    workdir = prepare_workdir()
+    os.chdir(workdir)
+    os.environ["DB_PATH"] = str(workdir / "qr_data.db")
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+    import app.main as main
+    logging.getLogger().setLevel(logging.WARNING)
+    try:
+        await main.startup()
+        try:
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                await client.post("/login", data={"code": main.ADMIN_CODE})
+                timings = await create_all(client, args)
+
+                print(f"{'создание':<10} {'штук':>6} {'p50, мс':>8} {'p99, мс':>8}")
+                for name, values in timings.items():
+                    values = [value * 1e3 for value in values]
+                    print(f"{name:<10} {len(values):>6} {percentile(values, 50):>8.2f} "
+                          f"{percentile(values, 99):>8.2f}")
+
+                db = sqlite3.connect(main.DB_PATH)
+                rows, = db.execute("SELECT COUNT(*) FROM qr_codes").fetchone()
+                db.close()
+                files, size = disk_usage(main.QR_FOLDER)
+                print(f"\nстрок {rows}, файлов {files}, на диске {size / 1024:.1f} КБ, "
+                      f"файл на строку ~{size / max(files, 1) * rows / 1024:.1f} КБ")
+
+                references, deleted = await delete_shared(client, main.DB_PATH, main.QR_FOLDER)
+                if deleted == references:
+                    verdict = "ok"
+                elif deleted is None:
+                    verdict = "ОШИБКА: файл остался без ссылок"
+                else:
+                    verdict = "ОШИБКА: файл удален раньше последней ссылки"
+                print(f"удаление общего файла: ссылок {references}, пропал после {deleted} — {verdict}")
+        finally:
+            await main.shutdown()
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--creates", type=int, default=500)
+    parser.add_argument("--duplicates", type=float, default=0.5, help="доля повторных QR-кодов")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
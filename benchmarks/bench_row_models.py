@@ -0,0 +1,138 @@
+"""Бенчмарк аллокаций на запрос: ``SELECT *`` + кортежи против проекций в модели.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.bench_row_models --users 2000 --qr-per-user 50
+
+Для каждого сценария (проверка сессии, список на дашборде, просмотр QR)
+печатается время и число байт, выделенных за один «запрос» (tracemalloc).
+"""
+import argparse
+import json
+import sqlite3
+import time
+import tracemalloc
+
+from app.models import (
+    SessionUser, QRListItem, QRCodeView, columns, row_factory,
+)
+
+
+def seed(db: sqlite3.Connection, users: int, qr_per_user: int):
+    db.executescript("""
+        CREATE TABLE users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            role TEXT NOT NULL DEFAULT 'user',
+            is_active BOOLEAN NOT NULL DEFAULT 1,
+            created_at TEXT NOT NULL,
+            last_login TEXT,
+            is_blocked BOOLEAN NOT NULL DEFAULT 0,
+            frozen_until TEXT,
+            block_count INTEGER DEFAULT 0,
+            theme TEXT NOT NULL DEFAULT 'light',
+            logo_url TEXT,
+            ip_address TEXT,
+            is_medical_worker BOOLEAN NOT NULL DEFAULT 0
+        );
+        CREATE TABLE qr_codes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            data TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            scan_count INTEGER DEFAULT 0,
+            last_scan TEXT,
+            colors TEXT,
+            user_id INTEGER,
+            qr_type TEXT DEFAULT 'url'
+        );
+    """)
+    # Хэш argon2 в реальной БД занимает ~100 байт
+    fake_hash = "$argon2id$v=19$m=65536,t=3,p=4$" + "x" * 70
+    colors = json.dumps({"qr_color": "#000000", "bg_color": "#FFFFFF", "text_color": "#000000"})
+    db.executemany(
+        "INSERT INTO users (username, password_hash, created_at, last_login, ip_address) VALUES (?, ?, ?, ?, ?)",
+        ((f"user{i}", fake_hash, "2025-01-01T00:00:00", "2025-06-01T12:00:00", "10.0.0.1")
+         for i in range(users))
+    )
+    db.executemany(
+        "INSERT INTO qr_codes (title, data, filename, created_at, scan_count, colors, user_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        ((f"QR {i}", f"https://example.com/page/{i}", f"{i:032x}.png", "2025-01-01 00:00:00", i % 97, colors, i % users + 1)
+         for i in range(users * qr_per_user))
+    )
+    db.execute("CREATE INDEX idx_bench_qr_user ON qr_codes(user_id)")
+    db.commit()
+
+
+def legacy_requests(db):
+    def auth(uid):
+        return db.execute("SELECT * FROM users WHERE id = ?", (uid,)).fetchone()
+
+    def dashboard(uid):
+        return db.execute("SELECT * FROM qr_codes WHERE user_id = ? ORDER BY id DESC", (uid,)).fetchall()
+
+    def view(qid):
+        return db.execute("SELECT * FROM qr_codes WHERE id = ?", (qid,)).fetchone()
+
+    return {"auth": auth, "dashboard": dashboard, "view": view}
+
+
+def model_requests(db):
+    def query(model, sql, params):
+        cursor = db.execute(sql, params)
+        cursor.row_factory = row_factory(model)
+        return cursor
+
+    def auth(uid):
+        return query(SessionUser, f"SELECT {columns(SessionUser)} FROM users WHERE id = ?", (uid,)).fetchone()
+
+    def dashboard(uid):
+        return query(QRListItem, f"SELECT {columns(QRListItem)} FROM qr_codes WHERE user_id = ? ORDER BY id DESC", (uid,)).fetchall()
+
+    def view(qid):
+        return query(QRCodeView, f"SELECT {columns(QRCodeView)} FROM qr_codes WHERE id = ?", (qid,)).fetchone()
+
+    return {"auth": auth, "dashboard": dashboard, "view": view}
+
+
+def measure(fn, keys):
+    # Результат держим до снятия снимка, как шаблон держит его до рендера
+    tracemalloc.start()
+    total = 0
+    for key in keys:
+        before = tracemalloc.get_traced_memory()[0]
+        result = fn(key)
+        total += tracemalloc.get_traced_memory()[0] - before
+        del result
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    for key in keys:
+        fn(key)
+    elapsed = time.perf_counter() - started
+    return total / len(keys), elapsed / len(keys) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--qr-per-user", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    db = sqlite3.connect(":memory:")
+    seed(db, args.users, args.qr_per_user)
+    keys = [i % args.users + 1 for i in range(args.requests)]
+
+    variants = {"select *": legacy_requests(db), "models": model_requests(db)}
+    print(f"{'сценарий':<10} {'вариант':<10} {'байт/запрос':>12} {'мкс/запрос':>11}")
+    for scenario in ("auth", "dashboard", "view"):
+        for name, handlers in variants.items():
+            allocated, micros = measure(handlers[scenario], keys)
+            print(f"{scenario:<10} {name:<10} {allocated:>12.0f} {micros:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
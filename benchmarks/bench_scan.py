@@ -0,0 +1,177 @@
+"""Бенчмарк сканирований: маршрут FastAPI против ScanFastPath.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.bench_scan --qr-codes 100000 --requests 20000
+
+ASGI-приложения вызываются напрямую в одном потоке, без сервера и сети,
+поэтому результат — сканирований в секунду на одно ядро. «fastapi» —
+прежняя реализация: SessionMiddleware, маршрут с зависимостями, SELECT и
+UPDATE с commit на каждое сканирование. «fast path» — ScanFastPath с
+теплым кэшем, «fast path, cold» — тот же путь с промахом кэша на каждом
+запросе (ttl=0).
+
+Варианты с лимитером (app/ratelimit.py) показывают его цену на том же
+пути: «+ limiter» — теплый ScanFastPath за RateLimitMiddleware с
+лимитами, которые не срабатывают, запросы идут с ``--clients`` адресов
+(при ``--clients`` больше ``--lru`` каждый запрос вытесняет ведро);
+«limiter, 429» — все запросы сверх лимита и отклоняются до ScanFastPath.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import aiosqlite
+from fastapi import FastAPI, Request
+from fastapi.middleware import Middleware
+from fastapi.responses import RedirectResponse
+from fastapi.templating import Jinja2Templates
+from starlette.middleware.sessions import SessionMiddleware
+
+from app import assets, webhooks
+from app.ratelimit import Limit, RateLimiter, RateLimitMiddleware
+from app.scan import MODULE_NAMES, ScanCache, ScanFastPath
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def seed(path: str, qr_codes: int):
+    db = sqlite3.connect(path)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("""
+        CREATE TABLE qr_codes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT NOT NULL, data TEXT NOT NULL,
+            filename TEXT NOT NULL, created_at TEXT NOT NULL, scan_count INTEGER DEFAULT 0,
+            last_scan TEXT, colors TEXT, user_id INTEGER, qr_type TEXT DEFAULT 'url'
+        )
+    """)
+    for statement in webhooks.SCHEMA:
+        db.execute(statement)
+    db.executemany(
+        "INSERT INTO qr_codes (title, data, filename, created_at, qr_type) VALUES (?, ?, ?, ?, ?)",
+        ((f"QR {i}", str(i % 19 + 1) if i % 10 == 0 else f"https://example.com/p/{i}",
+          f"{i}.png", "2025-01-01 00:00:00", "module" if i % 10 == 0 else "url")
+         for i in range(qr_codes))
+    )
+    db.commit()
+    db.close()
+
+
+def legacy_app(db_path: str, templates: Jinja2Templates):
+    """Прежний маршрут /scan/{qr_id} (до ScanFastPath)."""
+    app = FastAPI(middleware=[Middleware(SessionMiddleware, secret_key="bench")])
+
+    @app.get("/scan/{qr_id}")
+    async def scan_qr(qr_id: int, request: Request):
+        async with aiosqlite.connect(db_path) as db:
+            cursor = await db.execute("SELECT data, scan_count, qr_type FROM qr_codes WHERE id = ?", (qr_id,))
+            row = await cursor.fetchone()
+            if row:
+                data, scan_count, qr_type = row
+                await db.execute(
+                    "UPDATE qr_codes SET scan_count = ?, last_scan = ? WHERE id = ?",
+                    (scan_count + 1, datetime.now().isoformat(), qr_id)
+                )
+                await db.commit()
+                if qr_type == "module":
+                    module_id = int(data)
+                    return templates.TemplateResponse("module_access.html", {
+                        "request": request, "module_id": module_id,
+                        "module_name": MODULE_NAMES.get(module_id, f"Модуль #{module_id}"),
+                    })
+                return RedirectResponse(data)
+        return RedirectResponse("/", status_code=303)
+
+    return app
+
+
+async def not_found_app(scope, receive, send):
+    raise AssertionError(f"запрос дошел до приложения: {scope['path']}")
+
+
+def client_ips(count: int) -> list:
+    """count адресов по 256 в подсети /24."""
+    return [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(count)]
+
+
+async def drive(app, ids, clients=("127.0.0.1",)) -> float:
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    started = time.perf_counter()
+    for i, qr_id in enumerate(ids):
+        path = f"/scan/{qr_id}"
+        await app({
+            "type": "http", "http_version": "1.1", "method": "GET", "scheme": "http",
+            "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+            "headers": [(b"host", b"bench"), (b"cookie", b"session=abc")],
+            "client": (clients[i % len(clients)], 1), "server": ("bench", 80),
+        }, receive, send)
+    return len(ids) / (time.perf_counter() - started)
+
+
+async def main_async(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "scan.db")
+        seed(db_path, args.qr_codes)
+        templates = Jinja2Templates(directory=str(ROOT / "templates"))
+        templates.env.globals["asset_url"] = assets.url
+        rng = random.Random(1)
+        hot = [rng.randint(1, args.qr_codes) for _ in range(min(args.hot, args.qr_codes))]
+        ids = [rng.choice(hot) for _ in range(args.requests)]
+
+        results = {}
+        # Прежний путь на порядки медленнее: ему хватает меньшей выборки
+        legacy_ids = ids[:max(1, min(500, args.requests // 10))]
+        results["fastapi"] = await drive(legacy_app(db_path, templates), legacy_ids)
+
+        for name, ttl in (("fast path", 60.0), ("fast path, cold", 0.0)):
+            cache = ScanCache(db_path, templates.env, ttl=ttl)
+            try:
+                app = ScanFastPath(not_found_app, cache)
+                await drive(app, ids[:1000])       # прогрев кэша
+                results[name] = await drive(app, ids)
+            finally:
+                await cache.stop()
+
+        clients = client_ips(args.clients)
+        unlimited = Limit(rate=1e9, burst=1e9, prefix_rate=1e9, prefix_burst=1e9)
+        exhausted = Limit(rate=1e-9, burst=1, prefix_rate=1e-9, prefix_burst=1)
+        for name, limit in (("fast path + limiter", unlimited), ("limiter, 429", exhausted)):
+            cache = ScanCache(db_path, templates.env, ttl=60.0)
+            try:
+                limiter = RateLimiter({"scan": limit}, max_entries=args.lru)
+                app = RateLimitMiddleware(ScanFastPath(not_found_app, cache), limiter)
+                await drive(app, ids[:1000], clients)
+                results[name] = await drive(app, ids, clients)
+            finally:
+                await cache.stop()
+
+    base = results["fastapi"]
+    print(f"{'вариант':<20} {'скан/с':>10} {'ускорение':>10} {'мкс/скан':>9}")
+    for name, rate in results.items():
+        print(f"{name:<20} {rate:>10.0f} {rate / base:>9.1f}x {1e6 / rate:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--qr-codes", type=int, default=100_000)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--hot", type=int, default=10_000, help="размер «горячего» набора QR")
+    parser.add_argument("--clients", type=int, default=1000, help="адресов клиентов для лимитера")
+    parser.add_argument("--lru", type=int, default=100_000, help="размер LRU лимитера")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
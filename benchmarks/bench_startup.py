@@ -0,0 +1,135 @@
+"""Бенчмарк холодного старта: импорт app.main, startup и первый запрос.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.bench_startup --runs 10 --save startup.json
+    python -m benchmarks.bench_startup --runs 10 --compare startup.json
+
+Каждый замер — отдельный процесс интерпретатора, как у нового воркера
+после масштабирования. Процесс импортирует ``app.main``, выполняет
+``startup`` и отдает ``GET /`` через ASGI-транспорт httpx. Сценарии:
+«cold» — пустая БД (первый запуск: схема и администратор), «warm» —
+уже инициализированная БД (обычный перезапуск). Для каждого печатаются
+стадии: import, startup, request (первый запрос) и total — от запуска
+процесса до ответа. В конце — прямые импорты ``app.main``, дольше всего
+загружающиеся (``python -X importtime``).
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+from benchmarks import baseline
+from benchmarks.loadtest import ROOT, prepare_workdir
+
+STAGES = ("import", "startup", "request", "total")
+
+CHILD = """
+import time
+started = time.perf_counter()
+import asyncio, json, logging
+import httpx
+import app.main as main
+imported = time.perf_counter()
+logging.getLogger().setLevel(logging.WARNING)
+
+async def run():
+    await main.startup()
+    ready = time.perf_counter()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        response = await client.get("/")
+    answered = time.perf_counter()
+    wall = time.time()
+    await main.shutdown()
+    return ready, answered, wall, response.status_code
+
+ready, answered, wall, status = asyncio.run(run())
+print(json.dumps({
+    "import": imported - started, "startup": ready - imported,
+    "request": answered - ready, "wall": wall, "status": status,
+}))
+"""
+
+
+def boot(workdir, db_path: str, importtime: bool = False):
+    """Один процесс: (замеры стадий в секундах, stderr)."""
+    env = dict(os.environ, DB_PATH=db_path, PYTHONPATH=str(ROOT))
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", CHILD]
+    spawned = time.time()
+    done = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True, check=True)
+    sample = json.loads(done.stdout.strip().splitlines()[-1])
+    if sample["status"] != 200:
+        raise RuntimeError(f"GET / ответил {sample['status']}")
+    sample["total"] = sample.pop("wall") - spawned
+    return sample, done.stderr
+
+
+def slowest_imports(stderr: str, top: int) -> list:
+    """Прямые импорты app.main по накопленному времени: (мс, имя)."""
+    children, modules = [], []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        # importtime печатает вложенные модули раньше родителя
+        if depth == 1:
+            children.append((int(cumulative) / 1000, name.strip()))
+        elif depth == 0:
+            if name.strip() == "app.main":
+                modules = children
+            children = []
+    return sorted(modules, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=12, help="сколько самых медленных импортов показать")
+    parser.add_argument("--save", metavar="JSON")
+    parser.add_argument("--compare", metavar="JSON")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args()
+
+    workdir = prepare_workdir()
+    try:
+        db_path = str(workdir / "qr_data.db")
+        # Прогрев файлового кэша и .pyc, чтобы первый замер не отличался от остальных
+        boot(workdir, db_path)
+
+        samples = {f"{scenario}_{stage}": [] for scenario in ("cold", "warm") for stage in STAGES}
+        for _ in range(args.runs):
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(db_path + suffix):
+                    os.remove(db_path + suffix)
+            for scenario in ("cold", "warm"):
+                sample, _ = boot(workdir, db_path)
+                for stage in STAGES:
+                    samples[f"{scenario}_{stage}"].append(sample[stage])
+
+        results = {}
+        for name, values in samples.items():
+            results[name] = baseline.summarize(values, sum(values))
+        print(f"Запусков на сценарий: {args.runs} (оп/с — запусков в секунду на стадию)")
+        baseline.print_results(results, unit="оп/с")
+
+        _, stderr = boot(workdir, db_path, importtime=True)
+        print("\nСамые медленные импорты app.main (накопленное время, мс):")
+        for elapsed, name in slowest_imports(stderr, args.top):
+            print(f"{elapsed:>9.1f}  {name}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    params = {"runs": args.runs}
+    if args.save:
+        baseline.save(args.save, "startup", params, results)
+    if args.compare and baseline.compare(args.compare, "startup", params, results, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
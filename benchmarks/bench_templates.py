@@ -0,0 +1,99 @@
+"""Бенчмарк загрузки шаблонов: стоимость первого запроса к каждой странице.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.bench_templates --save templates.json
+    python -m benchmarks.bench_templates --compare templates.json
+
+Первый рендер шаблона в новом воркере — это загрузка (компиляция или
+чтение байткода) плюс сам рендер; меняется только загрузка, ее и
+меряем. Для каждого шаблона из templates/ в свежем окружении Jinja
+(как в новом процессе) замеряется ``get_template``:
+
+* «compile» — без кэша байткода, как было до app/templating.py;
+* «bytecode» — с заполненным ``FileSystemBytecodeCache`` (следующий
+  воркер после первого или после ``python -m app.templating``);
+* «memory» — повторное обращение в том же окружении (после прогрева
+  ``TEMPLATES_WARMUP=1``).
+
+Каждый замер повторяется ``--rounds`` раз, берется медиана. Печатаются
+самые дорогие шаблоны и сводка по режимам (оп/с — шаблонов в секунду).
+"""
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+
+from jinja2 import Environment, FileSystemLoader
+
+from app import templating
+from benchmarks import baseline
+
+TEMPLATES_DIR = "templates"
+
+
+def load_times(make_env, names: list, rounds: int, repeat: bool = False) -> dict:
+    """Медиана get_template по шаблонам; repeat — второе обращение в том же окружении."""
+    samples = {name: [] for name in names}
+    for _ in range(rounds):
+        env = make_env()
+        for name in names:
+            if repeat:
+                env.get_template(name)
+            started = time.perf_counter()
+            env.get_template(name)
+            samples[name].append(time.perf_counter() - started)
+    return {name: statistics.median(values) for name, values in samples.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--save", metavar="JSON")
+    parser.add_argument("--compare", metavar="JSON")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        names = templating.create_environment(TEMPLATES_DIR, cache_dir).list_templates(
+            extensions=templating.TEMPLATE_EXTENSIONS
+        )
+        # Первая компиляция в процессе еще и импортирует компилятор Jinja
+        Environment(loader=FileSystemLoader(TEMPLATES_DIR)).get_template(names[0])
+
+        modes = {
+            "compile": load_times(
+                lambda: Environment(loader=FileSystemLoader(TEMPLATES_DIR), autoescape=True),
+                names, args.rounds),
+        }
+        templating.warm_up(templating.create_environment(TEMPLATES_DIR, cache_dir))
+        modes["bytecode"] = load_times(
+            lambda: templating.create_environment(TEMPLATES_DIR, cache_dir), names, args.rounds)
+        modes["memory"] = load_times(
+            lambda: templating.create_environment(TEMPLATES_DIR, cache_dir), names, args.rounds, repeat=True)
+
+    print(f"{'шаблон':<28} {'compile, мс':>12} {'bytecode, мс':>13} {'memory, мс':>11}")
+    for name in sorted(names, key=modes["compile"].get, reverse=True)[:args.top]:
+        print(f"{name:<28} {modes['compile'][name] * 1000:>12.2f} "
+              f"{modes['bytecode'][name] * 1000:>13.2f} {modes['memory'][name] * 1000:>11.3f}")
+    print(f"{'все ' + str(len(names)):<28} " + " ".join(
+        f"{sum(modes[mode].values()) * 1000:>{width}.2f}"
+        for mode, width in (("compile", 12), ("bytecode", 13), ("memory", 11))
+    ))
+
+    results = {mode: baseline.summarize(list(times.values()), sum(times.values()))
+               for mode, times in modes.items()}
+    print()
+    baseline.print_results(results, unit="оп/с")
+
+    params = {"rounds": args.rounds, "templates": len(names)}
+    if args.save:
+        baseline.save(args.save, "templates", params, results)
+    if args.compare and baseline.compare(args.compare, "templates", params, results, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""Бенчмарк вебхуков: задержка сканирований и доставка при медленных получателях.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.bench_webhooks --seconds 10 --rate 2000
+
+Сканирования идут через ``ScanFastPath`` с темпом ``--rate`` в секунду,
+счетчики сбрасываются раз в ``--flush`` секунд (как задача
+``flush_scan_counters``), ``Dispatcher`` доставляет события на локальные
+получатели ``webhooks.Receiver``. У ``--users`` пользователей по
+вебхуку на все их QR-коды; половина вебхуков ведет на быстрый
+получатель, половина — на получатель, отвечающий через ``--slow``
+секунд. Прогон повторяется без вебхуков.
+
+Печатаются p50/p99 времени сканирования, число событий и запросов
+(событий в запросе — эффект пакетной доставки) и задержка от
+сканирования до получения события для каждого получателя: у быстрого
+она не должна зависеть от медленного.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+from fastapi.templating import Jinja2Templates
+
+from app import assets, webhooks
+from app.scan import ScanCache, ScanFastPath
+from benchmarks.bench_scan import ROOT, not_found_app, seed
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    return statistics.quantiles(values, n=100)[q - 1] if len(values) > 1 else values[0]
+
+
+async def scan_load(app, ids: list, rate: float, seconds: float) -> list:
+    """Сканирования с заданным темпом; время каждого, с."""
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    latencies = []
+    started = time.perf_counter()
+    for i, qr_id in enumerate(ids):
+        elapsed = time.perf_counter() - started
+        if elapsed > seconds:
+            break
+        ahead = i / rate - elapsed
+        if ahead > 0:
+            await asyncio.sleep(ahead)
+        path = f"/scan/{qr_id}"
+        request_started = time.perf_counter()
+        await app({
+            "type": "http", "http_version": "1.1", "method": "GET", "scheme": "http",
+            "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+            "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 1), "server": ("bench", 80),
+        }, receive, send)
+        latencies.append(time.perf_counter() - request_started)
+    return latencies
+
+
+async def flusher(cache: ScanCache, interval: float, stop: asyncio.Event):
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+        await cache.flush()
+
+
+def event_lags(receiver: webhooks.Receiver) -> tuple:
+    """(событий, запросов, задержки сканирование -> получение, с)."""
+    events, lags = 0, []
+    for received_at, _, body in receiver.received:
+        for event in json.loads(body)["events"]:
+            events += 1
+            lags.append(received_at - datetime.fromisoformat(event["last_scan"]).timestamp())
+    return events, len(receiver.received), lags
+
+
+async def run(args, db_path: str, templates, with_webhooks: bool) -> dict:
+    fast, slow = webhooks.Receiver(), webhooks.Receiver(delay=args.slow)
+    urls = [await fast.start(), await slow.start()]
+    db = sqlite3.connect(db_path)
+    db.execute("DELETE FROM webhooks")
+    db.execute("DELETE FROM webhook_outbox")
+    if with_webhooks:
+        db.executemany(
+            "INSERT INTO webhooks (user_id, url, secret, created_at) VALUES (?, ?, 'bench', '2025-01-01')",
+            [(user_id, f"{urls[user_id % 2]}/hook/{user_id}") for user_id in range(1, args.users + 1)]
+        )
+    db.commit()
+    db.close()
+
+    cache = ScanCache(db_path, templates.env, ttl=60.0)
+    dispatcher = webhooks.Dispatcher(db_path, poll_interval=0.1, allow_private=True)
+    rng = random.Random(1)
+    ids = [rng.randint(1, args.qr_codes) for _ in range(int(args.rate * args.seconds) + 1)]
+    stop = asyncio.Event()
+    flush_task = asyncio.create_task(flusher(cache, args.flush, stop))
+    dispatcher.start()
+    try:
+        latencies = await scan_load(ScanFastPath(not_found_app, cache), ids, args.rate, args.seconds)
+        stop.set()
+        await flush_task
+        # Доставка хвоста: быстрые получатели успевают, медленные — сколько успеют
+        await asyncio.sleep(args.slow + 1)
+    finally:
+        await dispatcher.stop()
+        await cache.stop()
+        await fast.stop()
+        await slow.stop()
+    return {"latencies": latencies, "fast": event_lags(fast), "slow": event_lags(slow)}
+
+
+async def main_async(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "webhooks.db")
+        seed(db_path, args.qr_codes)
+        db = sqlite3.connect(db_path)
+        db.execute("UPDATE qr_codes SET user_id = id % ? + 1", (args.users,))
+        db.commit()
+        db.close()
+        templates = Jinja2Templates(directory=str(ROOT / "templates"))
+        templates.env.globals["asset_url"] = assets.url
+
+        print(f"{'вариант':<12} {'сканов':>7} {'p50, мкс':>9} {'p99, мкс':>9}")
+        results = {}
+        for name, with_webhooks in (("без вебхуков", False), ("с вебхуками", True)):
+            results[name] = result = await run(args, db_path, templates, with_webhooks)
+            latencies = [value * 1e6 for value in result["latencies"]]
+            print(f"{name:<12} {len(latencies):>7} {percentile(latencies, 50):>9.1f} "
+                  f"{percentile(latencies, 99):>9.1f}")
+
+        print(f"\n{'получатель':<12} {'событий':>8} {'запросов':>9} {'соб./запрос':>12} "
+              f"{'задержка p50, с':>16} {'p99, с':>7}")
+        for name in ("fast", "slow"):
+            events, requests, lags = results["с вебхуками"][name]
+            label = "быстрый" if name == "fast" else f"медл. {args.slow:g} с"
+            print(f"{label:<12} {events:>8} {requests:>9} {events / max(requests, 1):>12.1f} "
+                  f"{percentile(lags, 50):>16.2f} {percentile(lags, 99):>7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--qr-codes", type=int, default=10_000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=2000, help="сканирований в секунду")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--flush", type=float, default=1.0)
+    parser.add_argument("--slow", type=float, default=2.0, help="задержка ответа медленного получателя, с")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
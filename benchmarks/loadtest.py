@@ -0,0 +1,271 @@
+"""Нагрузочный тест горячих маршрутов на реалистичных объемах данных.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.loadtest --concurrency 16 --requests 1000 --save base.json
+    python -m benchmarks.loadtest --concurrency 16 --requests 1000 --compare base.json
+
+По умолчанию БД заполняется 100k пользователей, 1M QR-кодов и 10M записей
+журнала (генерация детерминирована ``--seed`` и кэшируется в ``--data-dir``).
+Каждый запуск работает на свежей копии этой БД во временном каталоге со
+своими static/qr, так что репозиторий не меняется. Запросы идут через
+ASGI-транспорт httpx прямо в приложение, без сети и сервера; на каждый
+сценарий печатаются пропускная способность и p50/p95/p99. Если при
+сравнении есть регрессия, процесс завершается с кодом 1.
+"""
+import argparse
+import asyncio
+import importlib
+import itertools
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import httpx
+
+from benchmarks import baseline
+
+ROOT = Path(__file__).resolve().parent.parent
+PASSWORD = "loadtest-password"
+IP_USER_EVERY = 10          # каждый десятый пользователь — с ролью ip
+BATCH = 100_000
+ACTIONS = ("login", "logout", "qr_create", "qr_update", "qr_delete", "failed_login")
+
+
+@dataclass
+class LoadContext:
+    users: int
+    qr_codes: int
+    ip_usernames: list
+
+
+# --- Подготовка окружения ---
+def prepare_workdir() -> Path:
+    """Каталог с шаблонами репозитория и собственными static/qr, static/logos."""
+    workdir = Path(tempfile.mkdtemp(prefix="idqr-loadtest-"))
+    (workdir / "templates").symlink_to(ROOT / "templates")
+    static = workdir / "static"
+    static.mkdir()
+    for entry in (ROOT / "static").iterdir():
+        if entry.name not in ("qr", "logos"):
+            (static / entry.name).symlink_to(entry)
+    return workdir
+
+
+def username(index: int) -> str:
+    return f"user{index:06d}"
+
+
+def seed_rows(db: sqlite3.Connection, password_hash: str, users: int, qr_codes: int,
+              logs: int, rng: random.Random):
+    db.execute("PRAGMA synchronous = OFF")
+    start = datetime(2025, 1, 1)
+
+    def insert(sql, rows):
+        while True:
+            batch = list(itertools.islice(rows, BATCH))
+            if not batch:
+                break
+            db.executemany(sql, batch)
+
+    insert(
+        "INSERT INTO users (username, password_hash, role, created_at, last_login, ip_address) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        ((username(i), password_hash, "ip" if i % IP_USER_EVERY == 0 else "user",
+          (start + timedelta(minutes=i)).isoformat(), None, f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}")
+         for i in range(users))
+    )
+    ip_user_ids = [row[0] for row in db.execute("SELECT id FROM users WHERE role = 'ip'")]
+
+    def qr_row(i):
+        created = (start + timedelta(seconds=i * 30)).strftime("%Y-%m-%d %H:%M:%S")
+        if rng.random() < 0.1:
+            qr_type, data = "module", str(rng.randint(1, 19))
+        else:
+            qr_type, data = "url", f"https://example.com/p/{i}"
+        return (f"QR {i}", data, f"{i:032x}.png", created, rng.randint(0, 500),
+                rng.choice(ip_user_ids), qr_type)
+
+    insert(
+        "INSERT INTO qr_codes (title, data, filename, created_at, scan_count, user_id, qr_type) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (qr_row(i) for i in range(qr_codes))
+    )
+    insert(
+        "INSERT INTO action_logs (user_id, action_type, description, ip_address, created_at) "
+        "VALUES (?, ?, ?, ?, ?)",
+        ((rng.randint(1, users), action, f"Событие {action} #{i}", "10.0.0.1",
+          (start + timedelta(seconds=i * 3)).isoformat())
+         for i, action in ((i, rng.choice(ACTIONS)) for i in range(logs)))
+    )
+    # Лимит QR на пользователя не должен обрывать сценарий generate_qr
+    db.execute("UPDATE system_settings SET setting_value = '1000000000' WHERE setting_key = 'max_qr_per_user'")
+    db.commit()
+
+
+async def prepare_database(main, cache: Path, args, rng: random.Random):
+    """Копирует закэшированную БД в рабочую или генерирует ее заново."""
+    if cache.exists():
+        shutil.copyfile(cache, main.DB_PATH)
+        return
+    print(f"Генерация БД: {args.users} пользователей, {args.qr_codes} QR, {args.logs} записей журнала…")
+    started = time.perf_counter()
+    await main.startup()
+    await main.shutdown()
+    db = sqlite3.connect(main.DB_PATH)
+    seed_rows(db, main.get_password_hash(PASSWORD), args.users, args.qr_codes, args.logs, rng)
+    db.execute("ANALYZE")
+    db.close()
+    cache.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copyfile(main.DB_PATH, cache)
+    print(f"Готово за {time.perf_counter() - started:.1f} с, кэш: {cache}")
+
+
+# --- Сценарии ---
+async def scan(client, rng, ctx):
+    return await client.get(f"/scan/{rng.randint(1, ctx.qr_codes)}")
+
+
+async def user_login(client, rng, ctx):
+    return await client.post("/user/login", data={
+        "username": username(rng.randrange(ctx.users)), "password": PASSWORD,
+    })
+
+
+async def dashboard_qr(client, rng, ctx):
+    return await client.get("/dashboard/qr")
+
+
+async def generate_qr(client, rng, ctx):
+    number = rng.randrange(1_000_000)
+    return await client.post("/generate_qr", data={
+        "qrdata": f"https://example.com/new/{number}", "title": f"Нагрузка {number}",
+    })
+
+
+# имя → (функция, нужен ли вход пользователем ip, ожидаемые коды ответа)
+SCENARIOS = {
+    "scan": (scan, False, {200, 302}),
+    "user_login": (user_login, False, {303}),
+    "dashboard_qr": (dashboard_qr, True, {200}),
+    "generate_qr": (generate_qr, True, {303}),
+}
+
+
+async def run_scenario(main, name: str, ctx: LoadContext, concurrency: int,
+                       requests: int, warmup: int, seed: int) -> dict:
+    func, needs_login, expected = SCENARIOS[name]
+    transport = httpx.ASGITransport(app=main.app)
+    clients = [httpx.AsyncClient(transport=transport, base_url="http://loadtest")
+               for _ in range(concurrency)]
+    try:
+        if needs_login:
+            for index, client in enumerate(clients):
+                response = await client.post("/user/login", data={
+                    "username": ctx.ip_usernames[index % len(ctx.ip_usernames)],
+                    "password": PASSWORD,
+                })
+                if response.status_code != 303:
+                    raise RuntimeError(f"не удалось войти пользователем ip: {response.status_code}")
+
+        rng = random.Random(seed)
+        for _ in range(warmup):
+            await func(clients[0], rng, ctx)
+
+        samples, errors, issued = [], 0, 0
+
+        async def worker(client, worker_rng):
+            nonlocal errors, issued
+            while issued < requests:
+                issued += 1
+                started = time.perf_counter()
+                try:
+                    response = await func(client, worker_rng, ctx)
+                    ok = response.status_code in expected
+                except Exception:
+                    ok = False
+                samples.append(time.perf_counter() - started)
+                errors += not ok
+
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            worker(client, random.Random(seed * 1000 + index))
+            for index, client in enumerate(clients)
+        ))
+        return baseline.summarize(samples, time.perf_counter() - started, errors)
+    finally:
+        for client in clients:
+            await client.aclose()
+
+
+async def main_async(args) -> dict:
+    workdir = prepare_workdir()
+    os.chdir(workdir)
+    os.environ["DB_PATH"] = str(workdir / "qr_data.db")
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+    main = importlib.import_module("app.main")
+    logging.getLogger().setLevel(logging.WARNING)
+    try:
+        rng = random.Random(args.seed)
+        cache = Path(args.data_dir) / f"seed-{args.users}-{args.qr_codes}-{args.logs}-{args.seed}.db"
+        await prepare_database(main, cache, args, rng)
+
+        ip_usernames = [username(i) for i in range(0, min(args.users, 1000 * IP_USER_EVERY), IP_USER_EVERY)]
+        ctx = LoadContext(args.users, args.qr_codes, ip_usernames)
+        await main.startup()
+        try:
+            results = {}
+            for name in args.scenarios:
+                results[name] = await run_scenario(
+                    main, name, ctx, args.concurrency, args.requests, args.warmup, args.seed
+                )
+            return results
+        finally:
+            await main.shutdown()
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--qr-codes", type=int, default=1_000_000)
+    parser.add_argument("--logs", type=int, default=10_000_000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=1000, help="запросов на сценарий")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        type=lambda value: [s for s in value.split(",") if s])
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "idqr-loadtest"))
+    parser.add_argument("--save", metavar="JSON", help="сохранить результаты как базовую линию")
+    parser.add_argument("--compare", metavar="JSON", help="сравнить с базовой линией")
+    parser.add_argument("--threshold", type=float, default=0.10, help="допустимое ухудшение, доля")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"неизвестные сценарии: {', '.join(sorted(unknown))}")
+
+    results = asyncio.run(main_async(args))
+    baseline.print_results(results)
+
+    params = {key: getattr(args, key) for key in
+              ("users", "qr_codes", "logs", "seed", "concurrency", "requests")}
+    if args.save:
+        baseline.save(args.save, "loadtest", params, results)
+    if args.compare and baseline.compare(args.compare, "loadtest", params, results, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
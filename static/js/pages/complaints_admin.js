@@ -0,0 +1,81 @@
+document.addEventListener('DOMContentLoaded', function() {
+  const particlesContainer = document.getElementById('particles');
+  const particleCount = 15;
+
+  for (let i = 0; i < particleCount; i++) {
+    const particle = document.createElement('div');
+    particle.classList.add('particle');
+
+    const size = Math.random() * 40 + 10;
+    particle.style.width = `${size}px`;
+    particle.style.height = `${size}px`;
+
+    particle.style.left = `${Math.random() * 100}vw`;
+    particle.style.top = `${Math.random() * 100}vh`;
+
+    particle.style.animationDuration = `${Math.random() * 20 + 10}s`;
+    particle.style.animationDelay = `-${Math.random() * 20}s`;
+
+    particlesContainer.appendChild(particle);
+  }
+
+  // Фильтрация таблицы
+  const filterSelects = document.querySelectorAll('.filter-select');
+  const searchInput = document.querySelector('.search-input');
+  const tableRows = document.querySelectorAll('tbody tr');
+
+  function filterTable() {
+    const statusFilter = filterSelects[0].value.replace('_', '-');
+    const priorityFilter = filterSelects[1].value;
+    const categoryFilter = filterSelects[2].value;
+    const searchText = searchInput.value.toLowerCase();
+
+    tableRows.forEach(row => {
+      const status = row.querySelector('.status-badge').className.includes(statusFilter) || !statusFilter;
+      const priority = row.querySelector('.priority-badge').className.includes(priorityFilter) || !priorityFilter;
+      const category = row.cells[3].textContent.toLowerCase().includes(categoryFilter) || !categoryFilter;
+      const searchMatch = row.textContent.toLowerCase().includes(searchText);
+
+      if (status && priority && category && searchMatch) {
+        row.style.display = '';
+      } else {
+        row.style.display = 'none';
+      }
+    });
+  }
+
+  filterSelects.forEach(select => {
+    select.addEventListener('change', filterTable);
+  });
+
+  searchInput.addEventListener('input', filterTable);
+
+  // Обработка кнопок действий
+  const actionButtons = document.querySelectorAll('.action-buttons button');
+  actionButtons.forEach(button => {
+    button.addEventListener('click', function() {
+      const row = this.closest('tr');
+      const complaintId = row.cells[0].textContent;
+      const complaintTitle = row.cells[1].textContent;
+
+      if (this.classList.contains('btn-view')) {
+        alert(`Просмотр жалобы ${complaintId}: ${complaintTitle}`);
+        // В реальном приложении здесь будет переход на страницу просмотра жалобы
+        window.location.href = `/dashboard/complaints/view/${complaintId.replace('#', '')}`;
+      } else if (this.classList.contains('btn-resolve')) {
+        if (confirm(`Вы уверены, что хотите отметить жалобу ${complaintId} как решенную?`)) {
+          const body = new FormData();
+          body.append('status', 'resolved');
+          fetch(`/dashboard/complaints/${complaintId.replace('#', '')}/status`, { method: 'POST', body: body })
+            .then(response => {
+              if (!response.ok) throw new Error(response.statusText);
+              const statusBadge = row.querySelector('.status-badge');
+              statusBadge.className = 'status-badge status-resolved';
+              statusBadge.textContent = 'Решено';
+            })
+            .catch(() => alert(`Не удалось обновить жалобу ${complaintId}`));
+        }
+      }
+    });
+  });
+});
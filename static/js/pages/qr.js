@@ -0,0 +1,100 @@
+// Создание частиц для фона
+document.addEventListener('DOMContentLoaded', function() {
+    const particlesContainer = document.getElementById('particles');
+    const particleCount = 15;
+
+    for (let i = 0; i < particleCount; i++) {
+        const particle = document.createElement('div');
+        particle.classList.add('particle');
+
+        const size = Math.random() * 40 + 10;
+        particle.style.width = `${size}px`;
+        particle.style.height = `${size}px`;
+
+        particle.style.left = `${Math.random() * 100}vw`;
+        particle.style.top = `${Math.random() * 100}vh`;
+
+        particle.style.animationDuration = `${Math.random() * 20 + 10}s`;
+        particle.style.animationDelay = `-${Math.random() * 20}s`;
+
+        particlesContainer.appendChild(particle);
+    }
+
+    // Обработка переключения темы
+    const toggleSwitch = document.querySelector('#checkbox');
+    const currentTheme = localStorage.getItem('theme') || 'light';
+
+    if (currentTheme === 'dark') {
+        document.documentElement.setAttribute('data-theme', 'dark');
+        toggleSwitch.checked = true;
+    }
+
+    function switchTheme(e) {
+        let theme = 'light';
+        if (e.target.checked) {
+            theme = 'dark';
+            document.documentElement.setAttribute('data-theme', 'dark');
+        } else {
+            theme = 'light';
+            document.documentElement.setAttribute('data-theme', 'light');
+        }
+        localStorage.setItem('theme', theme);
+
+        fetch('/user/settings/theme', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/x-www-form-urlencoded',
+            },
+            body: `theme=${theme}`
+        });
+    }
+
+    toggleSwitch.addEventListener('change', switchTheme, false);
+
+    // Динамическое изменение формы в зависимости от типа QR-кода
+    const qrTypeSelect = document.getElementById('qr_type');
+    const qrDataInput = document.getElementById('qrdata');
+    const qrDataLabel = document.getElementById('qrdata_label');
+    const qrDataHelp = document.getElementById('qrdata_help');
+
+    function updateForm() {
+        if (qrTypeSelect.value === 'module') {
+            qrDataLabel.textContent = 'ID модуля:';
+            qrDataInput.placeholder = 'Введите ID модуля (1-19)';
+            qrDataInput.type = 'number';
+            qrDataInput.min = '1';
+            qrDataInput.max = '19';
+            qrDataInput.step = '1';
+            qrDataHelp.textContent = 'Для модулей: укажите ID модуля от 1 до 19 (1-Услуги, 2-Одежда, ..., 5-Медицина, ..., 19-Энергетика)';
+        } else {
+            qrDataLabel.textContent = 'Ссылка или текст:';
+            qrDataInput.placeholder = 'Введите ссылку или текст для кодирования';
+            qrDataInput.type = 'text';
+            qrDataInput.removeAttribute('min');
+            qrDataInput.removeAttribute('max');
+            qrDataInput.removeAttribute('step');
+            qrDataHelp.textContent = 'Введите URL-адрес или любой текст для кодирования в QR-код';
+        }
+    }
+
+    qrTypeSelect.addEventListener('change', updateForm);
+    updateForm();
+
+    // Живые счетчики сканирований: прирост по QR-кодам раз в окно
+    if (window.EventSource && document.querySelector('[data-qr-id]')) {
+        const source = new EventSource('/dashboard/qr/live');
+        source.addEventListener('scans', function(e) {
+            const deltas = JSON.parse(e.data);
+            for (const id in deltas) {
+                const counter = document.querySelector(`[data-qr-id="${id}"] .scan-count`);
+                if (counter) {
+                    counter.textContent = Number(counter.textContent) + deltas[id];
+                }
+            }
+        });
+        source.addEventListener('reset', function() {
+            source.close();
+            location.reload();
+        });
+    }
+});
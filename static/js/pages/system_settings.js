@@ -0,0 +1,73 @@
+// Создание частиц для фона
+document.addEventListener('DOMContentLoaded', function() {
+    const particlesContainer = document.getElementById('particles');
+    const particleCount = 15;
+
+    for (let i = 0; i < particleCount; i++) {
+        const particle = document.createElement('div');
+        particle.classList.add('particle');
+
+        const size = Math.random() * 40 + 10;
+        particle.style.width = `${size}px`;
+        particle.style.height = `${size}px`;
+
+        particle.style.left = `${Math.random() * 100}vw`;
+        particle.style.top = `${Math.random() * 100}vh`;
+
+        particle.style.animationDuration = `${Math.random() * 20 + 10}s`;
+        particle.style.animationDelay = `-${Math.random() * 20}s`;
+
+        particlesContainer.appendChild(particle);
+    }
+
+    // Обработка переключения темы
+    const toggleSwitch = document.querySelector('#checkbox');
+    const currentTheme = localStorage.getItem('theme') || 'light';
+
+    if (currentTheme === 'dark') {
+        document.documentElement.setAttribute('data-theme', 'dark');
+        toggleSwitch.checked = true;
+    }
+
+    function switchTheme(e) {
+        let theme = 'light';
+        if (e.target.checked) {
+            theme = 'dark';
+            document.documentElement.setAttribute('data-theme', 'dark');
+        } else {
+            theme = 'light';
+            document.documentElement.setAttribute('data-theme', 'light');
+        }
+        localStorage.setItem('theme', theme);
+
+        // Сохраняем тему на сервере если пользователь авторизован
+        fetch('/user/settings/theme', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/x-www-form-urlencoded',
+            },
+            body: `theme=${theme}`
+        });
+    }
+
+    toggleSwitch.addEventListener('change', switchTheme, false);
+});
+
+// Функции управления БД
+function backupDatabase() {
+    if (confirm('Создать резервную копию базы данных?')) {
+        alert('Функция бэкапа в разработке');
+    }
+}
+
+function optimizeDatabase() {
+    if (confirm('Оптимизировать базу данных для улучшения производительности?')) {
+        alert('Функция оптимизации в разработке');
+    }
+}
+
+function clearOldLogs() {
+    if (confirm('Удалить логи старше 30 дней? Это действие нельзя отменить.')) {
+        alert('Функция очистки логов в разработке');
+    }
+}
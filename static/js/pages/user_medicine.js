@@ -0,0 +1,45 @@
+document.addEventListener('DOMContentLoaded', function() {
+    const particlesContainer = document.getElementById('particles');
+    const particleCount = 20;
+
+    for (let i = 0; i < particleCount; i++) {
+        const particle = document.createElement('div');
+        particle.classList.add('particle');
+
+        const size = Math.random() * 50 + 10;
+        particle.style.width = `${size}px`;
+        particle.style.height = `${size}px`;
+
+        particle.style.left = `${Math.random() * 100}vw`;
+        particle.style.top = `${Math.random() * 100}vh`;
+
+        particle.style.animationDuration = `${Math.random() * 20 + 10}s`;
+        particle.style.animationDelay = `-${Math.random() * 20}s`;
+
+        particlesContainer.appendChild(particle);
+    }
+
+    // Применяем тему из localStorage при загрузке
+    const savedTheme = localStorage.getItem('theme');
+    if (savedTheme) {
+        document.documentElement.setAttribute('data-theme', savedTheme);
+    }
+
+    // Обработчики для экстренных кнопок
+    document.querySelectorAll('.emergency-button').forEach(button => {
+        button.addEventListener('click', function() {
+            const text = this.textContent.trim();
+            if (text.includes('скорую')) {
+                if (confirm('Вы уверены, что хотите вызвать скорую помощь?')) {
+                    alert('Скорая помощь вызвана! Ваше местоположение и медицинские данные переданы диспетчеру.');
+                }
+            } else if (text.includes('консультация')) {
+                alert('Подключение к врачу... Пожалуйста, ожидайте.');
+            } else if (text.includes('аптеку')) {
+                alert('Поиск ближайших аптек...');
+            } else if (text.includes('AI-анализ')) {
+                alert('AI анализирует ваши медицинские данные... Результаты будут готовы через несколько секунд.');
+            }
+        });
+    });
+});
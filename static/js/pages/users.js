@@ -0,0 +1,112 @@
+// Создание частиц для фона
+document.addEventListener('DOMContentLoaded', function() {
+    const particlesContainer = document.getElementById('particles');
+    const particleCount = 15;
+
+    for (let i = 0; i < particleCount; i++) {
+        const particle = document.createElement('div');
+        particle.classList.add('particle');
+
+        const size = Math.random() * 40 + 10;
+        particle.style.width = `${size}px`;
+        particle.style.height = `${size}px`;
+
+        particle.style.left = `${Math.random() * 100}vw`;
+        particle.style.top = `${Math.random() * 100}vh`;
+
+        particle.style.animationDuration = `${Math.random() * 20 + 10}s`;
+        particle.style.animationDelay = `-${Math.random() * 20}s`;
+
+        particlesContainer.appendChild(particle);
+    }
+
+    // Обработка переключения темы
+    const toggleSwitch = document.querySelector('#checkbox');
+    const currentTheme = localStorage.getItem('theme') || 'light';
+
+    if (currentTheme === 'dark') {
+        document.documentElement.setAttribute('data-theme', 'dark');
+        toggleSwitch.checked = true;
+    }
+
+    function switchTheme(e) {
+        let theme = 'light';
+        if (e.target.checked) {
+            theme = 'dark';
+            document.documentElement.setAttribute('data-theme', 'dark');
+        } else {
+            theme = 'light';
+            document.documentElement.setAttribute('data-theme', 'light');
+        }
+        localStorage.setItem('theme', theme);
+
+        // Сохраняем тему на сервере если пользователь авторизован
+        fetch('/user/settings/theme', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/x-www-form-urlencoded',
+            },
+            body: `theme=${theme}`
+        });
+    }
+
+    toggleSwitch.addEventListener('change', switchTheme, false);
+});
+
+// Функции для модального окна блокировки
+function openBlockModal(userId, username) {
+    document.getElementById('blockUserId').value = userId;
+    document.getElementById('blockForm').action = `/dashboard/users/block/${userId}`;
+    document.getElementById('blockUserName').textContent = username;
+    document.querySelector('#blockModal .modal-title').textContent = `Блокировка пользователя ${username}`;
+    document.getElementById('blockModal').style.display = 'flex';
+}
+
+function closeBlockModal() {
+    document.getElementById('blockModal').style.display = 'none';
+}
+
+// Функции для модального окна заморозки
+function openFreezeModal(userId, username) {
+    document.getElementById('freezeUserId').value = userId;
+    document.getElementById('freezeForm').action = `/dashboard/users/block/${userId}`;
+    document.getElementById('freezeUserName').textContent = username;
+    document.querySelector('#freezeModal .modal-title').textContent = `Заморозка пользователя ${username}`;
+    document.getElementById('freezeModal').style.display = 'flex';
+}
+
+function closeFreezeModal() {
+    document.getElementById('freezeModal').style.display = 'none';
+}
+
+// Функции для модального окна смены роли
+function openRoleModal(userId, username, currentRole) {
+    document.getElementById('roleUserId').value = userId;
+    document.getElementById('roleForm').action = `/dashboard/users/change_role/${userId}`;
+    document.getElementById('roleUserName').textContent = username;
+    document.getElementById('currentRole').textContent = currentRole === 'ip' ? 'Индивидуальный предприниматель (ИП)' : 'Пользователь';
+    document.getElementById('newRole').value = currentRole;
+    document.querySelector('#roleModal .modal-title').textContent = `Смена роли пользователя ${username}`;
+    document.getElementById('roleModal').style.display = 'flex';
+}
+
+function closeRoleModal() {
+    document.getElementById('roleModal').style.display = 'none';
+}
+
+// Закрытие модальных окон при клике вне их
+window.onclick = function(event) {
+    const blockModal = document.getElementById('blockModal');
+    const freezeModal = document.getElementById('freezeModal');
+    const roleModal = document.getElementById('roleModal');
+
+    if (event.target === blockModal) {
+        closeBlockModal();
+    }
+    if (event.target === freezeModal) {
+        closeFreezeModal();
+    }
+    if (event.target === roleModal) {
+        closeRoleModal();
+    }
+}
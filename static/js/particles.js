@@ -0,0 +1,26 @@
+// Частицы для фона: количество и разброс размера задаются data-count и data-size у #particles
+document.addEventListener('DOMContentLoaded', function() {
+    const particlesContainer = document.getElementById('particles');
+    if (!particlesContainer) {
+        return;
+    }
+    const particleCount = Number(particlesContainer.dataset.count || 20);
+    const sizeRange = Number(particlesContainer.dataset.size || 50);
+
+    for (let i = 0; i < particleCount; i++) {
+        const particle = document.createElement('div');
+        particle.classList.add('particle');
+
+        const size = Math.random() * sizeRange + 10;
+        particle.style.width = `${size}px`;
+        particle.style.height = `${size}px`;
+
+        particle.style.left = `${Math.random() * 100}vw`;
+        particle.style.top = `${Math.random() * 100}vh`;
+
+        particle.style.animationDuration = `${Math.random() * 20 + 10}s`;
+        particle.style.animationDelay = `-${Math.random() * 20}s`;
+
+        particlesContainer.appendChild(particle);
+    }
+});
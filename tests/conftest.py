@@ -0,0 +1,46 @@
+import os
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture(scope="session")
+def main(tmp_path_factory):
+    """app.main на пустой БД во временном каталоге со своими templates и static."""
+    workdir = tmp_path_factory.mktemp("idqr")
+    shutil.copytree(ROOT / "templates", workdir / "templates")
+    shutil.copytree(ROOT / "static", workdir / "static", ignore=shutil.ignore_patterns("qr", "logos"))
+    os.chdir(workdir)
+    os.environ["DB_PATH"] = str(workdir / "qr_data.db")
+    os.environ["RATE_LIMIT_GUEST"] = "off"
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+    import app.main as main
+    return main
+
+
+@pytest.fixture(scope="session")
+def client(main):
+    """Один клиент на сессию: фоновые задачи приложения привязаны к его циклу событий."""
+    from fastapi.testclient import TestClient
+
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture
+def login_as(client):
+    """Переключает клиента на сессию пользователя или администратора (admin_code)."""
+    def login(username=None, password="secret-password-1", admin_code=None):
+        client.cookies.clear()
+        if admin_code:
+            client.post("/login", data={"code": admin_code})
+        else:
+            client.post("/user/login", data={"username": username, "password": password})
+        return client
+
+    return login
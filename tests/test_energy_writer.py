@@ -0,0 +1,73 @@
+import asyncio
+import sqlite3
+import time
+
+import aiosqlite
+
+from app import energy
+
+NOW = int(time.time())
+
+
+async def prepare(path):
+    async with aiosqlite.connect(path) as db:
+        await db.execute("PRAGMA journal_mode=WAL")
+        await energy.init_schema(db)
+        await db.execute("CREATE TABLE system_settings (setting_key TEXT PRIMARY KEY, setting_value TEXT)")
+        await db.execute("INSERT INTO system_settings VALUES ('energy_retention_months', '12')")
+        await db.commit()
+
+
+def test_new_meter_is_claimed_once_within_one_batch(tmp_path):
+    path = str(tmp_path / "energy.db")
+
+    async def run():
+        await prepare(path)
+        writer = energy.ReadingWriter(path, flush_interval=0.05)
+        writer.start()
+        try:
+            # Обе загрузки попадают в один пакет: проверка до буфера пропустила бы обе
+            return await asyncio.gather(
+                writer.write([("shared", NOW, 1.0, "electricity")], 1),
+                writer.write([("shared", NOW + 900, 2.0, "electricity")], 2),
+            )
+        finally:
+            await writer.stop()
+
+    first, second = asyncio.run(run())
+    assert first == {"foreign": set(), "expired": 0, "rejected": 0}
+    assert second == {"foreign": {"shared"}, "expired": 0, "rejected": 1}
+    db = sqlite3.connect(path)
+    try:
+        assert db.execute("SELECT user_id FROM energy_meters").fetchall() == [(1,)]
+        assert db.execute("SELECT SUM(count), SUM(total) FROM energy_daily").fetchone() == (1, 1.0)
+    finally:
+        db.close()
+
+
+def test_expired_partitions_are_dropped_and_not_refilled(tmp_path):
+    path = str(tmp_path / "energy.db")
+    old = NOW - 400 * 86400
+
+    async def run():
+        await prepare(path)
+        async with aiosqlite.connect(path) as db:
+            await db.execute(f"CREATE TABLE {energy.partition_table(energy.partition_of(old))} "
+                             "(meter_id TEXT, ts INTEGER, value REAL)")
+            await db.commit()
+            await energy.drop_expired_partitions(db)
+        writer = energy.ReadingWriter(path, flush_interval=0.05)
+        writer.start()
+        try:
+            return await writer.write([("m1", old, 1.0, "electricity"), ("m1", NOW, 1.0, "electricity")], 1)
+        finally:
+            await writer.stop()
+
+    assert asyncio.run(run()) == {"foreign": set(), "expired": 1, "rejected": 1}
+    db = sqlite3.connect(path)
+    try:
+        tables = [name for name, in db.execute(
+            "SELECT name FROM sqlite_master WHERE name GLOB 'energy_readings_*' ORDER BY name")]
+        assert tables == [energy.partition_table(energy.partition_of(NOW))]
+    finally:
+        db.close()
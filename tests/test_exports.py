@@ -0,0 +1,21 @@
+import asyncio
+
+from app import exports
+
+
+def test_slot_is_released_when_stream_is_abandoned(main, client, login_as):
+    login_as(admin_code=main.ADMIN_CODE)
+    with client.stream("GET", "/dashboard/export/users") as response:
+        assert response.status_code == 200
+    assert exports.slots_in_use() == 0
+
+    async def abandon():
+        stream = exports.stream_export(main.DB_PATH, "users")
+        await stream.__anext__()
+        assert exports.slots_in_use() == 1
+        await stream.aclose()
+
+    asyncio.run(abandon())
+    # Ни разу не запущенный генератор слот не занимает
+    exports.stream_export(main.DB_PATH, "users")
+    assert exports.slots_in_use() == 0
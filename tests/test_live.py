@@ -0,0 +1,34 @@
+import asyncio
+
+from app import live
+
+
+def test_stream_subscribes_only_while_running():
+    async def run():
+        hub = live.ScanHub(window=0)
+        # Генератор, ни разу не запущенный (клиент ушел до первой итерации), подписку не держит
+        hub.stream(7)
+        assert hub.subscribers == 0
+
+        stream = hub.stream(7)
+        assert (await stream.__anext__()).startswith("retry:")
+        assert hub.subscribers == 1
+        hub.publish(7, 42)
+        assert await stream.__anext__() == 'event: scans\ndata: {"42":1}\n\n'
+        await stream.aclose()
+        assert hub.subscribers == 0
+
+    asyncio.run(run())
+
+
+def test_stream_ends_when_hub_is_full():
+    async def run():
+        hub = live.ScanHub(max_subscribers=1)
+        first = hub.stream(1)
+        await first.__anext__()
+        assert not hub.accepting
+        assert [chunk async for chunk in hub.stream(2)] == [f"retry: {live.RETRY_MS}\n\n"]
+        await first.aclose()
+        assert hub.subscribers == 0
+
+    asyncio.run(run())
@@ -0,0 +1,51 @@
+import sqlite3
+
+PASSWORD = "secret-password-1"
+
+
+def register(client, username, medical=False):
+    client.cookies.clear()
+    data = {"username": username, "password": PASSWORD}
+    if medical:
+        data["is_medical_worker"] = "on"
+    client.post("/register", data=data)
+
+
+def user_id(main, username):
+    db = sqlite3.connect(main.DB_PATH)
+    try:
+        return db.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()[0]
+    finally:
+        db.close()
+
+
+def test_self_declared_medical_worker_cannot_access_other_patient(main, client, login_as):
+    register(client, "patient1")
+    register(client, "doctor1", medical=True)
+    patient_id, doctor_id = user_id(main, "patient1"), user_id(main, "doctor1")
+
+    response = login_as("patient1").post(
+        "/api/medical/readings", json={"data_type": "pulse", "readings": [[1700000000, 72]]})
+    assert response.status_code == 200
+
+    doctor = login_as("doctor1")
+    assert doctor.get(f"/api/medical/readings/pulse/latest?user_id={patient_id}").status_code == 403
+    response = doctor.post(f"/api/medical/readings?user_id={patient_id}",
+                           json={"data_type": "pulse", "readings": [[1700000000, 1]]})
+    assert response.status_code == 403
+
+    # Доступ появляется только после выдачи администратором
+    response = login_as(admin_code=main.ADMIN_CODE).post(
+        "/dashboard/api/medical/grants", json={"patient_id": patient_id, "clinician_id": doctor_id})
+    assert response.status_code == 200
+    response = login_as("doctor1").get(f"/api/medical/readings/pulse/latest?user_id={patient_id}")
+    assert response.status_code == 200
+    assert response.json()["value"] == 72
+
+
+def test_import_body_is_capped(main, client, login_as):
+    register(client, "patient2")
+    oversized = b" " * (main.medical.MAX_IMPORT_BYTES + 1)
+    response = login_as("patient2").post("/api/medical/readings", content=oversized,
+                                         headers={"content-type": "application/json"})
+    assert response.status_code == 413
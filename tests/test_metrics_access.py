@@ -0,0 +1,4 @@
+def test_metrics_require_token_or_admin(main, client, login_as):
+    client.cookies.clear()
+    assert client.get("/metrics").status_code == 401
+    assert login_as(admin_code=main.ADMIN_CODE).get("/metrics").status_code == 200
@@ -0,0 +1,31 @@
+import os
+import sqlite3
+
+
+def rows(main):
+    db = sqlite3.connect(main.DB_PATH)
+    try:
+        return db.execute("SELECT title, filename FROM qr_codes ORDER BY id").fetchall()
+    finally:
+        db.close()
+
+
+def test_identical_qr_codes_share_a_file_rendered_after_commit(main, client, login_as):
+    login_as(admin_code=main.ADMIN_CODE)
+    form = {"qrdata": "https://example.com/shared", "title": "Общий"}
+    assert client.post("/generate_qr", data=form, follow_redirects=False).status_code == 303
+    assert client.post("/generate_qr", data=form, follow_redirects=False).status_code == 303
+    (_, first), (_, second) = [row for row in rows(main) if row[0] == "Общий"]
+    assert first == second
+    assert os.path.exists(os.path.join(main.QR_FOLDER, *first.split("/")))
+
+
+def test_failed_render_does_not_leave_a_row(main, client, login_as, monkeypatch):
+    def broken(*args, **kwargs):
+        raise OSError("disk full")
+
+    login_as(admin_code=main.ADMIN_CODE)
+    monkeypatch.setattr(main, "render_qr_image", broken)
+    client.post("/generate_qr", data={"qrdata": "https://example.com/broken", "title": "Сбой"},
+                follow_redirects=False)
+    assert [row for row in rows(main) if row[0] == "Сбой"] == []
@@ -0,0 +1,35 @@
+import asyncio
+import os
+import time
+
+import aiosqlite
+
+from app import qrfiles
+
+
+def test_reconcile_keeps_orphan_reused_after_listing(tmp_path, monkeypatch):
+    folder = tmp_path / "qr"
+    (folder / "ab").mkdir(parents=True)
+    path = folder / "ab" / "abcd.png"
+    path.write_bytes(b"png")
+    old = time.time() - 7200
+    os.utime(path, (old, old))
+    db_path = str(tmp_path / "qr.db")
+    listed = qrfiles._list_dir
+
+    def list_then_reuse(directory):
+        entries = listed(directory)
+        if entries:
+            # generate_qr ссылается на файл после того, как сверка его перечислила
+            asyncio.run(qrfiles.ensure(str(folder), "ab/abcd.png", lambda: None, "create"))
+        return entries
+
+    async def run():
+        async with aiosqlite.connect(db_path) as db:
+            await db.execute("CREATE TABLE qr_codes (id INTEGER PRIMARY KEY, filename TEXT)")
+            await db.commit()
+            monkeypatch.setattr(qrfiles, "_list_dir", list_then_reuse)
+            await qrfiles.reconcile(db, str(folder))
+
+    asyncio.run(run())
+    assert path.exists()
@@ -0,0 +1,85 @@
+import asyncio
+import sqlite3
+import time
+
+from app import scan, webhooks
+
+
+def test_failed_flush_rolls_back_and_keeps_counts(tmp_path, monkeypatch):
+    path = str(tmp_path / "scan.db")
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE qr_codes (id INTEGER PRIMARY KEY, scan_count INTEGER DEFAULT 0, last_scan TEXT)")
+    db.execute("INSERT INTO qr_codes (id) VALUES (1), (2)")
+    db.commit()
+    db.close()
+
+    async def failing(db, rows):
+        raise RuntimeError("webhook outbox unavailable")
+
+    async def ignore(db, rows):
+        pass
+
+    async def run():
+        cache = scan.ScanCache(path, templates_env=None)
+        cache.record_scan(1)
+        cache.record_scan(1)
+        monkeypatch.setattr(webhooks, "enqueue_scans", failing)
+        try:
+            await cache.flush()
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("flush должен пробросить ошибку")
+        cache.record_scan(1)
+        cache.record_scan(2)
+        monkeypatch.setattr(webhooks, "enqueue_scans", ignore)
+        await cache.flush()
+        await cache.stop()
+
+    asyncio.run(run())
+    db = sqlite3.connect(path)
+    try:
+        assert db.execute("SELECT id, scan_count FROM qr_codes ORDER BY id").fetchall() == [(1, 3), (2, 1)]
+    finally:
+        db.close()
+
+
+def test_lookup_does_not_wait_for_flush_blocked_on_write_lock(tmp_path, monkeypatch):
+    path = str(tmp_path / "scan.db")
+    db = sqlite3.connect(path)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("CREATE TABLE qr_codes (id INTEGER PRIMARY KEY, data TEXT, qr_type TEXT, user_id INTEGER,"
+               " scan_count INTEGER DEFAULT 0, last_scan TEXT, short_code TEXT)")
+    db.execute("INSERT INTO qr_codes (id, data, qr_type) VALUES (1, 'https://a.example', 'url'),"
+               " (2, 'https://b.example', 'url')")
+    db.commit()
+    db.close()
+
+    async def ignore(db, rows):
+        pass
+
+    async def run():
+        monkeypatch.setattr(webhooks, "enqueue_scans", ignore)
+        cache = scan.ScanCache(path, templates_env=None)
+        # Два холодных промаха одновременно открывают одно соединение чтения
+        await asyncio.gather(cache.resolve(1), cache.resolve_code("NOPE"))
+        reader = cache._reader
+        holder = sqlite3.connect(path, timeout=0, isolation_level=None)
+        holder.execute("BEGIN IMMEDIATE")
+        try:
+            cache.record_scan(1)
+            flush = asyncio.create_task(cache.flush())
+            await asyncio.sleep(0.1)
+            started = time.perf_counter()
+            await asyncio.wait_for(cache.resolve(2), 2)
+            elapsed = time.perf_counter() - started
+        finally:
+            holder.execute("COMMIT")
+            holder.close()
+        await flush
+        await cache.stop()
+        return elapsed, reader
+
+    elapsed, reader = asyncio.run(run())
+    assert elapsed < 0.5
+    assert reader is not None
@@ -0,0 +1,43 @@
+import asyncio
+import sqlite3
+
+import aiosqlite
+
+from app import scheduler
+
+
+def test_long_leader_job_does_not_stall_lease_or_worker_jobs(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    flushes = []
+
+    async def slow(db):
+        await asyncio.sleep(1.0)
+
+    async def flush(db):
+        flushes.append(asyncio.get_running_loop().time())
+
+    async def run():
+        async with aiosqlite.connect(path) as db:
+            for statement in scheduler.SCHEMA[:3]:
+                await db.execute(statement)
+            await db.commit()
+        jobs = scheduler.Scheduler(path, tick=0.05, lease_ttl=0.3)
+        jobs.add("slow", 60, slow)
+        jobs.add("flush", 0.05, flush, leader_only=False)
+        jobs.start()
+        try:
+            await asyncio.sleep(0.6)
+            leads_during_job = jobs.leads()
+            flushes_during_job = len(flushes)
+        finally:
+            await jobs.stop()
+        return leads_during_job, flushes_during_job
+
+    leads, flushed = asyncio.run(run())
+    assert leads
+    assert flushed >= 5
+    db = sqlite3.connect(path)
+    try:
+        assert db.execute("SELECT COUNT(*) FROM scheduler_leases").fetchone() == (0,)
+    finally:
+        db.close()
@@ -0,0 +1,37 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app import webhooks
+
+
+def test_destination_resolving_to_loopback_is_rejected():
+    with pytest.raises(ValueError):
+        asyncio.run(webhooks.resolve_public("localhost", 80))
+    with pytest.raises(ValueError):
+        asyncio.run(webhooks.check_destination("http://127.0.0.1:8080/hook"))
+    assert asyncio.run(webhooks.check_destination("http://127.0.0.1:8080/hook", allow_private=True))
+
+
+def test_delivery_transport_refuses_private_peer(monkeypatch):
+    async def post(receiver_url):
+        transport = webhooks.public_only_transport(httpx.Limits())
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await client.post(receiver_url, content=b"{}")
+
+    async def run():
+        receiver = webhooks.Receiver()
+        url = await receiver.start()
+        try:
+            with pytest.raises(httpx.ConnectError):
+                await post(url)
+            assert receiver.received == []
+            # Тот же транспорт доставляет, если адрес считается публичным
+            monkeypatch.setattr(webhooks, "is_public_address", lambda address: True)
+            assert (await post(url)).status_code == 200
+            assert len(receiver.received) == 1
+        finally:
+            await receiver.stop()
+
+    asyncio.run(run())